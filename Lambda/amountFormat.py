@@ -0,0 +1,30 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Money is stored as whole cents in integer attributes: 'amountCents' on transactions, 'totalCents' on rollups
+# and 'balanceCents' on the ledger. Records written before the integer format carry a Decimal 'amount', 'total'
+# or 'balance' instead, which migrateAmounts folds into the integer attribute
+AMOUNT_ATTRIBUTE = 'amountCents'
+LEGACY_AMOUNT_ATTRIBUTE = 'amount'
+
+# Projection that reads a transaction amount in either format
+AMOUNT_ATTRIBUTES = [AMOUNT_ATTRIBUTE, LEGACY_AMOUNT_ATTRIBUTE]
+
+def to_cents(amount):
+    # Whole cents of a client or legacy amount (int, float, str or Decimal), rounding half cents up
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def stored_cents(item, attribute=AMOUNT_ATTRIBUTE, legacy_attribute=LEGACY_AMOUNT_ATTRIBUTE):
+    # Cents held by a record, counting a legacy Decimal value that has not been migrated yet
+    cents = int(item.get(attribute, 0))
+    legacy = item.get(legacy_attribute)
+    return cents if legacy is None else cents + to_cents(legacy)
+
+def cents_to_amount(cents):
+    # Response value of an amount; cents / 100 is the float closest to the exact decimal amount
+    return cents / 100
+
+def present_transaction(item):
+    # A transaction row as the API returns it, with its amount in currency units
+    row = {key: value for key, value in item.items() if key not in AMOUNT_ATTRIBUTES}
+    row['amount'] = cents_to_amount(stored_cents(item))
+    return row
@@ -0,0 +1,43 @@
+import base64
+import gzip
+import json
+import os
+from decimal import Decimal
+
+# Bodies at least this large are gzip-compressed for clients that accept it; smaller ones cost more to
+# compress than they save on the wire
+GZIP_THRESHOLD_BYTES = int(os.environ.get('RESPONSE_GZIP_THRESHOLD', '4096'))
+
+def encode_value(value):
+    # Only called for values json cannot encode natively, so ints, floats and strings never reach it
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+# One encoder for every handler: it writes the body in a single pass over the nested structure without copying it
+_encoder = json.JSONEncoder(default=encode_value)
+
+def encode_body(value):
+    return _encoder.encode(value)
+
+def accepts_gzip(event):
+    headers = event.get('headers') or {}
+    return any(name.lower() == 'accept-encoding' and 'gzip' in (value or '').lower()
+               for name, value in headers.items())
+
+def compress_response(event, response):
+    # Gzip a large encoded body when the client accepts it; API Gateway passes base64 bodies through as binary
+    body = response.get('body')
+    if not isinstance(body, str) or not accepts_gzip(event):
+        return response
+    payload = body.encode('utf-8')
+    if len(payload) < GZIP_THRESHOLD_BYTES:
+        return response
+    return {
+        **response,
+        'headers': {**response.get('headers', {}), 'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'},
+        'isBase64Encoded': True,
+        'body': base64.b64encode(gzip.compress(payload, compresslevel=5, mtime=0)).decode('ascii')
+    }
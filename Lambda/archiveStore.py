@@ -0,0 +1,182 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from amountFormat import AMOUNT_ATTRIBUTE
+from apiResponse import encode_body
+from itemCodec import query_pages
+from transactionStore import write_batch
+from awsClients import get_client, get_table
+
+# Transactions dated more than this many days ago, except open splits, are moved out of Transactions by
+# archiveTransactions. Readers skip the archive for windows starting after the same cutoff, so the age can be
+# lowered at any time, but raising it hides rows archived under the old age from those windows
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '400'))
+
+# Where partitions are kept: 's3://bucket/prefix' (see aws_s3_bucket.archive in main.tf) or a local directory
+ARCHIVE_LOCATION = os.environ.get('ARCHIVE_LOCATION', os.path.join(tempfile.gettempdir(), 'campuspay-archive'))
+
+# Per-user daily totals of the archived rows, keyed 'date#category' (see aws_dynamodb_table.ArchivedTotals in main.tf).
+# They are what the analytics read back, so no request ever opens a partition
+ARCHIVE_TOTALS_TABLE_NAME = 'ArchivedTotals'
+
+# One gzip'd JSON object per (user, month) holding the rows column by column
+PARTITION_FORMAT = 'columnar1'
+S3_DELETE_LIMIT = 1000  # DeleteObjects limit
+
+def archive_cutoff(today=None):
+    # Rows dated before this ISO date are old enough to archive
+    return ((today or date.today()) - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+
+def split_location(location=ARCHIVE_LOCATION):
+    # (bucket, key prefix) of an s3:// location, or (None, directory) of a local one
+    if location.startswith('s3://'):
+        bucket, _, prefix = location[len('s3://'):].partition('/')
+        return bucket, prefix.strip('/')
+    return None, location
+
+def object_key(prefix, key):
+    return f'{prefix}/{key}' if prefix else key
+
+def put_object(key, data):
+    bucket, prefix = split_location()
+    if bucket:
+        get_client('s3').put_object(Bucket=bucket, Key=object_key(prefix, key), Body=data)
+        return
+    # Write and rename, so a reader never sees half a partition
+    path = os.path.join(prefix, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def get_object(key):
+    # Object contents, or None when there is no such object
+    bucket, prefix = split_location()
+    if bucket:
+        try:
+            return get_client('s3').get_object(Bucket=bucket, Key=object_key(prefix, key))['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+    path = os.path.join(prefix, key)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+def delete_objects(key_prefix):
+    # Delete every object under a key prefix, returning how many there were
+    bucket, prefix = split_location()
+    if not bucket:
+        path = os.path.join(prefix, key_prefix)
+        if not os.path.isdir(path):
+            return 0
+        count = sum(len(files) for _, _, files in os.walk(path))
+        shutil.rmtree(path)
+        return count
+
+    s3 = get_client('s3')
+    count = 0
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=object_key(prefix, key_prefix)):
+        keys = [{'Key': entry['Key']} for entry in page.get('Contents', [])]
+        for start in range(0, len(keys), S3_DELETE_LIMIT):
+            s3.delete_objects(Bucket=bucket, Delete={'Objects': keys[start:start + S3_DELETE_LIMIT], 'Quiet': True})
+        count += len(keys)
+    return count
+
+def user_prefix(user_id):
+    return f'transactions/user={user_id}/'
+
+def partition_key(user_id, month):
+    return f'{user_prefix(user_id)}month={month}.json.gz'
+
+def encode_partition(rows):
+    # Rows in date order, stored as one list per attribute; absent attributes are null
+    rows = sorted(rows, key=lambda row: (row.get('date', ''), row['id']))
+    columns = sorted({name for row in rows for name in row})
+    body = encode_body({
+        'format': PARTITION_FORMAT,
+        'rowCount': len(rows),
+        'columns': {name: [row.get(name) for row in rows] for name in columns}
+    })
+    return gzip.compress(body.encode('utf-8'), mtime=0)
+
+def decode_partition(data):
+    partition = json.loads(gzip.decompress(data))
+    columns = partition['columns']
+    return [{name: values[index] for name, values in columns.items() if values[index] is not None}
+            for index in range(partition['rowCount'])]
+
+def read_partition(user_id, month):
+    data = get_object(partition_key(user_id, month))
+    return decode_partition(data) if data else []
+
+def write_partition(user_id, month, rows):
+    put_object(partition_key(user_id, month), encode_partition(rows))
+
+def day_totals(user_id, rows):
+    # ArchivedTotals items for a set of archived rows: whole cents and row count per (date, category)
+    totals = {}
+    for row in rows:
+        entry = totals.setdefault((row['date'], row['category']), [0, 0])
+        entry[0] += row[AMOUNT_ATTRIBUTE]
+        entry[1] += 1
+    return {f'{day}#{category}': {
+        'userID': user_id,
+        'dayKey': f'{day}#{category}',
+        'date': day,
+        'category': category,
+        AMOUNT_ATTRIBUTE: cents,
+        'txnCount': count
+    } for (day, category), (cents, count) in totals.items()}
+
+def write_day_totals(user_id, rows, previous_rows=()):
+    # Overwrite the daily totals of a partition's rows, deleting any left over from its previous contents, so
+    # rewriting a partition and its totals can be repeated safely
+    totals = day_totals(user_id, rows)
+    requests = [{'PutRequest': {'Item': item}} for item in totals.values()]
+    requests.extend({'DeleteRequest': {'Key': {'userID': user_id, 'dayKey': day_key}}}
+                    for day_key in day_totals(user_id, previous_rows) if day_key not in totals)
+    table = get_table(ARCHIVE_TOTALS_TABLE_NAME)
+    unprocessed = []
+    for start in range(0, len(requests), 25):
+        unprocessed.extend(write_batch(table, requests[start:start + 25]))
+    return unprocessed
+
+def read_archived_totals(user_id, start_date=None, end_date=None):
+    # Archived daily totals of a user inside a date window, shaped like transaction rows (date, category,
+    # amountCents) so the windowed analytics merge them with live rows. A window starting after the archive
+    # cutoff cannot hold archived rows and costs no read
+    if start_date and start_date >= archive_cutoff():
+        return
+    condition = Key('userID').eq(user_id)
+    if start_date and end_date:
+        condition = condition & Key('dayKey').between(f'{start_date}#', f'{end_date}#\uffff')
+    elif start_date:
+        condition = condition & Key('dayKey').gte(f'{start_date}#')
+    elif end_date:
+        condition = condition & Key('dayKey').lte(f'{end_date}#\uffff')
+    for items, _ in query_pages(ARCHIVE_TOTALS_TABLE_NAME, condition, ['date', 'category', AMOUNT_ATTRIBUTE, 'txnCount']):
+        for item in items:
+            yield item
+
+def delete_user_archive(user_id):
+    # Remove a user's archived totals and partitions, returning how many totals could not be deleted. The
+    # partitions are kept while any totals are left, so retrying the deletion finds the user's archive again
+    table = get_table(ARCHIVE_TOTALS_TABLE_NAME)
+    requests = [{'DeleteRequest': {'Key': {'userID': user_id, 'dayKey': item['dayKey']}}}
+                for items, _ in query_pages(ARCHIVE_TOTALS_TABLE_NAME, Key('userID').eq(user_id), ['dayKey'])
+                for item in items]
+    unprocessed = []
+    for start in range(0, len(requests), 25):
+        unprocessed.extend(write_batch(table, requests[start:start + 25]))
+    if unprocessed:
+        return len(unprocessed)
+    delete_objects(user_prefix(user_id))
+    return 0
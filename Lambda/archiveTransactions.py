@@ -0,0 +1,174 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+from amountFormat import AMOUNT_ATTRIBUTE, LEGACY_AMOUNT_ATTRIBUTE
+from transactionStore import TRANSACTIONS_TABLE_NAME
+from itemCodec import scan_pages
+from ledgerStore import is_open_split
+from archiveStore import archive_cutoff, read_partition, write_partition, write_day_totals
+from awsClients import get_client, get_table
+from apiResponse import encode_body
+from responseCache import bump_data_version
+from instrumentation import instrumented
+
+TRANSACTION_LIMIT = 100  # TransactWriteItems limit
+MAX_WORKERS = 8
+SCAN_PAGE_SIZE = 1000
+# Rows gathered from the scan before they are archived, bounding memory; a month of a user spread over several
+# batches has its partition rewritten once per batch
+ARCHIVE_BATCH_ROWS = 20000
+
+# Hand off to a fresh invocation when less than this much time is left
+CONTINUATION_THRESHOLD_MS = 120000
+
+def is_archivable(item, cutoff):
+    # Rows dated before the cutoff: plain transactions, settled splits and creators' own shares. Open splits are
+    # still owed and stay hot, and so do rows whose amount is not in whole cents yet (run migrateAmounts first)
+    return (not is_open_split(item) and bool(item.get('date')) and item['date'] < cutoff
+            and AMOUNT_ATTRIBUTE in item and LEGACY_AMOUNT_ATTRIBUTE not in item)
+
+def archivable_pages(cutoff, start_key=None):
+    # (full rows of the archivable transactions, raw LastEvaluatedKey) per page of the Transactions scan; the
+    # filter leaves newer rows out of the response
+    for items, last_key in scan_pages(TRANSACTIONS_TABLE_NAME, None, filter_condition=Attr('date').lt(cutoff),
+                                      page_size=SCAN_PAGE_SIZE, start_key=start_key):
+        yield [item for item in items if is_archivable(item, cutoff)], last_key
+
+def archived_delete(item):
+    # TransactWriteItems action removing a hot row, only while it is still the row that was archived; a row
+    # recategorized or marked paid in the meantime cancels and stays hot until the next run
+    values = {':category': item['category'], ':amount': item[AMOUNT_ATTRIBUTE]}
+    if 'is_paid' in item:
+        paid_condition = 'is_paid = :paid'
+        values[':paid'] = item['is_paid']
+    else:
+        paid_condition = 'attribute_not_exists(is_paid)'
+    return {
+        'Delete': {
+            'TableName': TRANSACTIONS_TABLE_NAME,
+            'Key': {'id': item['id']},
+            'ConditionExpression': f'{paid_condition} AND category = :category AND #amount = :amount',
+            'ExpressionAttributeNames': {'#amount': AMOUNT_ATTRIBUTE},
+            'ExpressionAttributeValues': values
+        }
+    }
+
+def delete_hot_rows(rows):
+    # Delete archived rows from Transactions 100 per transaction, returning the IDs of rows that changed
+    # since they were scanned and were kept
+    client = get_table(TRANSACTIONS_TABLE_NAME).meta.client
+    changed = set()
+    for start in range(0, len(rows), TRANSACTION_LIMIT):
+        chunk = rows[start:start + TRANSACTION_LIMIT]
+        while chunk:
+            try:
+                client.transact_write_items(TransactItems=[archived_delete(row) for row in chunk])
+                break
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'TransactionCanceledException':
+                    raise
+                reasons = e.response.get('CancellationReasons', [])
+                failed = {index for index, reason in enumerate(reasons) if reason.get('Code') == 'ConditionalCheckFailed'}
+                if not failed:
+                    raise
+                # Drop the rows that changed and retry the rest of the chunk
+                changed.update(row['id'] for index, row in enumerate(chunk) if index in failed)
+                chunk = [row for index, row in enumerate(chunk) if index not in failed]
+    return changed
+
+def archive_month(user_id, month, rows, dry_run):
+    # Move one user's rows of one month into its partition, returning (rows archived, rows kept hot).
+    # The partition and its totals are written before the hot rows are deleted, so a run that stops midway
+    # loses nothing; the rows it leaves in both places are merged by ID and deleted by the next run
+    if dry_run:
+        return len(rows), 0
+
+    previous = read_partition(user_id, month)
+    merged = {row['id']: row for row in previous}
+    merged.update((row['id'], row) for row in rows)
+    write_partition(user_id, month, list(merged.values()))
+    if write_day_totals(user_id, list(merged.values()), previous):
+        # Some totals are still unwritten after the retries, so the rows stay hot; the next run merges them into
+        # the partition again and rewrites every total
+        return 0, len(rows)
+
+    changed = delete_hot_rows(rows)
+    if changed:
+        # Rows that changed stay hot with their new values, so take them back out of the archive
+        archived = list(merged.values())
+        kept = [row for row in archived if row['id'] not in changed]
+        write_partition(user_id, month, kept)
+        write_day_totals(user_id, kept, archived)
+    return len(rows) - len(changed), len(changed)
+
+def archive_batch(executor, rows, dry_run, result, touched_users):
+    # Archive a batch of scanned rows by user and month, adding to the result counters
+    groups = {}
+    for item in rows:
+        groups.setdefault((item['userID'], item['date'][:7]), []).append(item)
+    result['partitions'] += len(groups)
+    outcomes = executor.map(lambda group: archive_month(*group[0], group[1], dry_run), groups.items())
+    for archived, kept in outcomes:
+        result['archived'] += archived
+        result['keptHot'] += kept
+    touched_users.update(user_id for user_id, _ in groups)
+
+def archive_transactions(dry_run=False, context=None, continuation=None):
+    # Move transactions older than ARCHIVE_AFTER_DAYS, all but open splits, out of the hot table into monthly per-user
+    # partitions, keeping daily totals that paymentPlan and transactionsCategorization read back. Rollups hold
+    # lifetime totals and are left as they are. The scan is archived in batches of up to ARCHIVE_BATCH_ROWS rows;
+    # returns (result, checkpoint), the checkpoint being set when time runs low
+    continuation = continuation or {}
+    cutoff = continuation.get('cutoff') or archive_cutoff()
+    result = {'dryRun': dry_run, 'cutoff': cutoff}
+    for counter in ('partitions', 'archived', 'keptHot'):
+        result[counter] = continuation.get(counter, 0)
+
+    touched_users = set()
+    checkpoint = None
+    pending = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for rows, last_key in archivable_pages(cutoff, continuation.get('exclusiveStartKey')):
+            pending.extend(rows)
+            time_low = bool(last_key and context and context.get_remaining_time_in_millis() < CONTINUATION_THRESHOLD_MS)
+            if len(pending) >= ARCHIVE_BATCH_ROWS or time_low:
+                archive_batch(executor, pending, dry_run, result, touched_users)
+                pending = []
+            if time_low:
+                # Every row up to last_key is archived, so it is a safe checkpoint to resume from
+                checkpoint = last_key
+                break
+        archive_batch(executor, pending, dry_run, result, touched_users)
+
+    if not dry_run:
+        # Cached analytics of these users were computed with the rows still hot
+        for user_id in touched_users:
+            bump_data_version(user_id)
+    return result, checkpoint
+
+def continue_asynchronously(context, continuation):
+    # Re-invoke this function in the background with the checkpoint and the running totals
+    get_client('lambda').invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'continuation': continuation})
+    )
+
+@instrumented
+def lambda_handler(event, context):
+    # A background continuation carries the scan position, the cutoff and the counts so far
+    continuation = event.get('continuation')
+    dry_run = continuation['dryRun'] if continuation else bool(event.get('dryRun', False))
+    result, checkpoint = archive_transactions(dry_run, context, continuation)
+    if checkpoint:
+        continue_asynchronously(context, {**result, 'exclusiveStartKey': checkpoint})
+    return {
+        'statusCode': 202 if checkpoint else 200,
+        'body': encode_body({**result, 'completed': not checkpoint})
+    }
+
+# Run the archival from the command line: python archiveTransactions.py [--dry-run]
+if __name__ == '__main__':
+    print(json.dumps(archive_transactions(dry_run='--dry-run' in sys.argv)[0], indent=2))
@@ -0,0 +1,60 @@
+import os
+import boto3
+from botocore.config import Config
+from instrumentation import register_aws_hooks
+
+# Clients are created on first use and then reused by every warm invocation of the container
+_session = None
+_clients = {}
+_low_level_clients = {}
+_resources = {}
+_tables = {}
+
+def get_config():
+    return Config(
+        # Enough pooled connections for the worker pools used by the batch handlers
+        max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50')),
+        # Keep idle connections open between warm invocations
+        tcp_keepalive=True,
+        connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', '10')),
+        retries={
+            'mode': os.environ.get('AWS_RETRY_MODE', 'standard'),
+            'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+        }
+    )
+
+def get_session():
+    # One session per container so service models are loaded only once
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+        # Clients copy the session's event hooks when created, so register them before any client exists
+        register_aws_hooks(_session.events)
+    return _session
+
+def get_resource(service_name):
+    if service_name not in _resources:
+        _resources[service_name] = get_session().resource(service_name, config=get_config())
+    return _resources[service_name]
+
+def get_client(service_name):
+    if service_name not in _clients:
+        # DynamoDB shares the resource's client so there is a single connection pool, and so
+        # transactional calls accept plain Python values like the rest of the code
+        if service_name == 'dynamodb':
+            _clients[service_name] = get_resource('dynamodb').meta.client
+        else:
+            _clients[service_name] = get_session().client(service_name, config=get_config())
+    return _clients[service_name]
+
+def get_low_level_client(service_name):
+    # A client without the resource's Decimal (de)serialization, for read paths that decode items themselves
+    if service_name not in _low_level_clients:
+        _low_level_clients[service_name] = get_session().client(service_name, config=get_config())
+    return _low_level_clients[service_name]
+
+def get_table(table_name):
+    if table_name not in _tables:
+        _tables[table_name] = get_resource('dynamodb').Table(table_name)
+    return _tables[table_name]
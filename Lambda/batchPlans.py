@@ -0,0 +1,264 @@
+import json
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from amountFormat import AMOUNT_ATTRIBUTES, stored_cents
+from itemCodec import scan_pages
+from transactionStore import TRANSACTIONS_TABLE_NAME, write_batch
+from archiveStore import ARCHIVE_TOTALS_TABLE_NAME
+from awsClients import get_table
+from paymentPlan import (
+    WELCOME_MESSAGE, PLAN_TEXT, SAVING_SUGGESTION, DEBT_REDUCTION_SUGGESTION, DEBT_REDUCTION_CLOSING,
+    ESSENTIAL_SUGGESTION, NON_ESSENTIAL_SUGGESTION, INVESTMENT_SUGGESTION, DEBT_REDUCTION_CATEGORIES,
+    ESSENTIAL_CATEGORIES, NON_ESSENTIAL_CATEGORIES, NON_DISCRETIONARY_CATEGORIES, format_plan_response,
+    trend_suggestions
+)
+from spendingTrends import TREND_MONTHS, compute_trends, month_index, trend_window
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+# Precomputed plans, one item per (userID, planType) (see aws_dynamodb_table.PaymentPlans in main.tf)
+PLANS_TABLE_NAME = 'PaymentPlans'
+PLAN_TYPES = ['saving', 'debt_reduction', 'budgeting', 'investment']
+WRITE_WORKERS = 8
+
+def load_segment(table, segment, total_segments):
+    # Scan one segment through the low-level client, encoding rows straight into compact arrays with
+    # segment-local string codes; stored integer cents go in without any Decimal conversion
+    user_codes, category_codes = {}, {}
+    users, categories, months, cents = array('q'), array('q'), array('q'), array('q')
+    for items, _ in scan_pages(table.name, ['userID', 'category', 'date'] + AMOUNT_ATTRIBUTES, segment, total_segments):
+        for item in items:
+            users.append(user_codes.setdefault(item['userID'], len(user_codes)))
+            categories.append(category_codes.setdefault(item['category'], len(category_codes)))
+            months.append(month_index(item['date']) if item.get('date') else -1)
+            cents.append(stored_cents(item))
+    return list(user_codes), list(category_codes), users, categories, months, cents
+
+def load_transactions(tables, total_segments=8):
+    # Load every row of the given tables as columnar arrays: user index, category code, month index and amount
+    # in integer cents. Archived daily totals load just like transactions, since plans only sum by user,
+    # category and month
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        segments = list(executor.map(lambda job: load_segment(job[0], job[1], total_segments),
+                                     [(table, segment) for table in tables for segment in range(total_segments)]))
+
+    user_names = sorted({name for segment in segments for name in segment[0]})
+    # Category codes follow sort-key order, which is the order the rollup-backed handler lists categories in
+    category_names = sorted({name for segment in segments for name in segment[1]})
+    user_index = {name: index for index, name in enumerate(user_names)}
+    category_index = {name: index for index, name in enumerate(category_names)}
+
+    # Remap each segment's local codes to the global ones with a lookup array
+    user_columns, category_columns, month_columns, cent_columns = [], [], [], []
+    for local_users, local_categories, users, categories, months, cents in segments:
+        user_map = np.array([user_index[name] for name in local_users], dtype=np.int64)
+        category_map = np.array([category_index[name] for name in local_categories], dtype=np.int64)
+        user_columns.append(user_map[np.frombuffer(users, dtype=np.int64)] if len(users) else np.empty(0, np.int64))
+        category_columns.append(category_map[np.frombuffer(categories, dtype=np.int64)] if len(categories) else np.empty(0, np.int64))
+        month_columns.append(np.frombuffer(months, dtype=np.int64))
+        cent_columns.append(np.frombuffer(cents, dtype=np.int64))
+
+    return (user_names, category_names, np.concatenate(user_columns), np.concatenate(category_columns),
+            np.concatenate(month_columns), np.concatenate(cent_columns))
+
+def grouped_sum(groups, cents, group_count):
+    # Integer cents are exact in float64 well beyond any realistic total, so bincount is safe here
+    return np.rint(np.bincount(groups, weights=cents, minlength=group_count)).astype(np.int64)
+
+def compute_plan_figures(user_count, category_names, user_codes, category_codes, cents):
+    # Grouped per-(user, category) sums in exact integer cents
+    category_count = len(category_names)
+    keys = user_codes * category_count + category_codes
+    pair_keys, inverse = np.unique(keys, return_inverse=True)
+    pair_cents = grouped_sum(inverse.ravel(), cents, len(pair_keys))
+
+    pair_users = pair_keys // max(category_count, 1)
+    pair_categories = pair_keys % max(category_count, 1)
+    user_cents = grouped_sum(pair_users, pair_cents, user_count)
+
+    # Same float operations as generate_plan so the formatted figures match exactly
+    amounts = pair_cents / 100.0
+    totals = user_cents / 100.0
+    # A user whose amounts cancel out to zero gets zero shares, as spending_share gives
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.where(totals[pair_users] != 0, (amounts / totals[pair_users]) * 100, 0.0)
+
+    names = np.array(category_names, dtype=object)
+
+    def in_list(categories):
+        return np.isin(pair_categories, [category_names.index(name) for name in categories if name in category_names])
+
+    # Fixed-order plans list categories in the order of their category list, not alphabetically
+    def list_rank(categories):
+        rank = np.full(category_count, len(categories), dtype=np.int64)
+        for position, name in enumerate(categories):
+            if name in category_names:
+                rank[category_names.index(name)] = position
+        return rank[pair_categories]
+
+    return {
+        'pair_users': pair_users,
+        'pair_names': names[pair_categories],
+        'amounts': amounts,
+        'percentages': percentages,
+        'user_cents': user_cents,
+        'saving': percentages > 5,
+        'reductions': amounts * 0.1,
+        'debt_reduction': in_list(DEBT_REDUCTION_CATEGORIES) & (pair_cents > 0),
+        'debt_rank': list_rank(DEBT_REDUCTION_CATEGORIES),
+        'essential': in_list(ESSENTIAL_CATEGORIES),
+        'non_essential': in_list(NON_ESSENTIAL_CATEGORIES),
+        'budget_rank': list_rank(ESSENTIAL_CATEGORIES + NON_ESSENTIAL_CATEGORIES),
+        'investment': ~in_list(NON_DISCRETIONARY_CATEGORIES),
+        'investments': amounts * 0.05
+    }
+
+def compute_user_trends(category_names, user_codes, category_codes, months, cents, first_month):
+    # user index -> spending trends over the trend window, as paymentPlan reports them: one category x month
+    # matrix for every (user, category) with rows in the window, then spendingTrends on each user's slice
+    # Pairs are keyed by the category's rank in sort order, so each user's categories come out as in build_matrix
+    sorted_names = sorted(category_names)
+    positions = {name: position for position, name in enumerate(sorted_names)}
+    rank = np.array([positions[name] for name in category_names], dtype=np.int64)
+    category_count = max(len(category_names), 1)
+    in_window = (months >= first_month) & (months < first_month + TREND_MONTHS)
+    keys = user_codes[in_window] * category_count + rank[category_codes[in_window]]
+    pair_keys, inverse = np.unique(keys, return_inverse=True)
+    cells = inverse.ravel() * TREND_MONTHS + (months[in_window] - first_month)
+    matrix = np.bincount(cells, weights=cents[in_window].astype(np.float64),
+                         minlength=len(pair_keys) * TREND_MONTHS).reshape(len(pair_keys), TREND_MONTHS)
+
+    # Pair keys are sorted, so each user's categories are contiguous
+    pair_users = pair_keys // category_count
+    pair_categories = (pair_keys % category_count).tolist()
+    starts = np.flatnonzero(np.r_[True, pair_users[1:] != pair_users[:-1]]) if len(pair_users) else pair_users
+    ends = np.r_[starts[1:], len(pair_users)]
+    return {user: compute_trends([sorted_names[code] for code in pair_categories[start:end]], matrix[start:end])
+            for user, start, end in zip(pair_users[starts].tolist(), starts.tolist(), ends.tolist())}
+
+def group_by_user(figures, mask, rank=None):
+    # Indexes of the selected (user, category) pairs, grouped per user in suggestion order
+    selected = np.flatnonzero(mask)
+    if rank is not None:
+        selected = selected[np.lexsort((rank[selected], figures['pair_users'][selected]))]
+    users = figures['pair_users'][selected]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else users
+    ends = np.r_[starts[1:], len(users)]
+    selected = selected.tolist()
+    return {user: selected[start:end] for user, start, end in
+            zip(users[starts].tolist(), starts.tolist(), ends.tolist())}
+
+def render_plans(user_names, figures, trends=None, plan_types=PLAN_TYPES):
+    # Turn the vectorized figures into the same plan responses paymentPlan returns, trend lines included
+    names = figures['pair_names'].tolist()
+    amounts = figures['amounts'].tolist()
+    percentages = figures['percentages'].tolist()
+    reductions = figures['reductions'].tolist()
+    investments = figures['investments'].tolist()
+
+    groups = {
+        'saving': group_by_user(figures, figures['saving']),
+        'debt_reduction': group_by_user(figures, figures['debt_reduction'], figures['debt_rank']),
+        'budgeting': group_by_user(figures, figures['essential'] | figures['non_essential'], figures['budget_rank']),
+        'investment': group_by_user(figures, figures['investment'])
+    }
+    essential = figures['essential'].tolist()
+
+    for user, user_cents in enumerate(figures['user_cents'].tolist()):
+        total_spent = user_cents / 100.0
+        for plan_type in plan_types:
+            indexes = groups.get(plan_type, {}).get(user, ())
+            if plan_type == 'saving':
+                suggestions = [SAVING_SUGGESTION.format(category=names[i], amount=amounts[i], percentage=percentages[i],
+                                                        reduction=reductions[i]) for i in indexes]
+            elif plan_type == 'debt_reduction':
+                suggestions = [DEBT_REDUCTION_SUGGESTION.format(category=names[i], amount=amounts[i],
+                                                                percentage=percentages[i]) for i in indexes]
+                suggestions.append(DEBT_REDUCTION_CLOSING)
+            elif plan_type == 'budgeting':
+                suggestions = [ESSENTIAL_SUGGESTION.format(category=names[i], amount=amounts[i], percentage=percentages[i])
+                               if essential[i] else
+                               NON_ESSENTIAL_SUGGESTION.format(category=names[i], reduction=reductions[i])
+                               for i in indexes]
+            else:
+                suggestions = [INVESTMENT_SUGGESTION.format(category=names[i], investment=investments[i]) for i in indexes]
+
+            suggestions.extend(trend_suggestions((trends or {}).get(user)))
+
+            summary, welcome_suffix = PLAN_TEXT[plan_type]
+            plan = {
+                'planType': plan_type,
+                'welcome_message': WELCOME_MESSAGE + welcome_suffix,
+                'suggestions': suggestions,
+                'summary': summary
+            }
+            yield user_names[user], plan_type, format_plan_response(plan, total_spent)
+
+def write_plans(plans_table, plans):
+    # Write the plans in parallel BatchWriteItem calls of 25
+    generated_at = datetime.now(timezone.utc).isoformat()
+    written = 0
+    failed = 0
+
+    def flush(batch):
+        requests = [{'PutRequest': {'Item': {'userID': user_id, 'planType': plan_type, 'plan': plan,
+                                              'generatedAt': generated_at}}}
+                    for user_id, plan_type, plan in batch]
+        return len(batch), len(write_batch(plans_table, requests))
+
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+        futures = []
+        batch = []
+        for plan in plans:
+            batch.append(plan)
+            if len(batch) == 25:
+                futures.append(executor.submit(flush, batch))
+                batch = []
+        if batch:
+            futures.append(executor.submit(flush, batch))
+        for future in futures:
+            count, unprocessed = future.result()
+            written += count - unprocessed
+            failed += unprocessed
+    return written, failed
+
+def generate_all_plans(output_path=None, total_segments=8):
+    user_names, category_names, user_codes, category_codes, months, cents = load_transactions(
+        [get_table(TRANSACTIONS_TABLE_NAME), get_table(ARCHIVE_TOTALS_TABLE_NAME)], total_segments)
+    figures = compute_plan_figures(len(user_names), category_names, user_codes, category_codes, cents)
+    # The same trend window paymentPlan uses for a request without dates
+    trends = compute_user_trends(category_names, user_codes, category_codes, months, cents, trend_window()[0])
+    plans = render_plans(user_names, figures, trends)
+
+    # Write to a local JSON lines file instead of DynamoDB when asked to
+    if output_path:
+        written = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for user_id, plan_type, plan in plans:
+                f.write(json.dumps({'userID': user_id, 'planType': plan_type, 'plan': plan}, ensure_ascii=False) + '\n')
+                written += 1
+        failed = 0
+    else:
+        written, failed = write_plans(get_table(PLANS_TABLE_NAME), plans)
+
+    return {
+        'transactions': int(len(cents)),
+        'users': len(user_names),
+        'plansWritten': written,
+        'plansFailed': failed
+    }
+
+@instrumented
+def lambda_handler(event, context):
+    result = generate_all_plans(total_segments=int(event.get('segments', 8)))
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Run the nightly job from the command line: python batchPlans.py [output.jsonl]
+if __name__ == '__main__':
+    print(json.dumps(generate_all_plans(sys.argv[1] if len(sys.argv) > 1 else None), indent=2))
@@ -0,0 +1,166 @@
+import base64
+import codecs
+import csv
+import io
+import json
+import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from createTransaction import validate_transaction
+from transactionStore import write_batch
+from rollupStore import ROLLUP_TABLE_NAME, apply_rollup_delta
+from awsClients import get_client, get_table
+from responseCache import bump_data_version
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+BATCH_SIZE = 25  # BatchWriteItem limit
+MAX_CONCURRENT_BATCHES = 8
+MAX_REPORTED_ERRORS = 1000
+
+def parse_rows(lines, data_format):
+    # Turn a line iterator into row dicts without reading ahead more than one line
+    if data_format == 'csv':
+        for row in csv.DictReader(lines):
+            yield row
+    else:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+
+def import_rows(table, rollup_table, rows, default_user_id=None):
+    imported = 0
+    error_count = 0
+    errors = []
+    rollup_deltas = {}
+
+    def record_error(row_number, message):
+        nonlocal error_count
+        error_count += 1
+        # Keep the response bounded for very dirty files
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': row_number, 'error': message})
+
+    def write_rows(batch):
+        unprocessed = write_batch(table, [{'PutRequest': {'Item': item}} for _, item in batch])
+        failed_ids = {request['PutRequest']['Item']['id'] for request in unprocessed}
+        return batch, failed_ids
+
+    def collect(future):
+        nonlocal imported
+        batch, failed_ids = future.result()
+        for row_number, item in batch:
+            if item['id'] in failed_ids:
+                record_error(row_number, 'Write throttled; row was not imported')
+                continue
+            imported += 1
+            totals = rollup_deltas.setdefault((item['userID'], item['category']), [0, 0])
+            totals[0] += item['amountCents']
+            totals[1] += 1
+
+    try:
+        # Writes run on a bounded pool, and reading pauses while the pool is full so memory stays flat
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+            pending = set()
+            batch = []
+            for row_number, row in enumerate(rows, start=1):
+                if row is None:
+                    record_error(row_number, 'Row is not a valid JSON object')
+                    continue
+                if default_user_id and not row.get('userID'):
+                    row['userID'] = default_user_id
+
+                # Apply the same rules as createTransaction
+                transaction, error = validate_transaction(row)
+                if error:
+                    record_error(row_number, error)
+                    continue
+
+                transaction['id'] = str(uuid.uuid4())
+                batch.append((row_number, transaction))
+                if len(batch) == BATCH_SIZE:
+                    pending.add(executor.submit(write_rows, batch))
+                    batch = []
+
+                if len(pending) >= MAX_CONCURRENT_BATCHES:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+
+            if batch:
+                pending.add(executor.submit(write_rows, batch))
+            for future in pending:
+                collect(future)
+    finally:
+        # Batch writes are not transactional, so the rollups are applied once per (user, category) afterwards,
+        # including for the batches written before an import fails; rebuildRollups repairs them if the
+        # function dies between the two steps
+        for (user_id, category), (cents, count) in rollup_deltas.items():
+            apply_rollup_delta(rollup_table, user_id, category, cents, count)
+        for user_id in {user_id for user_id, _ in rollup_deltas}:
+            bump_data_version(user_id)
+
+    return {
+        'imported': imported,
+        'failed': error_count,
+        'errors': errors
+    }
+
+def open_source(event, params):
+    # Lines from an uploaded S3 object are streamed; otherwise the request body is the file
+    if params.get('bucket') and params.get('key'):
+        s3 = get_client('s3')
+        obj = s3.get_object(Bucket=params['bucket'], Key=params['key'])
+        return codecs.iterdecode(obj['Body'].iter_lines(keepends=True), 'utf-8')
+
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return io.StringIO(body)
+
+def detect_format(event, params):
+    data_format = params.get('format')
+    if not data_format:
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        content_type = headers.get('content-type', '')
+        data_format = 'csv' if 'csv' in content_type or params.get('key', '').endswith('.csv') else 'ndjson'
+    return data_format.lower()
+
+@instrumented
+def lambda_handler(event, context):
+    table = get_table('Transactions')
+    rollup_table = get_table(ROLLUP_TABLE_NAME)
+    params = event.get('queryStringParameters') or {}
+
+    data_format = detect_format(event, params)
+    if data_format not in ('csv', 'ndjson'):
+        return {
+            'statusCode': 400,
+            'body': encode_body('Unsupported format. Use csv or ndjson.')
+        }
+
+    lines = open_source(event, params)
+    result = import_rows(table, rollup_table, parse_rows(lines, data_format), params.get('userID'))
+
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Import a local file from the command line: python bulkImport.py transactions.csv [userID]
+if __name__ == '__main__':
+    path = sys.argv[1]
+    with open(path, newline='', encoding='utf-8') as lines:
+        result = import_rows(
+            get_table('Transactions'),
+            get_table(ROLLUP_TABLE_NAME),
+            parse_rows(lines, 'csv' if path.endswith('.csv') else 'ndjson'),
+            sys.argv[2] if len(sys.argv) > 2 else None
+        )
+    print(json.dumps(result, indent=2))
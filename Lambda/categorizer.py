@@ -0,0 +1,86 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+# Canonical category -> merchant and spending keywords (see categoryRules.json, packaged with the functions)
+RULES_PATH = os.environ.get('CATEGORY_RULES_PATH',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'categoryRules.json'))
+
+# Category of a transaction that arrives without one and whose title matches no rule
+DEFAULT_CATEGORY = 'Other'
+# Split rows are written by makeQattah and keep its category
+QATTAH_CATEGORY = 'Qattah'
+
+TITLE_CACHE_SIZE = int(os.environ.get('CATEGORY_CACHE_SIZE', '65536'))
+
+def normalize_text(text):
+    # Lowercase with single spaces, the form keywords are stored and matched in
+    return ' '.join(str(text).lower().split())
+
+def load_rules(path=RULES_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def build_trie(keywords):
+    # Nested dicts keyed by character; '' marks the end of a keyword
+    root = {}
+    for keyword in keywords:
+        node = root
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return root
+
+def trie_pattern(node):
+    # Regex of a trie node with shared prefixes factored out, e.g. {coffee, cola} -> co(?:ffee|la). Greedy optional
+    # groups make the engine try the longest keyword first and fall back to shorter ones on the same prefix
+    branches = [re.escape(char) + trie_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    if len(branches) == 1 and '' not in node:
+        return branches[0]
+    group = '(?:' + '|'.join(branches) + ')'
+    return group + '?' if '' in node else group
+
+def compile_matcher(keywords):
+    # One compiled pattern for every keyword, matched on whole words only ('bar' must not match 'barber')
+    return re.compile(r'(?<!\w)(?:' + trie_pattern(build_trie(keywords)) + r')(?!\w)')
+
+def build_rules(rules):
+    # (keyword -> category, compiled matcher, lowercase name -> canonical category)
+    keyword_categories = {}
+    for category, keywords in rules.items():
+        # Every category's own name is a keyword too, so 'dining out' in a title or free-text category matches
+        for keyword in [category] + keywords:
+            keyword_categories.setdefault(normalize_text(keyword), category)
+    canonical = {normalize_text(category): category for category in list(rules) + [QATTAH_CATEGORY, DEFAULT_CATEGORY]}
+    return keyword_categories, compile_matcher(keyword_categories), canonical
+
+# Compiled once per container and reused by every invocation
+KEYWORD_CATEGORIES, MATCHER, CANONICAL_CATEGORIES = build_rules(load_rules())
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def categorize_text(text):
+    # Category of the most specific (longest, then leftmost) keyword in the text, or None
+    best = None
+    for match in MATCHER.finditer(normalize_text(text)):
+        if best is None or len(match.group()) > len(best):
+            best = match.group()
+    return KEYWORD_CATEGORIES[best] if best else None
+
+def assign_category(title, category=None):
+    # Canonical category of a transaction: the client's category when it already is one, else what the title
+    # says, else what the client's free-text category says, else the client's category as sent
+    if category:
+        canonical = CANONICAL_CATEGORIES.get(normalize_text(category))
+        if canonical:
+            return canonical
+    # categorize_text is cached by its argument, so only text may reach it
+    if title and isinstance(title, str):
+        matched = categorize_text(title)
+        if matched:
+            return matched
+    if category and isinstance(category, str):
+        return categorize_text(category) or category
+    return DEFAULT_CATEGORY
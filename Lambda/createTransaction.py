@@ -1,51 +1,100 @@
 import json
-import boto3
 import uuid
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+from amountFormat import to_cents
+from categorizer import assign_category
+from apiResponse import encode_body
+from transactionStore import normalize_date, transaction_put
+from rollupStore import rollup_update
+from responseCache import version_bump
+from awsClients import get_table
+from instrumentation import instrumented
 
-def add_transaction(table, amount, category, date, title, user_id):
+def add_transaction(table, amount_cents, category, date, title, user_id):
     # Generate a unique UUID for the transaction
     transaction_id = str(uuid.uuid4())
 
-    # Add a transaction to the DynamoDB table
-    response = table.put_item(
-        Item={
-            'id': transaction_id,  # Use the UUID as the transaction ID
-            'amount': amount,
-            'category': category,
-            'date': date,
-            'title': title,
-            'userID': user_id
-        }
+    transaction = {
+        'id': transaction_id,  # Use the UUID as the transaction ID
+        'amountCents': amount_cents,
+        'category': category,
+        'date': date,
+        'title': title,
+        'userID': user_id
+    }
+
+    # Add the transaction, update the user's category rollup and invalidate cached analytics in a single atomic write
+    response = table.meta.client.transact_write_items(
+        TransactItems=[
+            transaction_put(transaction),
+            rollup_update(user_id, category, amount_cents),
+            version_bump(user_id)
+        ]
     )
     return response
 
+def validate_transaction(body):
+    # Check a transaction payload, returning (fields, None) when valid or (None, error message)
+    try:
+        amount = Decimal(str(body["amount"]))
+        date = body["date"]
+        title = body["title"]
+        user_id = body["userID"]
+    except KeyError:
+        return None, 'Missing one or more transaction details'
+    except InvalidOperation:
+        return None, 'Invalid transaction amount'
+
+    # Ensure all necessary details are provided; the category is optional
+    if not all([amount, date, title, user_id]):
+        return None, 'Missing one or more transaction details'
+
+    # Text fields are stored, indexed and categorized as strings; a list or object would fail further down
+    if not all(isinstance(value, str) for value in [date, title, user_id, body.get("category") or '']):
+        return None, 'Transaction userID, date, title and category must be text'
+
+    if not amount.is_finite():
+        return None, 'Invalid transaction amount'
+
+    # Amounts are stored in whole cents, so one that rounds to zero would be stored as nothing at all
+    if to_cents(amount) == 0:
+        return None, 'Transaction amount must be at least one cent'
+
+    # Dates are the sort key of the user index, so they must be stored in ISO form
+    date = normalize_date(date)
+    if not date:
+        return None, 'Invalid transaction date, expected YYYY-MM-DD'
+
+    # Stored in whole cents, under a canonical category the plan logic recognizes
+    return {
+        'amountCents': to_cents(amount),
+        'category': assign_category(title, body.get("category")),
+        'date': date,
+        'title': title,
+        'userID': user_id
+    }, None
+
+@instrumented
 def lambda_handler(event, context):
-    # Initialize a boto3 DynamoDB resource
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('Transactions')  # Replace with your table name
+    # Reuse the container's DynamoDB table handle
+    table = get_table('Transactions')  # Replace with your table name
 
     # Extract transaction details from the event
     body = json.loads(event['body'])
 
-    amount = Decimal(str(body["amount"]))
-    category = body["category"]
-    date = body["date"]
-    title = body["title"]
-    user_id = body["userID"]
-
-    # Ensure all necessary details are provided
-    if not all([amount, category, date, title, user_id]):
+    transaction, error = validate_transaction(body)
+    if error:
         return {
             'statusCode': 400,
-            'body': json.dumps('Missing one or more transaction details')
+            'body': encode_body(error)
         }
 
     # Add the transaction to the DynamoDB table
-    response = add_transaction(table, amount, category, date, title, user_id)
+    response = add_transaction(table, transaction['amountCents'], transaction['category'], transaction['date'],
+                               transaction['title'], transaction['userID'])
 
     # Return the result
     return {
         'statusCode': 200,
-        'body': json.dumps(response)
+        'body': encode_body(response)
     }
\ No newline at end of file
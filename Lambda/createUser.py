@@ -1,41 +1,50 @@
-import boto3
 import json
 import uuid  # Import the UUID library
+from userStore import create_user, normalize_email, normalize_phone
+from apiResponse import encode_body
+from instrumentation import instrumented
 
+@instrumented
 def lambda_handler(event, context):
-    # Initialize a DynamoDB client
-    dynamodb = boto3.resource('dynamodb')
-
-    # Reference to the 'Users' table
-    table = dynamodb.Table('Users')
-
     # Generate a unique UUID for the new user
     unique_id = str(uuid.uuid4())
 
     body = json.loads(event['body'])
+    # Contacts are stored normalized, the form they are indexed and kept unique in
+    email = normalize_email(body.get("email"))
+    phone = normalize_phone(body.get("phone"))
+    if not body.get("name") or not email or not phone:
+        return {
+            'statusCode': 400,
+            'body': encode_body('Missing name, or invalid email or phone')
+        }
+
     # Extract user data from the event and add the generated UUID
     user_data = {
         'id': unique_id,  # Use the generated UUID as the user ID
         'name': body["name"],
-        'email': body["email"],
-        'phone': body["phone"]
+        'email': email,
+        'phone': phone
     }
 
-    # Insert the user data into the DynamoDB table
-    response = table.put_item(Item=user_data)
+    # Insert the user data into the DynamoDB table, reserving the email and phone in the same transaction
+    taken = create_user(user_data)
+    if taken:
+        return {
+            'statusCode': 409,
+            'body': encode_body({
+                'message': f"{' and '.join(taken).capitalize()} already registered to another user.",
+                'conflicts': taken
+            })
+        }
 
-    # Check if the insert operation was successful
-    if response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200:
-        return_message = 'User created successfully.'
-        status_code = 200
-    else:
-        return_message = 'Failed to create user.'
-        status_code = response.get('ResponseMetadata', {}).get('HTTPStatusCode', 500)
+    return_message = 'User created successfully.'
+    status_code = 200
 
     # Return the user data and a success message
     return {
         'statusCode': status_code,
-        'body': json.dumps({
+        'body': encode_body({
             'message': return_message,
             'userData': user_data
         })
@@ -1,47 +1,177 @@
-import boto3
 import json
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from itemCodec import query_pages
+from transactionStore import query_user_transaction_pages, write_batch
+from ledgerStore import LEDGER_TABLE_NAME, query_open_splits
+from rollupStore import ROLLUP_TABLE_NAME, delete_user_rollups
+from userStore import delete_user
+from archiveStore import delete_user_archive
+from awsClients import get_client, get_table
+from responseCache import bump_data_version
+from apiResponse import encode_body
+from instrumentation import instrumented
 
-def lambda_handler(event, context):
-    # Initialize a DynamoDB client
-    dynamodb = boto3.resource('dynamodb')
-
-    # References to the 'Users' and 'Transactions' tables
-    users_table = dynamodb.Table('Users')
-    transactions_table = dynamodb.Table('Transactions')
-    body = json.loads(event['body'])
-    # Extract the unique ID of the user to be deleted from the event
-    user_id = body["id"]
-
-    # Step 1: Delete the user data from the Users table
-    user_response = users_table.delete_item(
-        Key={
-            'id': user_id  # Use the user ID as the primary key
-        }
-    )
+BATCH_SIZE = 25  # BatchWriteItem limit
+MAX_WORKERS = 8
+PAGE_SIZE = 1000
+LEDGER_PAGE_SIZE = 100
 
-    # Step 2: Scan and delete all transactions associated with the user
-    transactions_response = transactions_table.scan(
-        FilterExpression=boto3.dynamodb.conditions.Attr('userID').eq(user_id)
-    )
+# Hand off to a fresh invocation when less than this much time is left
+CONTINUATION_THRESHOLD_MS = 60000
+
+def delete_batch(transactions_table, transaction_ids):
+    # Delete up to 25 transactions in one call, returning how many were deleted and how many were left over
+    requests = [{'DeleteRequest': {'Key': {'id': transaction_id}}} for transaction_id in transaction_ids]
+    unprocessed = write_batch(transactions_table, requests)
+    return len(requests) - len(unprocessed), len(unprocessed)
+
+def delete_transactions(transactions_table, user_id, context, start_key=None):
+    deleted_count = 0
+    failed_count = 0
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for items, last_key in query_user_transaction_pages(transactions_table, user_id, ['id'], PAGE_SIZE, start_key):
+            # Delete the page in parallel batches of 25
+            transaction_ids = [item['id'] for item in items]
+            futures = [executor.submit(delete_batch, transactions_table, transaction_ids[start:start + BATCH_SIZE])
+                       for start in range(0, len(transaction_ids), BATCH_SIZE)]
+            for future in futures:
+                deleted, failed = future.result()
+                deleted_count += deleted
+                failed_count += failed
 
-    for transaction in transactions_response['Items']:
-        transactions_table.delete_item(
-            Key={
-                'id': transaction['id']  # Use transaction ID as the primary key for deletion
-            }
+            # The page is fully processed, so last_key is a safe checkpoint to resume from
+            if last_key and context and context.get_remaining_time_in_millis() < CONTINUATION_THRESHOLD_MS:
+                return deleted_count, failed_count, last_key
+
+    return deleted_count, failed_count, None
+
+def write_off_splits(transactions_table, debtor_id, creditor_id):
+    # Mark the splits a counterparty still owed the deleted user as paid, so the raw rows agree with the removed
+    # balance and reconcileLedger does not bring the pair back
+    for item in query_open_splits(transactions_table, debtor_id, creditor_id, ['id']):
+        transactions_table.update_item(
+            Key={'id': item['id']},
+            UpdateExpression='SET is_paid = :paid',
+            ConditionExpression='is_paid = :unpaid',
+            ExpressionAttributeValues={':paid': True, ':unpaid': False}
         )
 
-    # Check if the user deletion operation was successful
-    if user_response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 200:
+def delete_balances(transactions_table, ledger_table, user_id, context, start_key=None):
+    # Remove both sides of every balance pair the user is part of, page by page, returning a checkpoint when
+    # time runs low. The user's own split rows are already gone, so only what others owed the user is left
+    for items, last_key in query_pages(ledger_table.name, Key('userID').eq(user_id), ['counterpartyID', 'openSplits'],
+                                       page_size=LEDGER_PAGE_SIZE, start_key=start_key):
+        for item in items:
+            counterparty_id = item['counterpartyID']
+            if item.get('openSplits', 0) > 0:
+                write_off_splits(transactions_table, counterparty_id, user_id)
+            write_batch(ledger_table, [
+                {'DeleteRequest': {'Key': {'userID': user_id, 'counterpartyID': counterparty_id}}},
+                {'DeleteRequest': {'Key': {'userID': counterparty_id, 'counterpartyID': user_id}}}
+            ])
+            bump_data_version(counterparty_id)
+
+        # Every pair on the page is gone, so last_key is a safe checkpoint to resume from
+        if last_key and context and context.get_remaining_time_in_millis() < CONTINUATION_THRESHOLD_MS:
+            return last_key
+    return None
+
+def continue_asynchronously(context, continuation):
+    # Re-invoke this function in the background with the checkpoint and the running totals
+    get_client('lambda').invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps({'continuation': continuation})
+    )
+
+@instrumented
+def lambda_handler(event, context):
+    # Reference to the 'Transactions' table
+    transactions_table = get_table('Transactions')
+    rollup_table = get_table(ROLLUP_TABLE_NAME)
+    ledger_table = get_table(LEDGER_TABLE_NAME)
+    ledger_start_key = None
+
+    continuation = event.get('continuation')
+    if continuation:
+        # Background continuation of an earlier request; the user row is already gone
+        user_id = continuation['userID']
+        start_key = continuation.get('exclusiveStartKey')
+        ledger_start_key = continuation.get('ledgerStartKey')
+        status_code = 200
+        user_message = f'User with ID: {user_id} deleted successfully.'
+    else:
+        body = json.loads(event['body'])
+        # Extract the unique ID of the user to be deleted from the event
+        user_id = body["id"]
+        start_key = None
+
+        # Step 1: Delete the user data from the Users table, releasing the user's email and phone with it
+        delete_user(user_id)
+        status_code = 200
         user_message = f'User with ID: {user_id} deleted successfully.'
+
+    # Step 2: Delete all transactions associated with the user, page by page; a continuation that already reached
+    # the balances has nothing left to delete here
+    if ledger_start_key:
+        deleted_count, failed_count, checkpoint = 0, 0, None
+    else:
+        deleted_count, failed_count, checkpoint = delete_transactions(transactions_table, user_id, context, start_key)
+    if continuation:
+        deleted_count += continuation.get('deleted', 0)
+        failed_count += continuation.get('failed', 0)
+
+    # Step 3: Remove the user's Qattah balances from both sides of every pair, page by page
+    resume = None
+    if checkpoint:
+        resume = {'exclusiveStartKey': checkpoint}
+    else:
+        ledger_checkpoint = delete_balances(transactions_table, ledger_table, user_id, context, ledger_start_key)
+        if ledger_checkpoint:
+            resume = {'ledgerStartKey': ledger_checkpoint}
+
+    if resume:
+        continue_asynchronously(context, {
+            'userID': user_id,
+            **resume,
+            'deleted': deleted_count,
+            'failed': failed_count
+        })
+        return {
+            'statusCode': 202,
+            'body': encode_body({
+                'userMessage': user_message,
+                'transactionMessage': f'{deleted_count} associated transactions deleted so far; the rest are being deleted in the background.',
+                'deletedTransactions': deleted_count,
+                'failedTransactions': failed_count,
+                'completed': False
+            })
+        }
+
+    # Step 4: Drop the user's category rollups and archived transactions now that their live ones are gone
+    delete_user_rollups(rollup_table, user_id)
+    archive_failed = delete_user_archive(user_id)
+    bump_data_version(user_id)
+
+    if deleted_count:
+        transaction_message = f'{deleted_count} associated transactions deleted successfully.'
     else:
-        user_message = f'Failed to delete user with ID: {user_id}.'
+        transaction_message = 'No associated transactions to delete.'
+    if failed_count:
+        transaction_message += f' {failed_count} transactions could not be deleted; retry the request to remove them.'
+    if archive_failed:
+        transaction_message += f' {archive_failed} archived totals could not be deleted; retry the request to remove them.'
 
     # Return a message indicating the result of the operations
     return {
-        'statusCode': user_response.get('ResponseMetadata', {}).get('HTTPStatusCode', 500),
-        'body': json.dumps({
+        'statusCode': status_code,
+        'body': encode_body({
             'userMessage': user_message,
-            'transactionMessage': 'Associated transactions deleted successfully.' if transactions_response['Items'] else 'No associated transactions to delete.'
+            'transactionMessage': transaction_message,
+            'deletedTransactions': deleted_count,
+            'failedTransactions': failed_count,
+            'completed': True
         })
     }
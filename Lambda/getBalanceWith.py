@@ -0,0 +1,30 @@
+import json
+from awsClients import get_table
+from amountFormat import cents_to_amount
+from ledgerStore import LEDGER_TABLE_NAME, get_balance
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+@instrumented
+def lambda_handler(event, context):
+    body = json.loads(event['body'])
+    user_id = body.get('userID')
+    counterparty_id = body.get('counterpartyID')
+    if not user_id or not counterparty_id:
+        return {
+            'statusCode': 400,
+            'body': encode_body('Missing userID or counterpartyID')
+        }
+
+    # A single ledger record holds the net balance of the pair
+    balance, open_splits = get_balance(get_table(LEDGER_TABLE_NAME), user_id, counterparty_id)
+    return {
+        'statusCode': 200,
+        'body': encode_body({
+            'userID': user_id,
+            'counterpartyID': counterparty_id,
+            # Positive: counterpartyID owes userID; negative: userID owes counterpartyID
+            'balance': cents_to_amount(balance),
+            'openSplits': open_splits
+        })
+    }
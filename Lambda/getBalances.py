@@ -0,0 +1,32 @@
+import json
+from awsClients import get_table
+from amountFormat import cents_to_amount
+from ledgerStore import LEDGER_TABLE_NAME, get_balances
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+@instrumented
+def lambda_handler(event, context):
+    body = json.loads(event['body'])
+    user_id = body.get('userID')
+    if not user_id:
+        return {
+            'statusCode': 400,
+            'body': encode_body('Missing userID')
+        }
+
+    # One ledger record per counterparty; positive amounts are owed to the user, negative ones are owed by them
+    balances = get_balances(get_table(LEDGER_TABLE_NAME), user_id)
+    owed_to_user = sum(cents for cents in balances.values() if cents > 0)
+    owed_by_user = -sum(cents for cents in balances.values() if cents < 0)
+
+    return {
+        'statusCode': 200,
+        'body': encode_body({
+            'userID': user_id,
+            'balances': {counterparty_id: cents_to_amount(cents) for counterparty_id, cents in balances.items()},
+            'owedToUser': cents_to_amount(owed_to_user),
+            'owedByUser': cents_to_amount(owed_by_user),
+            'net': cents_to_amount(owed_to_user - owed_by_user)
+        })
+    }
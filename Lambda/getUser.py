@@ -1,13 +1,56 @@
-import boto3
 import json
+from userStore import CONTACT_NORMALIZERS, find_user_by_contact, get_users
+from awsClients import get_table
+from apiResponse import encode_body
+from instrumentation import instrumented
 
+# Users per batch request; each batch is a single BatchGetItem call
+MAX_BATCH_USERS = 100
+
+@instrumented
 def lambda_handler(event, context):
-    # Initialize a DynamoDB client
-    dynamodb = boto3.resource('dynamodb')
+    body = json.loads(event['body'])
+
+    # Batch mode: many users in one request, served from the container's user cache and one BatchGetItem
+    if 'ids' in body:
+        user_ids = list(dict.fromkeys(body['ids'] or []))
+        if not user_ids or len(user_ids) > MAX_BATCH_USERS:
+            return {
+                'statusCode': 400,
+                'body': encode_body(f'ids must list between 1 and {MAX_BATCH_USERS} user IDs.')
+            }
+        users = get_users(user_ids)
+        return {
+            'statusCode': 200,
+            'body': encode_body({
+                'message': f'{len(users)} of {len(user_ids)} users found.',
+                'users': [users[user_id] for user_id in user_ids if user_id in users],
+                'missing': [user_id for user_id in user_ids if user_id not in users]
+            })
+        }
+
+    # Contact mode: find the user holding an email or phone with one query on its index
+    field = next((field for field in CONTACT_NORMALIZERS if body.get(field)), None)
+    if 'id' not in body and field:
+        user_data = find_user_by_contact(field, body[field])
+        if user_data:
+            return {
+                'statusCode': 200,
+                'body': encode_body({
+                    'message': f'User data retrieved successfully for {field}: {body[field]}.',
+                    'userData': user_data
+                })
+            }
+        return {
+            'statusCode': 404,
+            'body': encode_body({
+                'message': f'User data not found for {field}: {body[field]}.',
+                'userData': {}
+            })
+        }
 
     # Reference to the 'Users' table
-    users_table = dynamodb.Table('Users')
-    body = json.loads(event['body'])
+    users_table = get_table('Users')
     # Extract the unique ID of the user from the event
     user_id = body["id"]
 
@@ -31,7 +74,7 @@ def lambda_handler(event, context):
     # Return the user data and a message
     return {
         'statusCode': status_code,
-        'body': json.dumps({
+        'body': encode_body({
             'message': return_message,
             'userData': user_data
         })
@@ -0,0 +1,84 @@
+import heapq
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from amountFormat import AMOUNT_ATTRIBUTES, cents_to_amount, stored_cents
+from ledgerStore import is_open_split, query_open_splits
+
+MAX_WORKERS = 8
+MAX_GROUP_SIZE = 500
+
+def load_group_splits(transaction_table, user_ids):
+    # Every unpaid split row owed between two members of the group, read from each member's user index partition
+    # with only the member's open splits returned
+    members = set(user_ids)
+
+    def member_splits(user_id):
+        items = query_open_splits(transaction_table, user_id, None,
+                                  ['id', 'userID', 'came_from', 'is_paid'] + AMOUNT_ATTRIBUTES)
+        return [item for item in items if is_open_split(item) and item['came_from'] in members]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return [item for items in executor.map(member_splits, members) for item in items]
+
+def net_positions(splits):
+    # userID -> net cents; positive members are owed money by the group, negative members owe it
+    positions = defaultdict(int)
+    for item in splits:
+        cents = stored_cents(item)
+        positions[item['came_from']] += cents
+        positions[item['userID']] -= cents
+    return {user_id: cents for user_id, cents in positions.items() if cents}
+
+def simplify_debts(positions):
+    # Greedy min-cash-flow: members whose positions cancel exactly pay each other first, then the largest debtor
+    # pays the largest creditor until one of them is settled. Every transfer settles at least one member, so there
+    # are at most n - 1 transfers, found in O(n log n)
+    transfers = []
+    creditors_by_amount = defaultdict(list)
+    for user_id, cents in sorted(positions.items()):
+        if cents > 0:
+            creditors_by_amount[cents].append(user_id)
+
+    debtors = []
+    for user_id, cents in sorted(positions.items()):
+        if cents < 0:
+            if creditors_by_amount.get(-cents):
+                transfers.append((user_id, creditors_by_amount[-cents].pop(), -cents))
+            else:
+                debtors.append((cents, user_id))
+    creditors = [(-cents, user_id) for cents, user_ids in creditors_by_amount.items() for user_id in user_ids]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+
+    while debtors and creditors:
+        debt, debtor_id = heapq.heappop(debtors)
+        credit, creditor_id = heapq.heappop(creditors)
+        cents = min(-debt, -credit)
+        transfers.append((debtor_id, creditor_id, cents))
+        if -debt > cents:
+            heapq.heappush(debtors, (debt + cents, debtor_id))
+        if -credit > cents:
+            heapq.heappush(creditors, (credit + cents, creditor_id))
+
+    return [{'from': debtor_id, 'to': creditor_id, 'amount': cents_to_amount(cents)}
+            for debtor_id, creditor_id, cents in transfers]
+
+def plan_settlement(transaction_table, user_ids):
+    # The group's open splits and the minimal set of transfers that settles all of them
+    splits = load_group_splits(transaction_table, user_ids)
+    positions = net_positions(splits)
+    return splits, {
+        'users': sorted(set(user_ids)),
+        'openSplits': len(splits),
+        'positions': {user_id: cents_to_amount(cents) for user_id, cents in sorted(positions.items())},
+        'transfers': simplify_debts(positions)
+    }
+
+def read_group(body):
+    # The members of the group, or an error message
+    user_ids = body.get('users')
+    if not isinstance(user_ids, list) or len(set(user_ids)) < 2:
+        return None, 'Provide at least two users to settle between'
+    if len(set(user_ids)) > MAX_GROUP_SIZE:
+        return None, f'Groups are limited to {MAX_GROUP_SIZE} users'
+    return list(dict.fromkeys(user_ids)), None
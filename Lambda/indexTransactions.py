@@ -0,0 +1,77 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from amountFormat import AMOUNT_ATTRIBUTES
+from itemCodec import deserialize_item
+from searchIndex import SEARCH_TABLE_NAME, POSTING_FIELDS, posting_changes, postings_for
+from transactionStore import TRANSACTIONS_TABLE_NAME, parallel_scan, write_batch
+from awsClients import get_table
+from instrumentation import instrumented
+
+BATCH_SIZE = 25  # BatchWriteItem limit
+MAX_WORKERS = 8
+
+def request_key(request):
+    key = request['PutRequest']['Item'] if 'PutRequest' in request else request['DeleteRequest']['Key']
+    return key['userID'], key['termKey']
+
+def record_changes(record):
+    # (keys to delete, postings to put) for one stream record of the Transactions table
+    images = record.get('dynamodb', {})
+    old_item = deserialize_item(images['OldImage']) if 'OldImage' in images else None
+    new_item = deserialize_item(images['NewImage']) if 'NewImage' in images and record['eventName'] != 'REMOVE' else None
+    return posting_changes(old_item, new_item)
+
+def write_requests(index_table, requests):
+    # Send requests in parallel BatchWriteItem calls, returning the keys of those that could not be written
+    def write_chunk(chunk):
+        try:
+            return [request_key(request) for request in write_batch(index_table, chunk)]
+        except ClientError as e:
+            print(f"Search index write failed: {e}")
+            return [request_key(request) for request in chunk]
+
+    chunks = [requests[start:start + BATCH_SIZE] for start in range(0, len(requests), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return {key for keys in executor.map(write_chunk, chunks) for key in keys}
+
+def index_records(index_table, records):
+    # Apply a batch of stream records, returning the sequence numbers of records whose writes failed.
+    # Only the last write per posting matters, so records touching the same posting collapse into one request,
+    # which also keeps duplicate keys out of a BatchWriteItem call
+    writes = {}
+    for position, record in enumerate(records):
+        deletes, puts = record_changes(record)
+        requests = [{'DeleteRequest': {'Key': key}} for key in deletes] + [{'PutRequest': {'Item': item}} for item in puts]
+        for request in requests:
+            entry = writes.setdefault(request_key(request), [None, []])
+            entry[0] = request
+            entry[1].append(position)
+
+    failed_keys = write_requests(index_table, [request for request, _ in writes.values()])
+    failed = sorted({position for key in failed_keys for position in writes[key][1]})
+    return [records[position]['dynamodb']['SequenceNumber'] for position in failed]
+
+def backfill_index(total_segments=4):
+    # Index every existing row, for tables that had rows before the stream consumer was deployed
+    attributes = ['id', 'userID'] + POSTING_FIELDS + AMOUNT_ATTRIBUTES
+    requests = [{'PutRequest': {'Item': posting}}
+                for item in parallel_scan(get_table(TRANSACTIONS_TABLE_NAME), attributes, total_segments)
+                for posting in postings_for(item)]
+    failed = write_requests(get_table(SEARCH_TABLE_NAME), requests)
+    return {'postingsWritten': len(requests) - len(failed), 'postingsFailed': len(failed)}
+
+@instrumented
+def lambda_handler(event, context):
+    # Direct invocations with {"backfill": true} index the existing rows
+    if event.get('backfill'):
+        return backfill_index(int(event.get('segments', 4)))
+
+    # Invoked by the Transactions stream (aws_lambda_event_source_mapping.indexTransactions in main.tf), off the
+    # write path. Failed records are reported so only they and the records after them are retried
+    failures = index_records(get_table(SEARCH_TABLE_NAME), event.get('Records', []))
+    return {'batchItemFailures': [{'itemIdentifier': sequence_number} for sequence_number in failures]}
+
+# Backfill from the command line: python indexTransactions.py
+if __name__ == '__main__':
+    print(json.dumps(backfill_index(), indent=2))
@@ -0,0 +1,152 @@
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# Per-invocation metrics in CloudWatch Embedded Metric Format (one JSON log line per sampled invocation).
+# METRICS_SAMPLE_RATE is the fraction of invocations measured; METRICS_SINK, when set, is a local file the
+# lines are appended to instead of the log (the local stand-in in benchmarks/localAws.py sets it).
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CampusPay')
+READ_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+
+_cold_start = True
+# The invocation being measured is kept per context, so concurrent invocations (benchmarks/devServer.py serves
+# requests on threads) never share or clear each other's state. Calls from a handler's worker threads run outside
+# that context and go to the only invocation in progress; with several in progress they are left unattributed
+_invocation = contextvars.ContextVar('invocation', default=None)
+_active = ()
+_lock = threading.Lock()
+
+def current_invocation():
+    invocation = _invocation.get()
+    if invocation is None:
+        active = _active
+        if len(active) == 1:
+            invocation = active[0]
+    return invocation
+
+def register_aws_hooks(events):
+    # Called by awsClients for its session, so every client the handlers use reports its calls here
+    events.register('before-parameter-build.dynamodb', request_consumed_capacity)
+    events.register('before-call', start_call)
+    events.register('after-call', finish_call)
+
+def request_consumed_capacity(params, model, **kwargs):
+    if current_invocation() is not None and 'ReturnConsumedCapacity' in model.input_shape.members:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def start_call(context, **kwargs):
+    invocation = current_invocation()
+    if invocation is not None:
+        context['instrumentation'] = (invocation, time.perf_counter())
+
+def finish_call(parsed, model, context, **kwargs):
+    if 'instrumentation' not in context:
+        return
+    invocation, started = context['instrumentation']
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    service = model.service_model.service_name
+    name = f"{'DynamoDB' if service == 'dynamodb' else service.upper()}.{model.name}"
+
+    consumed = parsed.get('ConsumedCapacity') or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    units = sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+
+    with _lock:
+        metrics = invocation['metrics']
+        add(metrics, f'{name}.Calls', 1, 'Count')
+        add(metrics, f'{name}.Time', elapsed_ms, 'Milliseconds')
+        add(metrics, 'AwsTime', elapsed_ms, 'Milliseconds')
+        if service == 'dynamodb':
+            add(metrics, 'ReadCapacityUnits' if model.name in READ_OPERATIONS else 'WriteCapacityUnits', units, 'Count')
+            # Items DynamoDB had to read versus items it returned after filtering
+            if 'ScannedCount' in parsed:
+                add(metrics, 'ItemsRead', parsed['ScannedCount'], 'Count')
+                add(metrics, 'ItemsReturned', parsed.get('Count', 0), 'Count')
+
+def add(metrics, name, value, unit):
+    previous = metrics.get(name, (0, unit))[0]
+    metrics[name] = (previous + value, unit)
+
+def add_metric(name, value, unit='Count'):
+    # Handler-specific metrics, e.g. cache hits; ignored for unsampled invocations
+    invocation = current_invocation()
+    if invocation is not None:
+        with _lock:
+            add(invocation['metrics'], name, value, unit)
+
+def set_property(name, value):
+    # Searchable, non-metric fields on the invocation's log line
+    invocation = current_invocation()
+    if invocation is not None:
+        invocation['properties'][name] = value
+
+def sample_rate():
+    return float(os.environ.get('METRICS_SAMPLE_RATE', '1'))
+
+def emit(record):
+    line = json.dumps(record, default=str)
+    sink = os.environ.get('METRICS_SINK')
+    if sink:
+        with _lock, open(sink, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    else:
+        print(line)
+
+def build_record(function_name, metrics, properties):
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Function']],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in sorted(metrics.items())]
+            }]
+        },
+        'Function': function_name,
+        **properties,
+        **{name: value for name, (value, _) in metrics.items()}
+    }
+
+def instrumented(handler):
+    # Wrap a lambda_handler so each sampled invocation emits its duration, AWS call metrics and cold start flag
+    function_name = handler.__module__
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold_start, _active
+        cold_start = _cold_start
+        _cold_start = False
+        if random.random() >= sample_rate():
+            return handler(event, context)
+
+        invocation = {'metrics': {}, 'properties': {'ColdStart': cold_start}}
+        if context is not None and getattr(context, 'aws_request_id', None):
+            invocation['properties']['RequestId'] = context.aws_request_id
+        add(invocation['metrics'], 'ColdStart', int(cold_start), 'Count')
+        token = _invocation.set(invocation)
+        with _lock:
+            _active = _active + (invocation,)
+        started = time.perf_counter()
+        try:
+            response = handler(event, context)
+            if isinstance(response, dict) and 'statusCode' in response:
+                invocation['properties']['StatusCode'] = response['statusCode']
+                with _lock:
+                    add(invocation['metrics'], 'Errors', int(response['statusCode'] >= 500), 'Count')
+            return response
+        except Exception:
+            with _lock:
+                add(invocation['metrics'], 'Errors', 1, 'Count')
+            raise
+        finally:
+            _invocation.reset(token)
+            with _lock:
+                _active = tuple(active for active in _active if active is not invocation)
+                add(invocation['metrics'], 'Duration', (time.perf_counter() - started) * 1000, 'Milliseconds')
+            emit(build_record(function_name, invocation['metrics'], invocation['properties']))
+    return wrapper
@@ -0,0 +1,113 @@
+from boto3.dynamodb.conditions import ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeSerializer
+from awsClients import get_low_level_client
+
+# Read paths that only aggregate amounts go through the low-level client and decode items here: numbers become
+# int (float only for a non-integral legacy value) instead of the Decimal the resource layer builds for every
+# number, so integer-cent sums need no Decimal arithmetic or conversion afterwards
+
+def decode_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+DECODERS = {
+    'S': lambda value: value,
+    'N': decode_number,
+    'BOOL': lambda value: value,
+    'NULL': lambda value: None,
+    'B': lambda value: value,
+    'M': lambda value: deserialize_item(value),
+    'L': lambda value: [deserialize_value(element) for element in value],
+    'SS': set,
+    'NS': lambda value: {decode_number(element) for element in value},
+    'BS': set
+}
+
+def deserialize_value(value):
+    for kind, data in value.items():
+        return DECODERS[kind](data)
+
+def deserialize_item(item):
+    return {name: deserialize_value(value) for name, value in item.items()}
+
+_serializer = TypeSerializer()
+
+def serialize_values(values):
+    return {placeholder: _serializer.serialize(value) for placeholder, value in values.items()}
+
+def build_request(key_condition=None, attributes=None, filter_condition=None):
+    # Expression parameters for the low-level client from boto3 conditions and a projection list. One builder
+    # numbers the placeholders of both conditions, so they never collide
+    builder = ConditionExpressionBuilder()
+    request = {}
+    names = {}
+    values = {}
+    if key_condition is not None:
+        built = builder.build_expression(key_condition, is_key_condition=True)
+        request['KeyConditionExpression'] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+    if filter_condition is not None:
+        built = builder.build_expression(filter_condition)
+        request['FilterExpression'] = built.condition_expression
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+    if attributes:
+        # Placeholders keep reserved words such as 'date' safe
+        projection = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+        request['ProjectionExpression'] = ', '.join(projection)
+        names.update(projection)
+    if names:
+        request['ExpressionAttributeNames'] = names
+    if values:
+        request['ExpressionAttributeValues'] = serialize_values(values)
+    return request
+
+def query_pages(table_name, key_condition, attributes=None, index_name=None, page_size=None, start_key=None,
+                filter_condition=None, scan_forward=True):
+    # Yield (decoded items, raw LastEvaluatedKey) per page; the raw key can be passed back as start_key
+    request = build_request(key_condition, attributes, filter_condition)
+    request['TableName'] = table_name
+    if index_name:
+        request['IndexName'] = index_name
+    if not scan_forward:
+        request['ScanIndexForward'] = False
+    if page_size:
+        request['Limit'] = page_size
+    if start_key:
+        request['ExclusiveStartKey'] = start_key
+
+    client = get_low_level_client('dynamodb')
+    while True:
+        response = client.query(**request)
+        last_key = response.get('LastEvaluatedKey')
+        yield [deserialize_item(item) for item in response.get('Items', [])], last_key
+
+        if not last_key:
+            break
+        request['ExclusiveStartKey'] = last_key
+
+def scan_pages(table_name, attributes, segment=None, total_segments=None, filter_condition=None, page_size=None,
+               start_key=None):
+    # Yield (decoded items, raw LastEvaluatedKey) per page of a (segment of a) scan, like query_pages
+    request = build_request(attributes=attributes, filter_condition=filter_condition)
+    request['TableName'] = table_name
+    if total_segments:
+        request['Segment'] = segment
+        request['TotalSegments'] = total_segments
+    if page_size:
+        request['Limit'] = page_size
+    if start_key:
+        request['ExclusiveStartKey'] = start_key
+
+    client = get_low_level_client('dynamodb')
+    while True:
+        response = client.scan(**request)
+        last_key = response.get('LastEvaluatedKey')
+        yield [deserialize_item(item) for item in response.get('Items', [])], last_key
+
+        if not last_key:
+            break
+        request['ExclusiveStartKey'] = last_key
@@ -0,0 +1,67 @@
+from boto3.dynamodb.conditions import Attr, Key
+from amountFormat import stored_cents
+from itemCodec import query_pages
+from transactionStore import query_user_transaction_pages
+
+# Net Qattah balance between two users, stored from both sides (see aws_dynamodb_table.QattahBalances in main.tf).
+# A positive balance means counterpartyID owes userID; openSplits counts the unpaid split rows behind it.
+LEDGER_TABLE_NAME = 'QattahBalances'
+
+# Balances are kept in whole cents; 'balance' is the Decimal attribute of records written before that
+BALANCE_ATTRIBUTE = 'balanceCents'
+LEGACY_BALANCE_ATTRIBUTE = 'balance'
+
+LEDGER_ATTRIBUTE_NAMES = {'#balance': BALANCE_ATTRIBUTE, '#open': 'openSplits'}
+
+def record_balance(item):
+    return stored_cents(item, BALANCE_ATTRIBUTE, LEGACY_BALANCE_ATTRIBUTE)
+
+def ledger_update(user_id, counterparty_id, cents, count):
+    return {
+        'Update': {
+            'TableName': LEDGER_TABLE_NAME,
+            'Key': {'userID': user_id, 'counterpartyID': counterparty_id},
+            'UpdateExpression': 'ADD #balance :cents, #open :count',
+            'ExpressionAttributeNames': LEDGER_ATTRIBUTE_NAMES,
+            'ExpressionAttributeValues': {':cents': cents, ':count': count}
+        }
+    }
+
+def debt_added(creditor_id, debtor_id, cents):
+    # TransactWriteItems actions recording that debtor_id now owes creditor_id another amount in cents
+    return [ledger_update(creditor_id, debtor_id, cents, 1), ledger_update(debtor_id, creditor_id, -cents, 1)]
+
+def debt_settled(creditor_id, debtor_id, cents, count=1):
+    # TransactWriteItems actions removing paid splits (count of them, adding up to cents) from both sides of the balance
+    return [ledger_update(creditor_id, debtor_id, -cents, -count), ledger_update(debtor_id, creditor_id, cents, -count)]
+
+def get_balances(ledger_table, user_id):
+    # Counterparty -> net balance in cents for every user the given user has open splits with
+    balances = {}
+    for items, _ in query_pages(ledger_table.name, Key('userID').eq(user_id)):
+        for item in items:
+            balance = record_balance(item)
+            if item.get('openSplits', 0) > 0 or balance != 0:
+                balances[item['counterpartyID']] = balance
+    return balances
+
+def get_balance(ledger_table, user_id, counterparty_id):
+    # (net balance in cents, open splits) of one pair
+    item = ledger_table.get_item(Key={'userID': user_id, 'counterpartyID': counterparty_id}).get('Item', {})
+    return record_balance(item), int(item.get('openSplits', 0))
+
+def query_open_splits(transactions_table, debtor_id, creditor_id, attributes):
+    # The unpaid split rows debtor_id owes creditor_id, or owes anyone when creditor_id is None, filtered
+    # server-side so only those rows are returned
+    if creditor_id is None:
+        filter_condition = Attr('came_from').exists() & Attr('is_paid').eq(False)
+    else:
+        filter_condition = Attr('came_from').eq(creditor_id) & Attr('is_paid').eq(False)
+    for items, _ in query_user_transaction_pages(transactions_table, debtor_id, attributes,
+                                                 filter_condition=filter_condition):
+        for item in items:
+            yield item
+
+def is_open_split(item):
+    # A split row still owed to its creator; the creator's own share is stored as paid
+    return bool(item.get('came_from')) and item['came_from'] != item['userID'] and not item.get('is_paid', False)
@@ -0,0 +1,164 @@
+import base64
+import binascii
+import json
+from boto3.dynamodb.conditions import Attr
+from amountFormat import AMOUNT_ATTRIBUTES, present_transaction
+from apiResponse import encode_body, compress_response
+from itemCodec import query_pages
+from transactionStore import USER_INDEX_NAME, date_key_condition, parse_date_window
+from instrumentation import instrumented
+
+table_name = 'Transactions'
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Filtered pages stop after this many reads even when short, so every page has a bounded cost
+MAX_READS_PER_PAGE = 4
+
+# Fields a client can ask for; 'amount' is read from either stored amount format
+LIST_FIELDS = ['id', 'amount', 'category', 'date', 'title', 'userID', 'is_paid', 'came_from']
+
+def read_params(event):
+    # Query string parameters, overridden by a JSON body like the other GET routes take
+    params = dict(event.get('queryStringParameters') or {})
+    if event.get('body'):
+        params.update(json.loads(event['body']))
+    return params
+
+def parse_fields(value):
+    # The requested projection as a list, or (None, error)
+    if not value:
+        return LIST_FIELDS, None
+    fields = value.split(',') if isinstance(value, str) else value
+    fields = list(dict.fromkeys(field.strip() for field in fields if field.strip()))
+    unknown = [field for field in fields if field not in LIST_FIELDS]
+    if unknown or not fields:
+        return None, f"Unknown fields {', '.join(unknown)}; choose from {', '.join(LIST_FIELDS)}"
+    return fields, None
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', '1', 'yes'):
+        return True
+    if str(value).lower() in ('false', '0', 'no'):
+        return False
+    return None
+
+def build_filter(params):
+    # Category and paid-status filters, or (None, error) when one is malformed
+    conditions = []
+    if params.get('category'):
+        categories = params['category']
+        categories = categories.split(',') if isinstance(categories, str) else categories
+        conditions.append(Attr('category').is_in(list(categories)))
+    if params.get('paid') not in (None, ''):
+        paid = parse_bool(params['paid'])
+        if paid is None:
+            return None, "Invalid paid filter, expected true or false"
+        # Rows that were never part of a split have no is_paid and count as unpaid, as in markPaid
+        conditions.append(Attr('is_paid').eq(True) if paid else
+                          Attr('is_paid').not_exists() | Attr('is_paid').eq(False))
+
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+    return condition, None
+
+def encode_cursor(last_key):
+    # Opaque to clients: the raw LastEvaluatedKey of the index, base64url encoded
+    if not last_key:
+        return None
+    text = json.dumps(last_key, separators=(',', ':'), sort_keys=True)
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, user_id):
+    # The start key of a cursor, or None when it is malformed or belongs to another user's listing
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        start_key = json.loads(text)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(start_key, dict) or start_key.get('userID') != {'S': user_id}:
+        return None
+    return start_key
+
+def read_page(user_id, page_size, start_key, fields, filter_condition, start_date, end_date, newest_first):
+    # Read up to page_size matching rows. Each query asks for exactly the rows still missing, so its
+    # LastEvaluatedKey is the resume point of the page and no read row is ever skipped
+    attributes = [field for field in fields if field != 'amount']
+    if 'amount' in fields:
+        attributes += AMOUNT_ATTRIBUTES
+
+    items = []
+    key_condition = date_key_condition(user_id, start_date, end_date)
+    for _ in range(MAX_READS_PER_PAGE):
+        pages = query_pages(table_name, key_condition, attributes, index_name=USER_INDEX_NAME,
+                            page_size=page_size - len(items), start_key=start_key,
+                            filter_condition=filter_condition, scan_forward=not newest_first)
+        page_items, start_key = next(pages)
+        items.extend(page_items)
+        if not start_key or len(items) >= page_size:
+            break
+    return items, start_key
+
+def present(item, fields):
+    row = present_transaction(item) if 'amount' in fields else item
+    return {field: row[field] for field in fields if field in row}
+
+@instrumented
+def lambda_handler(event, context):
+    params = read_params(event)
+    user_id = params.get('userID')
+    if not user_id:
+        return {
+            'statusCode': 400,
+            'body': encode_body('Missing userID')
+        }
+
+    try:
+        page_size = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        page_size = 0
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return {
+            'statusCode': 400,
+            'body': encode_body(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        }
+
+    fields, error = parse_fields(params.get('fields'))
+    if not error:
+        filter_condition, error = build_filter(params)
+    if not error:
+        start_date, end_date, error = parse_date_window(params)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': encode_body(error)
+        }
+
+    start_key = None
+    if params.get('cursor'):
+        start_key = decode_cursor(params['cursor'], user_id)
+        if start_key is None:
+            return {
+                'statusCode': 400,
+                'body': encode_body('Invalid cursor')
+            }
+
+    # Newest first unless the client asks for oldest first
+    newest_first = params.get('order', 'desc') != 'asc'
+    items, last_key = read_page(user_id, page_size, start_key, fields, filter_condition, start_date, end_date,
+                                newest_first)
+
+    return compress_response(event, {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': encode_body({
+            'userID': user_id,
+            'transactions': [present(item, fields) for item in items],
+            'count': len(items),
+            # Pass back as 'cursor' to read the next page; null once the listing is complete
+            'cursor': encode_cursor(last_key)
+        })
+    })
@@ -1,76 +1,229 @@
-import boto3
+import os
+import time
 import uuid
+import hashlib
 from decimal import Decimal
 import json
-from datetime import datetime
-
-def create_split_transactions(transaction_table, amount, category, date, title, user_ids, creator_id):
-    total_people = len(user_ids) + 1  # Including the creator
-    split_amount = Decimal(str(round(amount / total_people, 2)))
-    responses = []
-
-    # Transaction for the creator
-    creator_transaction_id = str(uuid.uuid4())
-    creator_transaction = {
-        'id': creator_transaction_id,
-        'amount': split_amount,
-        'category': category,
-        'date': date,
-        'title': title,
-        'userID': creator_id,
-        'is_paid': True,
-        'came_from': creator_id
-    }
-    transaction_table.put_item(Item=creator_transaction)
-    responses.append(creator_transaction)
-
-    # Transactions for each participant
-    for user_id in user_ids:
-        participant_transaction_id = str(uuid.uuid4())
-        participant_transaction = {
-            'id': participant_transaction_id,
-            'amount': split_amount,
+from botocore.exceptions import ClientError
+from amountFormat import to_cents, present_transaction
+from apiResponse import encode_body
+from transactionStore import load_transactions, normalize_date, transaction_put
+from rollupStore import rollup_update
+from ledgerStore import debt_added, is_open_split
+from responseCache import version_bump
+from userStore import find_users_by_contacts, get_users
+from awsClients import get_table
+from instrumentation import instrumented
+
+# People written per TransactWriteItems call (100 actions at most); each person costs a row put, a rollup update,
+# a cache version bump and two balance ledger updates, and every call also carries the request guard
+PEOPLE_PER_TRANSACTION = 19
+
+# One item per idempotency key holding a fingerprint of the split written under it (see
+# aws_dynamodb_table.QattahRequests in main.tf), so a reused key is recognised long after ClientRequestToken expires.
+# Items are expired by DynamoDB TTL on 'expiresAt'; the rows' own IDs still catch a key reused after that
+REQUESTS_TABLE_NAME = 'QattahRequests'
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL', str(7 * 24 * 3600)))
+
+# Row attributes that make up a split; is_paid is left out since markPaid changes it afterwards
+SPLIT_FIELDS = ['userID', 'amountCents', 'category', 'date', 'title', 'came_from']
+
+def get_idempotency_key(body):
+    # Only a key the client sends makes a retry map to the same rows; without one every request is a new split,
+    # since two identical splits can both be real
+    if body.get('idempotencyKey'):
+        return str(body['idempotencyKey'])
+    return uuid.uuid4().hex
+
+def split_amount_cents(amount, total_people):
+    # Split in whole cents and hand the remainder out one cent at a time, so the shares add up exactly
+    total_cents = to_cents(amount)
+    share, remainder = divmod(total_cents, total_people)
+    return [share + 1 if index < remainder else share for index in range(total_people)]
+
+def build_split_rows(amount, category, date, title, user_ids, creator_id, idempotency_key):
+    # The creator comes first, then participants in request order, which fixes who receives remainder cents
+    people = [creator_id] + [user_id for user_id in dict.fromkeys(user_ids) if user_id != creator_id]
+    shares = split_amount_cents(amount, len(people))
+
+    rows = []
+    for user_id, share in zip(people, shares):
+        rows.append({
+            # Row IDs are derived from the idempotency key so a retry rewrites the same rows
+            'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f'qattah:{idempotency_key}:{user_id}')),
+            'amountCents': share,
             'category': category,
             'date': date,
             'title': title,
             'userID': user_id,
-            'is_paid': False,
+            'is_paid': user_id == creator_id,
             'came_from': creator_id
+        })
+    return rows
+
+def split_fingerprint(rows):
+    # Hash of who owes what for which purchase, in row order
+    fields = [{field: row[field] for field in SPLIT_FIELDS} for row in rows]
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+def request_guard(idempotency_key, fingerprint):
+    # TransactWriteItems action recording the split behind a key; cancels if the key holds a different split
+    return {
+        'Put': {
+            'TableName': REQUESTS_TABLE_NAME,
+            'Item': {'idempotencyKey': idempotency_key, 'fingerprint': fingerprint,
+                     'expiresAt': int(time.time()) + IDEMPOTENCY_KEY_TTL_SECONDS},
+            'ConditionExpression': 'attribute_not_exists(idempotencyKey) OR fingerprint = :fingerprint',
+            'ExpressionAttributeValues': {':fingerprint': fingerprint}
         }
-        response = transaction_table.put_item(Item=participant_transaction)
-        responses.append(response)
+    }
+
+def write_split_batch(transaction_table, rows, request_token, guard):
+    # 'created', 'replayed' when an earlier attempt already wrote the batch, or 'conflict' when the idempotency
+    # key was used for a different split
+    actions = [guard]
+    for row in rows:
+        actions.append(transaction_put(row, only_if_new=True))
+        actions.append(rollup_update(row['userID'], row['category'], row['amountCents']))
+        actions.append(version_bump(row['userID']))
+        if is_open_split(row):
+            actions.extend(debt_added(row['came_from'], row['userID'], row['amountCents']))
+
+    try:
+        transaction_table.meta.client.transact_write_items(
+            TransactItems=actions,
+            ClientRequestToken=request_token
+        )
+        return 'created'
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = e.response.get('CancellationReasons', [])
+        if any(reason.get('Code') not in ('None', 'ConditionalCheckFailed') for reason in reasons):
+            raise
+        if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return 'conflict'
+        # Otherwise only the row puts failed their conditions: an earlier attempt already wrote the batch
+        return 'replayed'
+
+def create_split_transactions(transaction_table, amount, category, date, title, user_ids, creator_id, idempotency_key):
+    # Returns (rows as stored, how many an earlier attempt had written), or (None, 0) when the idempotency key
+    # belongs to a different split. Groups of more than PEOPLE_PER_TRANSACTION people take several independent
+    # transactions, so an error raised after the first leaves the group partly written until the request is
+    # retried with the same key
+    rows = build_split_rows(amount, category, date, title, user_ids, creator_id, idempotency_key)
+    guard = request_guard(idempotency_key, split_fingerprint(rows))
+
+    # Write the rows in transactional batches; each batch is all-or-nothing and safe to replay
+    replayed = []
+    for start in range(0, len(rows), PEOPLE_PER_TRANSACTION):
+        batch = rows[start:start + PEOPLE_PER_TRANSACTION]
+        request_token = str(uuid.uuid5(uuid.NAMESPACE_URL, f'qattah:{idempotency_key}:batch:{start}'))
+        outcome = write_split_batch(transaction_table, batch, request_token, guard)
+        if outcome == 'conflict':
+            return None, 0
+        if outcome == 'replayed':
+            replayed.extend(batch)
+    if not replayed:
+        return rows, 0
 
-    return responses
+    # Answer a replay with the rows as stored. Keys used before the guard existed have no fingerprint, so a
+    # missing or different row is the only sign of a different split there
+    stored = {item['id']: item for item in load_transactions(transaction_table, [row['id'] for row in replayed])}
+    if any(row['id'] not in stored or any(stored[row['id']].get(field) != row[field] for field in SPLIT_FIELDS)
+           for row in replayed):
+        return None, 0
+    return [stored.get(row['id'], row) for row in rows], len(replayed)
 
+@instrumented
 def lambda_handler(event, context):
-    dynamodb = boto3.resource('dynamodb')
-    transaction_table = dynamodb.Table('Transactions')
+    transaction_table = get_table('Transactions')
     body = json.loads(event['body'])
     # Extract transaction details from the event
     amount = Decimal(str(body['amount']))
     category = body['category']
     date = body['date']
     title = body['title']
-    user_ids = body['users']
+    user_ids = list(body.get('users') or [])
+    contacts = body.get('contacts') or []
     creator_id = body['creatorID']
 
-    # Validate category and user_ids
-    if not all([amount, category, date, title, user_ids, creator_id]):
+    # Validate category and participants, given as user IDs and/or emails and phones
+    if not all([amount, category, date, title, creator_id]) or not (user_ids or contacts):
         return {
             'statusCode': 400,
-            'body': json.dumps('Missing one or more transaction details')
+            'body': encode_body('Missing one or more transaction details')
+        }
+
+    date = normalize_date(date)
+    if not date:
+        return {
+            'statusCode': 400,
+            'body': encode_body('Invalid transaction date, expected YYYY-MM-DD')
         }
 
     if category.lower() != "qattah":
         return {
             'statusCode': 400,
-            'body': json.dumps('Invalid category. This endpoint is for Qattah transactions only.')
+            'body': encode_body('Invalid category. This endpoint is for Qattah transactions only.')
+        }
+
+    # Resolve participants invited by email or phone, one indexed query per contact
+    if contacts:
+        found = find_users_by_contacts(contacts)
+        unknown_contacts = [contact for contact, user in found.items() if not user]
+        if unknown_contacts:
+            return {
+                'statusCode': 400,
+                'body': encode_body({'message': 'No user found for some contacts', 'unknownContacts': unknown_contacts})
+            }
+        user_ids.extend(user['id'] for user in found.values())
+
+    # Every participant must exist: the whole group is checked with one BatchGetItem, or none for cached users
+    users = get_users([creator_id] + user_ids)
+    unknown_users = [user_id for user_id in dict.fromkeys([creator_id] + user_ids) if user_id not in users]
+    if unknown_users:
+        return {
+            'statusCode': 400,
+            'body': encode_body({'message': 'Unknown users in the Qattah', 'unknownUsers': unknown_users})
+        }
+
+    # Shares are stored in whole cents, so the amount has to give everyone in the group at least one cent
+    if abs(to_cents(amount)) < len(dict.fromkeys([creator_id] + user_ids)):
+        return {
+            'statusCode': 400,
+            'body': encode_body('Qattah amount must be at least one cent per person')
         }
 
     # Split the transaction among users including the creator
-    responses = create_split_transactions(transaction_table, amount, category, date, title, user_ids, creator_id)
+    idempotency_key = get_idempotency_key(body)
+    try:
+        rows, replayed = create_split_transactions(transaction_table, amount, category, date, title, user_ids,
+                                                   creator_id, idempotency_key)
+    except ClientError as e:
+        # The same idempotency key was reused for a different split within the ClientRequestToken window
+        if e.response['Error']['Code'] != 'IdempotentParameterMismatchException':
+            # Earlier batches of a large group may already be stored; the key lets the client finish the group,
+            # including a key minted for a request that sent none
+            return {
+                'statusCode': 503,
+                'body': encode_body({
+                    'message': 'Qattah transactions could not all be created; retry with the same idempotencyKey',
+                    'idempotencyKey': idempotency_key
+                })
+            }
+        rows = None
+    if rows is None:
+        return {
+            'statusCode': 409,
+            'body': encode_body('Idempotency key was already used for a different Qattah request')
+        }
 
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Qattah transactions created successfully', 'responses': responses})
+        'body': encode_body({
+            'message': 'Qattah transactions created successfully',
+            'responses': [present_transaction(row) for row in rows],
+            'alreadyCreated': replayed
+        })
     }
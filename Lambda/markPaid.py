@@ -1,29 +1,219 @@
-import boto3
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from amountFormat import AMOUNT_ATTRIBUTE, AMOUNT_ATTRIBUTES, LEGACY_AMOUNT_ATTRIBUTE, present_transaction, stored_cents
+from apiResponse import encode_body
+from transactionStore import load_transactions
+from awsClients import get_table
+from ledgerStore import debt_settled, is_open_split, query_open_splits
+from responseCache import bump_data_version
+from instrumentation import instrumented
+
+MAX_TRANSACTION_ACTIONS = 100  # TransactWriteItems limit
+MAX_BULK_TRANSACTIONS = 1000
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 5
+
+# What settling a split needs (the paid_update condition and the ledger delta) plus what the response shows
+SETTLEMENT_ATTRIBUTES = ['id', 'userID', 'came_from', 'is_paid', 'category', 'date', 'title'] + AMOUNT_ATTRIBUTES
+
+def paid_update(transaction_table_name, item):
+    # Conditional TransactWriteItems action that flips an open split to paid; the condition pins the row to the
+    # values the ledger update was computed from, so a concurrent change cancels the whole transaction
+    if not is_open_split(item):
+        # Rows without a balance behind them only have to belong to the user
+        return {
+            'Update': {
+                'TableName': transaction_table_name,
+                'Key': {'id': item['id']},
+                'UpdateExpression': 'SET is_paid = :val',
+                'ConditionExpression': 'userID = :user_id',
+                'ExpressionAttributeValues': {':val': True, ':user_id': item['userID']}
+            }
+        }
+    # Rows not migrated to whole cents yet are pinned on their legacy amount
+    amount_attribute = AMOUNT_ATTRIBUTE if AMOUNT_ATTRIBUTE in item else LEGACY_AMOUNT_ATTRIBUTE
+    return {
+        'Update': {
+            'TableName': transaction_table_name,
+            'Key': {'id': item['id']},
+            'UpdateExpression': 'SET is_paid = :val',
+            'ConditionExpression': 'userID = :user_id AND came_from = :creator AND #amount = :amount AND is_paid = :unpaid',
+            'ExpressionAttributeNames': {'#amount': amount_attribute},
+            'ExpressionAttributeValues': {
+                ':val': True,
+                ':user_id': item['userID'],
+                ':creator': item['came_from'],
+                ':amount': item[amount_attribute],
+                ':unpaid': False
+            }
+        }
+    }
+
+def user_pair(item):
+    # Both directions of a debt share the same two ledger records
+    return tuple(sorted((item['came_from'], item['userID'])))
+
+def settlement_batches(items):
+    # Pack rows into transactions of at most 100 actions: one update per row plus two ledger updates per pair
+    # of users with open splits in the batch. Sorting by pair keeps the number of pairs per batch low
+    batch, pairs = [], set()
+    # A transaction may not touch the same row twice
+    unique_items = {item['id']: item for item in items}.values()
+    for item in sorted(unique_items, key=lambda item: user_pair(item) if is_open_split(item) else ()):
+        new_pairs = pairs | {user_pair(item)} if is_open_split(item) else pairs
+        if batch and len(batch) + 1 + 2 * len(new_pairs) > MAX_TRANSACTION_ACTIONS:
+            yield batch
+            batch, pairs = [], set()
+            new_pairs = {user_pair(item)} if is_open_split(item) else pairs
+        batch.append(item)
+        pairs = new_pairs
+    if batch:
+        yield batch
+
+def settle_batch(transaction_table, batch):
+    # Mark a batch of rows paid in one transaction, returning (paid items, [(item, reason)] failures).
+    # Rows whose condition fails are reported and dropped, and the rest of the batch is retried
+    failures = []
+    for attempt in range(MAX_ATTEMPTS):
+        if not batch:
+            return [], failures
+        # Net the settled cents per pair, as owed to the first user of the pair
+        settled = {}
+        for item in filter(is_open_split, batch):
+            pair = user_pair(item)
+            totals = settled.setdefault(pair, [0, 0])
+            totals[0] += stored_cents(item) if item['came_from'] == pair[0] else -stored_cents(item)
+            totals[1] += 1
+        actions = [paid_update(transaction_table.name, item) for item in batch]
+        for (first_id, second_id), (cents, count) in settled.items():
+            actions.extend(debt_settled(first_id, second_id, cents, count))
+
+        try:
+            transaction_table.meta.client.transact_write_items(TransactItems=actions)
+            return batch, failures
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            # Reasons are listed in action order, so the first len(batch) belong to the row updates
+            reasons = e.response.get('CancellationReasons', [])
+            failed = {index for index, reason in enumerate(reasons[:len(batch)])
+                      if reason.get('Code') == 'ConditionalCheckFailed'}
+            failures.extend((batch[index], 'Transaction is no longer unpaid or has changed') for index in sorted(failed))
+            batch = [item for index, item in enumerate(batch) if index not in failed]
+            # Conflicts and throttling cancel the batch without a failed condition; back off before retrying
+            if not failed:
+                time.sleep(min(0.05 * (2 ** attempt), 1))
+
+    failures.extend((item, 'Transaction could not be marked as paid, retry the request') for item in batch)
+    return [], failures
+
+def mark_items_paid(transaction_table, items):
+    # Mark many rows paid in parallel transactional batches, returning (paid items, failures). Batches are
+    # independent, so a failed condition only drops its own row and latency stays flat as the list grows
+    paid, failures = [], []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for batch_paid, batch_failures in executor.map(lambda batch: settle_batch(transaction_table, batch),
+                                                       list(settlement_batches(items))):
+            paid.extend(batch_paid)
+            failures.extend(batch_failures)
+    return paid, failures
+
+def mark_transactions_as_paid(transaction_table, user_id, transaction_ids=None, creator_id=None):
+    # Bulk variant: the given rows, or every unpaid split the user owes creator_id. Returns (updated rows, failures)
+    if creator_id:
+        items = list(query_open_splits(transaction_table, user_id, creator_id, SETTLEMENT_ATTRIBUTES))
+        failures = []
+    else:
+        items = load_transactions(transaction_table, transaction_ids)
+        found = {item['id'] for item in items if item.get('userID') == user_id}
+        items = [item for item in items if item['id'] in found]
+        failures = [({'id': transaction_id}, 'Transaction not found for this user')
+                    for transaction_id in dict.fromkeys(transaction_ids) if transaction_id not in found]
+
+    # Rows that are already paid need no write
+    unpaid = [item for item in items if not item.get('is_paid', False)]
+    paid, write_failures = mark_items_paid(transaction_table, unpaid)
+    updated = [item for item in items if item.get('is_paid', False)] + [{**item, 'is_paid': True} for item in paid]
+    return updated, failures + write_failures
 
 def mark_transaction_as_paid(transaction_table, transaction_id, user_id):
-    response = transaction_table.update_item(
-        Key={'id': transaction_id},
-        UpdateExpression='SET is_paid = :val',
-        ExpressionAttributeValues={':val': True, ':user_id': user_id},  # Define :user_id attribute value
-        ConditionExpression='userID = :user_id',  # Use :user_id in the ConditionExpression
-        ReturnValues='UPDATED_NEW'
-    )
-    return response
+    item = transaction_table.get_item(Key={'id': transaction_id}, ConsistentRead=True).get('Item')
+    if not item or item.get('userID') != user_id:
+        return None
+
+    if not is_open_split(item):
+        # Not an outstanding split, so there is no balance to settle
+        response = transaction_table.update_item(
+            Key={'id': transaction_id},
+            UpdateExpression='SET is_paid = :val',
+            ExpressionAttributeValues={':val': True, ':user_id': user_id},  # Define :user_id attribute value
+            ConditionExpression='userID = :user_id',  # Use :user_id in the ConditionExpression
+            ReturnValues='UPDATED_NEW'
+        )
+        return response
+
+    # Mark the row paid and take it off both sides of the balance ledger in one transaction
+    transaction_table.meta.client.transact_write_items(TransactItems=[
+        paid_update(transaction_table.name, item),
+        *debt_settled(item['came_from'], user_id, stored_cents(item))
+    ])
+    return {'Attributes': {'is_paid': True}}
 
+@instrumented
 def lambda_handler(event, context):
-    dynamodb = boto3.resource('dynamodb')
-    transaction_table = dynamodb.Table('Transactions')
+    transaction_table = get_table('Transactions')
     body = json.loads(event['body'])
     # Extract details from the event
 
-    transaction_id = body['transactionID']
     user_id = body['userID']
 
+    # Bulk mode: a list of transaction IDs, or everything the user still owes one creator
+    if 'transactionIDs' in body or 'creatorID' in body:
+        transaction_ids = body.get('transactionIDs') or []
+        if not body.get('creatorID') and not transaction_ids:
+            return {
+                'statusCode': 400,
+                'body': encode_body('Provide transactionIDs or creatorID')
+            }
+        if len(transaction_ids) > MAX_BULK_TRANSACTIONS:
+            return {
+                'statusCode': 400,
+                'body': encode_body(f'At most {MAX_BULK_TRANSACTIONS} transactions can be marked as paid per request')
+            }
+        updated, failures = mark_transactions_as_paid(transaction_table, user_id, transaction_ids, body.get('creatorID'))
+        if updated:
+            bump_data_version(user_id)
+        return {
+            'statusCode': 200,
+            'body': encode_body({
+                'message': f'{len(updated)} transactions marked as paid',
+                'updated': [present_transaction(item) for item in updated],
+                'failed': [{'transactionID': item['id'], 'error': reason} for item, reason in failures]
+            })
+        }
+
+    transaction_id = body['transactionID']
+
     # Update the transaction
-    response = mark_transaction_as_paid(transaction_table, transaction_id, user_id)
+    try:
+        response = mark_transaction_as_paid(transaction_table, transaction_id, user_id)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('TransactionCanceledException', 'ConditionalCheckFailedException'):
+            raise
+        return {
+            'statusCode': 409,
+            'body': encode_body('Transaction changed while being marked as paid, retry the request')
+        }
+    if response is None:
+        return {
+            'statusCode': 404,
+            'body': encode_body('Transaction not found for this user')
+        }
+    bump_data_version(user_id)
 
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Transaction marked as paid', 'response': response})
+        'body': encode_body({'message': 'Transaction marked as paid', 'response': response})
     }
@@ -0,0 +1,83 @@
+import json
+import sys
+from botocore.exceptions import ClientError
+from amountFormat import AMOUNT_ATTRIBUTE, LEGACY_AMOUNT_ATTRIBUTE, to_cents
+from transactionStore import TRANSACTIONS_TABLE_NAME, parallel_scan
+from rollupStore import ROLLUP_TABLE_NAME, TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE
+from ledgerStore import LEDGER_TABLE_NAME, BALANCE_ATTRIBUTE, LEGACY_BALANCE_ATTRIBUTE
+from awsClients import get_table
+from apiResponse import encode_body
+from responseCache import bump_data_version
+from instrumentation import instrumented
+
+# (table, key attributes, integer cents attribute, legacy Decimal attribute) for every record that holds money
+MIGRATIONS = [
+    (TRANSACTIONS_TABLE_NAME, ['id'], AMOUNT_ATTRIBUTE, LEGACY_AMOUNT_ATTRIBUTE),
+    (ROLLUP_TABLE_NAME, ['userID', 'category'], TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE),
+    (LEDGER_TABLE_NAME, ['userID', 'counterpartyID'], BALANCE_ATTRIBUTE, LEGACY_BALANCE_ATTRIBUTE)
+]
+
+def fold_legacy_amounts(table, key_attributes, attribute, legacy_attribute, dry_run, total_segments):
+    # Move every legacy Decimal value into the integer cents attribute, returning (migrated, users with rounded values).
+    # ADD keeps cents already recorded on the same item, e.g. a rollup updated since the new format shipped
+    migrated = 0
+    rounded_users = set()
+    attributes = list(dict.fromkeys(key_attributes + ['userID', legacy_attribute]))
+
+    for item in parallel_scan(table, attributes, total_segments):
+        legacy = item.get(legacy_attribute)
+        if legacy is None:
+            continue
+        cents = to_cents(legacy)
+        if cents != legacy * 100:
+            rounded_users.add(item['userID'])
+
+        if not dry_run:
+            try:
+                # Only fold the value if nobody changed it since it was scanned
+                table.update_item(
+                    Key={key: item[key] for key in key_attributes},
+                    UpdateExpression='ADD #cents :cents REMOVE #legacy',
+                    ConditionExpression='#legacy = :current',
+                    ExpressionAttributeNames={'#cents': attribute, '#legacy': legacy_attribute},
+                    ExpressionAttributeValues={':cents': cents, ':current': legacy}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                continue
+        migrated += 1
+    return migrated, rounded_users
+
+def migrate_amounts(dry_run=False, total_segments=4):
+    # One-time migration of transaction amounts, rollup totals and ledger balances to whole cents
+    result = {'dryRun': dry_run}
+    rounded_users = set()
+    for table_name, key_attributes, attribute, legacy_attribute in MIGRATIONS:
+        migrated, rounded = fold_legacy_amounts(get_table(table_name), key_attributes, attribute, legacy_attribute,
+                                                dry_run, total_segments)
+        result[table_name] = migrated
+        rounded_users |= rounded
+
+    # Sub-cent amounts were rounded row by row, so totals folded from their exact sums can be off by a cent;
+    # run rebuildRollups and reconcileLedger with --repair afterwards when this is non-zero
+    result['usersWithRoundedAmounts'] = len(rounded_users)
+    if not dry_run:
+        for user_id in rounded_users:
+            bump_data_version(user_id)
+    return result
+
+@instrumented
+def lambda_handler(event, context):
+    result = migrate_amounts(
+        dry_run=bool(event.get('dryRun', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Run the migration from the command line: python migrateAmounts.py [--dry-run]
+if __name__ == '__main__':
+    print(json.dumps(migrate_amounts(dry_run='--dry-run' in sys.argv), indent=2))
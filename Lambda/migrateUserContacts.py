@@ -0,0 +1,89 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from userStore import (
+    USERS_TABLE_NAME, CONTACT_NORMALIZERS, contact_claim, contacts_unchanged, run_transaction
+)
+from transactionStore import parallel_scan
+from awsClients import get_table
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+MAX_WORKERS = 8
+
+def contact_changes(user):
+    # (normalized contacts, fields that cannot be normalized) of a user row
+    contacts = {}
+    invalid = []
+    for field, normalize in CONTACT_NORMALIZERS.items():
+        if user.get(field) is None:
+            continue
+        contacts[field] = normalize(user[field])
+        if not contacts[field]:
+            del contacts[field]
+            invalid.append(field)
+    return contacts, invalid
+
+def migrate_user(user, dry_run):
+    # Store a user's contacts normalized and claim their guards in one transaction, returning
+    # (normalized, contact fields held by another user, fields that cannot be normalized)
+    contacts, invalid = contact_changes(user)
+    normalized = any(user[field] != value for field, value in contacts.items())
+    if dry_run or not contacts:
+        return normalized, [], invalid
+
+    duplicates = []
+    while True:
+        # The row is only rewritten if its contacts are still the ones scanned
+        fields = [field for field in contacts if field not in duplicates]
+        condition, names, values = contacts_unchanged(user, list(contacts))
+        update = {
+            'TableName': USERS_TABLE_NAME,
+            'Key': {'id': user['id']},
+            'UpdateExpression': 'SET ' + ', '.join(f'#c{index} = :n{index}' for index in range(len(contacts))),
+            'ConditionExpression': condition,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': {**values, **{f':n{index}': value for index, value in enumerate(contacts.values())}}
+        }
+        actions = [{'Update': update}] + [contact_claim(field, contacts[field], user['id']) for field in fields]
+        failed = run_transaction(actions)
+        if 0 in failed:
+            # Changed since the scan, through updateUser, which claims the guards itself
+            return False, [], invalid
+        taken = [field for index, field in enumerate(fields, start=1) if index in failed]
+        if not taken:
+            return normalized, duplicates, invalid
+        # Another user holds the contact: keep this user's value unguarded and report it
+        duplicates.extend(taken)
+
+def migrate_user_contacts(dry_run=False, total_segments=4):
+    # One-time migration normalizing every user's email and phone and creating the guard items that keep them
+    # unique. Users sharing a contact are reported; the first one migrated keeps the guard
+    users = [user for user in parallel_scan(get_table(USERS_TABLE_NAME), ['id'] + list(CONTACT_NORMALIZERS),
+                                            total_segments)
+             if any(user.get(field) is not None for field in CONTACT_NORMALIZERS)]
+
+    result = {'dryRun': dry_run, 'users': len(users), 'normalized': 0, 'duplicates': [], 'invalid': []}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for user, (normalized, duplicates, invalid) in zip(users, executor.map(lambda user: migrate_user(user, dry_run),
+                                                                               users)):
+            result['normalized'] += normalized
+            result['duplicates'].extend({'userID': user['id'], 'field': field, 'value': user[field]}
+                                        for field in duplicates)
+            result['invalid'].extend({'userID': user['id'], 'field': field, 'value': user[field]} for field in invalid)
+    return result
+
+@instrumented
+def lambda_handler(event, context):
+    result = migrate_user_contacts(
+        dry_run=bool(event.get('dryRun', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Run the migration from the command line: python migrateUserContacts.py [--dry-run]
+if __name__ == '__main__':
+    print(json.dumps(migrate_user_contacts(dry_run='--dry-run' in sys.argv), indent=2))
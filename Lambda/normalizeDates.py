@@ -0,0 +1,67 @@
+import json
+import sys
+from botocore.exceptions import ClientError
+from transactionStore import TRANSACTIONS_TABLE_NAME, normalize_date, parallel_scan
+from awsClients import get_table
+from responseCache import bump_data_version
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+def normalize_dates(dry_run=False, total_segments=4):
+    # One-time migration rewriting free-form transaction dates to the ISO form used by the date index
+    table = get_table(TRANSACTIONS_TABLE_NAME)
+    updated = 0
+    unparseable = []
+    changed_users = set()
+
+    for item in parallel_scan(table, ['id', 'userID', 'date'], total_segments):
+        current = item.get('date')
+        normalized = normalize_date(current)
+        if not normalized:
+            unparseable.append({'id': item['id'], 'date': str(current)})
+            continue
+        if normalized == current:
+            continue
+
+        if not dry_run:
+            try:
+                # Only rewrite the row if nobody changed its date since it was scanned
+                table.update_item(
+                    Key={'id': item['id']},
+                    UpdateExpression='SET #date = :normalized',
+                    ConditionExpression='#date = :current',
+                    ExpressionAttributeNames={'#date': 'date'},
+                    ExpressionAttributeValues={':normalized': normalized, ':current': current}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                continue
+            changed_users.add(item['userID'])
+        updated += 1
+
+    # Date windows over the rewritten rows now return different answers
+    for user_id in changed_users:
+        bump_data_version(user_id)
+
+    return {
+        'updated': updated,
+        'dryRun': dry_run,
+        'unparseableCount': len(unparseable),
+        'unparseable': unparseable
+    }
+
+@instrumented
+def lambda_handler(event, context):
+    result = normalize_dates(
+        dry_run=bool(event.get('dryRun', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Run the migration from the command line: python normalizeDates.py [--dry-run]
+if __name__ == '__main__':
+    print(json.dumps(normalize_dates(dry_run='--dry-run' in sys.argv), indent=2))
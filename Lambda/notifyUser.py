@@ -1,30 +1,36 @@
 import json
-import boto3
+import time
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Attr
-def get_user_email(dynamodb, table_name, user_id):
-    table = dynamodb.Table(table_name)
-    try:
-        response = table.scan(
-            FilterExpression=Attr('ID').eq(user_id)  # Ensure 'ID' is the correct attribute name
-        )
-        items = response.get('Items', [])
-        if not items:
-            print(f"No records found for UserID: {user_id}")
-            return None
-        email = items[0]['email']  # Ensure 'Email' is the correct attribute name
-        if not email:
-            print(f"Email attribute not found in the record for UserID: {user_id}")
-            return None
-        return email
-    except Exception as e:
-        print(f"Error occurred while fetching user email: {e}")
-        return None
+from userStore import get_users
+from awsClients import get_client
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+SENDER_EMAIL = 's201915790@kfupm.edu.sa'  # Replace with your verified sender email address
+TEMPLATE_NAME = 'PaymentNotification'  # aws_ses_template.PaymentNotification in main.tf
+
+BULK_SEND_LIMIT = 50  # Destinations per SendBulkTemplatedEmail call
+
+# Seconds of a batch request spent sending, out of the function's 300 s timeout (aws_lambda_function.notifyUser in
+# main.tf); batches that cannot be sent at the SES rate within it are rejected up front
+SEND_BUDGET_SECONDS = 240
+# Stop sending when less than this much time is left and report the rest as unprocessed
+STOP_THRESHOLD_MS = 30000
+
+_send_rate = None
+
+def get_user_emails(user_ids):
+    # Resolve many users' emails through the shared user cache, fetching the rest with BatchGetItem
+    users = get_users(user_ids)
+    return {user_id: user['email'] for user_id, user in users.items() if user.get('email')}
+
+def get_user_email(user_id):
+    email = get_user_emails([user_id]).get(user_id)
+    if not email:
+        print(f"No email found for UserID: {user_id}")
+    return email
 
 def send_email(ses, sender_email, recipient_email, subject, body):
-    print(sender_email)
-    print("asdasdsadsadsada")
-    print(recipient_email)
     try:
         response = ses.send_email(
             Source=sender_email,
@@ -38,26 +44,110 @@ def send_email(ses, sender_email, recipient_email, subject, body):
     except ClientError as e:
         print(e.response['Error']['Message'])
         return None
+
+def get_send_rate(ses):
+    # The account's SES send rate, looked up once per container
+    global _send_rate
+    if _send_rate is None:
+        try:
+            _send_rate = max(float(ses.get_send_quota()['MaxSendRate']), 1.0)
+        except ClientError:
+            _send_rate = 1.0
+    return _send_rate
+
+def max_bulk_notifications(ses):
+    # Largest batch that the account's send rate gets through within the send budget
+    return max(BULK_SEND_LIMIT, int(get_send_rate(ses) * SEND_BUDGET_SECONDS))
+
+def send_bulk_notifications(ses, notifications, context=None):
+    # Returns (one result per notification in request order, notifications left unsent because the invocation ran
+    # out of time); the unsent ones have status 'unprocessed' in the results
+    emails = get_user_emails([notification['userID'] for notification in notifications])
+
+    results = [None] * len(notifications)
+    destinations = []
+    for position, notification in enumerate(notifications):
+        email = emails.get(notification['userID'])
+        if not email:
+            results[position] = {**notification, 'status': 'failed', 'error': 'No email found for user'}
+            continue
+        destinations.append((position, notification, email))
+
+    # Pace the bulk calls so the number of messages per second stays under the SES send rate
+    send_rate = get_send_rate(ses)
+    next_send_at = time.monotonic()
+    for start in range(0, len(destinations), BULK_SEND_LIMIT):
+        chunk = destinations[start:start + BULK_SEND_LIMIT]
+        delay = next_send_at - time.monotonic()
+        if context and context.get_remaining_time_in_millis() - delay * 1000 < STOP_THRESHOLD_MS:
+            # Hand the rest back to the caller rather than being cut off mid-batch by the timeout
+            for position, notification, _ in destinations[start:]:
+                results[position] = {**notification, 'status': 'unprocessed'}
+            return results, [notification for _, notification, _ in destinations[start:]]
+        if delay > 0:
+            time.sleep(delay)
+        next_send_at = time.monotonic() + len(chunk) / send_rate
+
+        try:
+            response = ses.send_bulk_templated_email(
+                Source=SENDER_EMAIL,
+                Template=TEMPLATE_NAME,
+                DefaultTemplateData=json.dumps({'transactionID': ''}),
+                Destinations=[{
+                    'Destination': {'ToAddresses': [email]},
+                    'ReplacementTemplateData': json.dumps({'transactionID': notification['transactionID']})
+                } for _, notification, email in chunk]
+            )
+            statuses = response.get('Status', [])
+        except ClientError as e:
+            statuses = [{'Status': 'Failed', 'Error': e.response['Error']['Message']}] * len(chunk)
+
+        # SES reports one status per destination, in request order
+        for (position, notification, _), status in zip(chunk, statuses):
+            if status.get('MessageId') and status.get('Status', 'Success') == 'Success':
+                results[position] = {**notification, 'status': 'sent', 'messageId': status.get('MessageId')}
+            else:
+                results[position] = {**notification, 'status': 'failed', 'error': status.get('Error') or status.get('Status')}
+    return results, []
+
+@instrumented
 def lambda_handler(event, context):
-    # Initialize AWS services clients
-    dynamodb = boto3.resource('dynamodb')
-    ses = boto3.client('ses')
+    # Reuse the container's SES client
+    ses = get_client('ses')
     body = json.loads(event['body'])
+
+    # Batch mode: many (userID, transactionID) pairs in one request
+    if 'notifications' in body:
+        notifications = [{'userID': item['userID'], 'transactionID': item['transactionID']}
+                         for item in body['notifications']]
+        limit = max_bulk_notifications(ses)
+        if len(notifications) > limit:
+            return {
+                'statusCode': 400,
+                'body': encode_body(f'At most {limit} notifications per request at the current send rate.')
+            }
+        results, unprocessed = send_bulk_notifications(ses, notifications, context)
+        sent = sum(1 for result in results if result['status'] == 'sent')
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        return {
+            'statusCode': 200,
+            'body': encode_body({'sent': sent, 'failed': failed, 'results': results,
+                                 'unprocessed': unprocessed})
+        }
+
     # Extract data from the event
     user_id = body["userID"]
     transaction_id = body["transactionID"]
     # Configuration
-    user_table_name = 'Users'  # Replace with your user table name
-    sender_email = 's201915790@kfupm.edu.sa'  # Replace with your verified sender email address
     subject = "Payment"
-    body = f"Your transaction with ID {transaction_id} has been processed."
+    message = f"Your transaction with ID {transaction_id} has been processed."
     # Get user email
-    user_email = get_user_email(dynamodb, user_table_name, user_id)
+    user_email = get_user_email(user_id)
     if not user_email:
-        return {'statusCode': 400, 'body': json.dumps(user_email)}
+        return {'statusCode': 400, 'body': encode_body("User email not found.")}
     # Send email
-    email_response = send_email(ses, sender_email, user_email, subject, body)
+    email_response = send_email(ses, SENDER_EMAIL, user_email, subject, message)
     if email_response is None:
-        return {'statusCode': 500, 'body': json.dumps("Failed to send email.")}
+        return {'statusCode': 500, 'body': encode_body("Failed to send email.")}
     # Success response
-    return {'statusCode': 200, 'body': json.dumps("Email sent successfully.")}
\ No newline at end of file
+    return {'statusCode': 200, 'body': encode_body("Email sent successfully.")}
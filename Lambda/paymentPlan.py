@@ -1,13 +1,46 @@
 import json
-import boto3
-from decimal import Decimal
-from boto3.dynamodb.conditions import Attr
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from amountFormat import AMOUNT_ATTRIBUTES, cents_to_amount, stored_cents
+from apiResponse import encode_body
+from transactionStore import parse_date_window, read_user_transactions
+from rollupStore import ROLLUP_TABLE_NAME, get_category_totals
+from archiveStore import read_archived_totals
+from awsClients import get_table
+from responseCache import build_cache_key, get_cached, put_cached, log_cache_stats
+from spendingTrends import spending_trends, trend_window, trends_available
+from instrumentation import instrumented
 
-# Create a DynamoDB resource
-dynamodb = boto3.resource('dynamodb')
 table_name = 'Transactions'
-transactions_table = dynamodb.Table(table_name)
 
+# Plan wording, shared with the nightly batch engine in batchPlans so both produce identical plans
+WELCOME_MESSAGE = "🌟 Welcome to Your Personal Finance Assistant! Let's optimize your finances."
+PLAN_TEXT = {
+    'saving': ("Here's your personalized saving plan aimed at boosting your savings:",
+               "\n\n💡 Saving Plan: Your guide to smart savings and financial growth."),
+    'debt_reduction': ("Debt reduction strategy to help you minimize debts more efficiently:",
+                       "\n\n🚀 Debt Reduction Plan: A strategic approach to minimize and eliminate debt."),
+    'budgeting': ("Customized budgeting plan to maintain a balanced financial life:",
+                  "\n\n📊 Budgeting Plan: Crafting a balanced and sustainable financial lifestyle."),
+    'investment': ("Investment guidance to help grow your wealth:",
+                   "\n\n📈 Investment Plan: Unlocking the potential of your finances for future prosperity.")
+}
+
+SAVING_SUGGESTION = "Reduce by 10% in {category} (currently ${amount:.2f}, {percentage:.2f}% of total). Potential saving: ${reduction:.2f} per month."
+DEBT_REDUCTION_SUGGESTION = "Consider reducing {category} expenses (${amount:.2f}, {percentage:.2f}% of total) for faster debt repayment."
+DEBT_REDUCTION_CLOSING = "Prioritize repaying debts first."
+ESSENTIAL_SUGGESTION = "Maintain essential spending in {category} (${amount:.2f}, {percentage:.2f}% of total)."
+NON_ESSENTIAL_SUGGESTION = "Consider reducing non-essential {category} spending by 10% (${reduction:.2f} potential saving)."
+INVESTMENT_SUGGESTION = "Consider investing 5% of {category} spending (${investment:.2f} potential investment) for long-term growth."
+TREND_UP_SUGGESTION = "{category} up {change:.0f}% over {months} months (now ${monthlyAverage:.2f} per month). Forecast for next month: ${forecast:.2f}."
+TREND_DOWN_SUGGESTION = "{category} down {change:.0f}% over {months} months (now ${monthlyAverage:.2f} per month). Forecast for next month: ${forecast:.2f}."
+
+DEBT_REDUCTION_CATEGORIES = ['Entertainment', 'Shopping', 'Luxury Items']
+ESSENTIAL_CATEGORIES = ['Housing', 'Groceries', 'Healthcare']
+NON_ESSENTIAL_CATEGORIES = ['Entertainment', 'Dining Out', 'Shopping']
+NON_DISCRETIONARY_CATEGORIES = ['Housing', 'Groceries', 'Healthcare', 'Savings', 'Debt Repayment']
+
+@instrumented
 def lambda_handler(event, context):
     body = json.loads(event['body'])
     user_id = body['userID']
@@ -17,125 +50,168 @@ def lambda_handler(event, context):
     if not user_id or not plan_type:
         return {
             'statusCode': 400,
-            'body': json.dumps({'error': 'Missing userID or planType'})
+            'body': encode_body({'error': 'Missing userID or planType'})
         }
 
-    # Retrieve and convert transactions for the user
-    transactions = convert_decimals(get_transactions_from_dynamodb(user_id))
+    start_date, end_date, error = parse_date_window(body)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': encode_body({'error': error})
+        }
+
+    # Trends cover the complete months before the current one, so the trend window is part of the cache key
+    # and a plan cached last month is not served once a new month completes
+    trend_months = trend_window(end_date) if trends_available() else None
+
+    # Serve a cached plan while the user's data is unchanged
+    cache_key = build_cache_key(user_id, 'paymentPlan', plan_type, start_date, end_date,
+                                variant=trend_months[2] if trend_months else None)
+    response_body, cache_outcome = get_cached(cache_key)
+    log_cache_stats('paymentPlan', cache_outcome)
+    if response_body is not None:
+        return {
+            'statusCode': 200,
+            'headers': {'X-Cache': cache_outcome},
+            'body': response_body
+        }
 
-    # Analyze spending patterns and calculate percentages
-    spending_summary, total_spent = analyze_spending(transactions)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The trend window is read alongside the summary rather than after it
+        trends_future = executor.submit(get_spending_trends, user_id, *trend_months) if trend_months else None
+
+        if start_date or end_date:
+            # Analyze only the transactions inside the requested window
+            spending_summary, total_spent = analyze_spending(get_transactions_from_dynamodb(user_id, start_date, end_date))
+        else:
+            # Read the user's per-category totals from the rollup store
+            spending_summary, total_spent = get_spending_summary(user_id)
+
+        trends = trends_future.result() if trends_future else None
 
     # Generate a financial plan based on the plan type
-    financial_plan = generate_plan(plan_type, spending_summary, total_spent)
+    financial_plan = generate_plan(plan_type, spending_summary, total_spent, trends)
 
     # Enhanced response with better readability
-    response_message = {
-        "Welcome Message": financial_plan['welcome_message'],
-        "Summary": financial_plan['summary'],
-        "Suggestions": financial_plan['suggestions'],
-        "Total Spending Analyzed": f"${total_spent:.2f}"
-    }
+    response_body = encode_body(format_plan_response(financial_plan, total_spent))
+    put_cached(cache_key, response_body)
 
     # Return the enhanced financial plan
     return {
         'statusCode': 200,
-        'body': response_message
+        'headers': {'X-Cache': cache_outcome},
+        'body': response_body
     }
 
-def get_transactions_from_dynamodb(user_id):
-    # Scan the DynamoDB table for transactions related to the user
-    response = transactions_table.scan(
-        FilterExpression=Attr('userID').eq(user_id)
-    )
-    return response.get('Items', [])
+def get_transactions_from_dynamodb(user_id, start_date=None, end_date=None):
+    # Query the user index for the user's transactions, reading only what the analysis needs, followed by the
+    # daily totals of any archived rows inside the window
+    return chain(read_user_transactions(get_table(table_name), user_id, ['category'] + AMOUNT_ATTRIBUTES,
+                                        start_date=start_date, end_date=end_date),
+                 read_archived_totals(user_id, start_date, end_date))
+
+def get_spending_summary(user_id):
+    # Answer from the maintained rollups in O(number of categories)
+    return summarize_cents(get_category_totals(get_table(ROLLUP_TABLE_NAME), user_id))
+
+def get_spending_trends(user_id, first_month, start_date, end_date):
+    # Month-by-month trends of the trend window only, however long the user's history is
+    transactions = chain(read_user_transactions(get_table(table_name), user_id, ['category', 'date'] + AMOUNT_ATTRIBUTES,
+                                                start_date=start_date, end_date=end_date),
+                         read_archived_totals(user_id, start_date, end_date))
+    return spending_trends(transactions, first_month)
+
+def summarize_cents(category_cents):
+    # Total the exact cents before converting, so neither figure carries float rounding from a running sum
+    total_spent = cents_to_amount(sum(category_cents.values()))
+    return {category: cents_to_amount(cents) for category, cents in category_cents.items()}, total_spent
 
 def analyze_spending(transactions):
-    spending_summary = {}
-    total_spent = 0
+    category_cents = {}
 
-    # Summarize spending by category and calculate the total spent
+    # Summarize spending by category in whole cents
     for transaction in transactions:
         category = transaction['category']
-        amount = transaction['amount']
-        spending_summary[category] = spending_summary.get(category, 0) + amount
-        total_spent += amount
+        category_cents[category] = category_cents.get(category, 0) + stored_cents(transaction)
+
+    return summarize_cents(category_cents)
 
-    return spending_summary, total_spent
+def spending_share(amount, total_spent):
+    # Percentage of the total spent; when the amounts cancel out to zero every share is zero
+    return (amount / total_spent) * 100 if total_spent else 0.0
 
-def generate_plan(plan_type, spending_summary, total_spent):
+def generate_plan(plan_type, spending_summary, total_spent, trends=None):
     plan = {
         'planType': plan_type,
-        'welcome_message': "🌟 Welcome to Your Personal Finance Assistant! Let's optimize your finances.",
+        'welcome_message': WELCOME_MESSAGE,
         'suggestions': [],
         'summary': ""
     }
 
     if plan_type == 'saving':
-        plan['summary'] = "Here's your personalized saving plan aimed at boosting your savings:"
         # Calculating suggestions based on spending percentages
         for category, amount in spending_summary.items():
-            percentage = (amount / total_spent) * 100  # Spending percentage in each category
+            percentage = spending_share(amount, total_spent)  # Spending percentage in each category
             if percentage > 5:  # Focus on categories with significant spending
                 suggested_reduction = amount * 0.1  # Suggesting a 10% reduction
                 # Adding detailed suggestions with calculations
-                plan['suggestions'].append(
-                    f"Reduce by 10% in {category} (currently ${amount:.2f}, {percentage:.2f}% of total). Potential saving: ${suggested_reduction:.2f} per month.")
-        plan['welcome_message'] += "\n\n💡 Saving Plan: Your guide to smart savings and financial growth."
+                plan['suggestions'].append(SAVING_SUGGESTION.format(
+                    category=category, amount=amount, percentage=percentage, reduction=suggested_reduction))
 
     elif plan_type == 'debt_reduction':
-        plan['summary'] = "Debt reduction strategy to help you minimize debts more efficiently:"
         # Suggesting reductions in non-essential categories for debt repayment
-        for category in ['Entertainment', 'Shopping', 'Luxury Items']:
+        for category in DEBT_REDUCTION_CATEGORIES:
             if category in spending_summary and spending_summary[category] > 0:
-                percentage = (spending_summary[category] / total_spent) * 100
-                plan['suggestions'].append(
-                    f"Consider reducing {category} expenses (${spending_summary[category]:.2f}, {percentage:.2f}% of total) for faster debt repayment.")
-        plan['suggestions'].append("Prioritize repaying debts first.")
-        plan['welcome_message'] += "\n\n🚀 Debt Reduction Plan: A strategic approach to minimize and eliminate debt."
+                percentage = spending_share(spending_summary[category], total_spent)
+                plan['suggestions'].append(DEBT_REDUCTION_SUGGESTION.format(
+                    category=category, amount=spending_summary[category], percentage=percentage))
+        plan['suggestions'].append(DEBT_REDUCTION_CLOSING)
 
     elif plan_type == 'budgeting':
-        plan['summary'] = "Customized budgeting plan to maintain a balanced financial life:"
-        essential_categories = ['Housing', 'Groceries', 'Healthcare']
-        non_essential_categories = ['Entertainment', 'Dining Out', 'Shopping']
         # Analyzing essential and non-essential spending
-        for category in essential_categories + non_essential_categories:
+        for category in ESSENTIAL_CATEGORIES + NON_ESSENTIAL_CATEGORIES:
             if category in spending_summary:
-                percentage = (spending_summary[category] / total_spent) * 100
-                if category in essential_categories:
-                    plan['suggestions'].append(
-                        f"Maintain essential spending in {category} (${spending_summary[category]:.2f}, {percentage:.2f}% of total).")
+                percentage = spending_share(spending_summary[category], total_spent)
+                if category in ESSENTIAL_CATEGORIES:
+                    plan['suggestions'].append(ESSENTIAL_SUGGESTION.format(
+                        category=category, amount=spending_summary[category], percentage=percentage))
                 else:
                     suggested_reduction = spending_summary[category] * 0.1  # 10% reduction suggestion
-                    plan['suggestions'].append(
-                        f"Consider reducing non-essential {category} spending by 10% (${suggested_reduction:.2f} potential saving).")
-        plan['welcome_message'] += "\n\n📊 Budgeting Plan: Crafting a balanced and sustainable financial lifestyle."
+                    plan['suggestions'].append(NON_ESSENTIAL_SUGGESTION.format(
+                        category=category, reduction=suggested_reduction))
 
     elif plan_type == 'investment':
-        plan['summary'] = "Investment guidance to help grow your wealth:"
         # Investment suggestions based on discretionary spending
         for category, amount in spending_summary.items():
-            if category not in ['Housing', 'Groceries', 'Healthcare', 'Savings', 'Debt Repayment']:
+            if category not in NON_DISCRETIONARY_CATEGORIES:
                 suggested_investment = amount * 0.05  # Suggesting a 5% investment
-                plan['suggestions'].append(
-                    f"Consider investing 5% of {category} spending (${suggested_investment:.2f} potential investment) for long-term growth.")
-        plan['welcome_message'] += "\n\n📈 Investment Plan: Unlocking the potential of your finances for future prosperity."
+                plan['suggestions'].append(INVESTMENT_SUGGESTION.format(
+                    category=category, investment=suggested_investment))
+
+    plan['suggestions'].extend(trend_suggestions(trends))
+
+    if plan_type in PLAN_TEXT:
+        plan['summary'], welcome_suffix = PLAN_TEXT[plan_type]
+        plan['welcome_message'] += welcome_suffix
 
     return plan
 
-def convert_decimals(obj):
-    # Convert DynamoDB Decimal types to Python native int or float
-    if isinstance(obj, list):
-        return [convert_decimals(x) for x in obj]
-    elif isinstance(obj, dict):
-        return {k: convert_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, Decimal):
-        if obj % 1 == 0:
-            return int(obj)
-        else:
-            return float(obj)
-    else:
-        return obj
+def trend_suggestions(trends):
+    # Lines for the categories whose monthly spending moved the most lately, from spendingTrends
+    suggestions = []
+    for trend in trends or []:
+        template = TREND_UP_SUGGESTION if trend['changePercent'] > 0 else TREND_DOWN_SUGGESTION
+        suggestions.append(template.format(change=abs(trend['changePercent']), **trend))
+    return suggestions
+
+def format_plan_response(financial_plan, total_spent):
+    # Enhanced response with better readability
+    return {
+        "Welcome Message": financial_plan['welcome_message'],
+        "Summary": financial_plan['summary'],
+        "Suggestions": financial_plan['suggestions'],
+        "Total Spending Analyzed": f"${total_spent:.2f}"
+    }
 
 # Example usage
 # result = lambda_handler({'userID': '123', 'planType': 'saving'}, {})
@@ -0,0 +1,104 @@
+import json
+import sys
+from amountFormat import AMOUNT_ATTRIBUTE, AMOUNT_ATTRIBUTES, stored_cents
+from transactionStore import TRANSACTIONS_TABLE_NAME, parallel_scan
+from archiveStore import ARCHIVE_TOTALS_TABLE_NAME
+from rollupStore import ROLLUP_TABLE_NAME, TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE
+from awsClients import get_table
+from responseCache import bump_data_version
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+def compute_rollups(transactions_table, total_segments):
+    # Recompute (userID, category) -> [total cents, count] from the raw transactions
+    expected = {}
+    for item in parallel_scan(transactions_table, ['userID', 'category'] + AMOUNT_ATTRIBUTES, total_segments):
+        key = (item['userID'], item['category'])
+        totals = expected.setdefault(key, [0, 0])
+        totals[0] += stored_cents(item)
+        totals[1] += 1
+
+    # Rollups are lifetime totals, so rows moved out by archiveTransactions still count through their daily totals
+    archive_attributes = ['userID', 'category', AMOUNT_ATTRIBUTE, 'txnCount']
+    for item in parallel_scan(get_table(ARCHIVE_TOTALS_TABLE_NAME), archive_attributes, total_segments):
+        totals = expected.setdefault((item['userID'], item['category']), [0, 0])
+        totals[0] += int(item[AMOUNT_ATTRIBUTE])
+        totals[1] += int(item['txnCount'])
+    return expected
+
+def load_rollups(rollup_table, total_segments):
+    # Read the currently stored rollups into the same shape as compute_rollups
+    stored = {}
+    attributes = ['userID', 'category', TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE, 'txnCount']
+    for item in parallel_scan(rollup_table, attributes, total_segments):
+        stored[(item['userID'], item['category'])] = [stored_cents(item, TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE),
+                                                      int(item.get('txnCount', 0))]
+    return stored
+
+def find_drift(expected, stored):
+    # Every rollup whose stored value differs from the recomputed one
+    drift = []
+    for key in expected.keys() | stored.keys():
+        expected_total, expected_count = expected.get(key, [0, 0])
+        stored_total, stored_count = stored.get(key, [0, 0])
+        if expected_total != stored_total or expected_count != stored_count:
+            drift.append({
+                'userID': key[0],
+                'category': key[1],
+                'expectedTotalCents': expected_total,
+                'storedTotalCents': stored_total,
+                'expectedCount': expected_count,
+                'storedCount': stored_count
+            })
+    return drift
+
+def repair_drift(rollup_table, drift):
+    # Overwrite drifted rollups with the recomputed values (dropping any legacy total) and remove orphaned ones
+    with rollup_table.batch_writer() as batch:
+        for entry in drift:
+            key = {'userID': entry['userID'], 'category': entry['category']}
+            if entry['expectedCount'] == 0:
+                batch.delete_item(Key=key)
+            else:
+                batch.put_item(Item={
+                    **key,
+                    TOTAL_ATTRIBUTE: entry['expectedTotalCents'],
+                    'txnCount': entry['expectedCount']
+                })
+
+def rebuild_rollups(repair=False, total_segments=4):
+    transactions_table = get_table(TRANSACTIONS_TABLE_NAME)
+    rollup_table = get_table(ROLLUP_TABLE_NAME)
+
+    expected = compute_rollups(transactions_table, total_segments)
+    stored = load_rollups(rollup_table, total_segments)
+    drift = find_drift(expected, stored)
+
+    # Writes that land while the scan runs show up as drift, so only repair when asked to
+    if repair and drift:
+        repair_drift(rollup_table, drift)
+        for user_id in {entry['userID'] for entry in drift}:
+            bump_data_version(user_id)
+
+    return {
+        'rollupsChecked': len(expected.keys() | stored.keys()),
+        'driftCount': len(drift),
+        'repaired': bool(repair and drift),
+        'drift': drift
+    }
+
+@instrumented
+def lambda_handler(event, context):
+    result = rebuild_rollups(
+        repair=bool(event.get('repair', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Run as a backfill from the command line: python rebuildRollups.py [--repair]
+if __name__ == '__main__':
+    result = rebuild_rollups(repair='--repair' in sys.argv)
+    print(json.dumps(result, indent=2))
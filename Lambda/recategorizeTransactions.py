@@ -0,0 +1,140 @@
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from amountFormat import AMOUNT_ATTRIBUTES, stored_cents
+from categorizer import assign_category
+from transactionStore import TRANSACTIONS_TABLE_NAME, parallel_scan
+from rollupStore import rollup_update
+from awsClients import get_table
+from apiResponse import encode_body
+from responseCache import version_bump
+from instrumentation import instrumented
+
+MAX_TRANSACTION_ACTIONS = 100  # TransactWriteItems limit
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 5
+
+def find_changes(transactions_table, total_segments):
+    # (row, new category) for every row whose category the rules would assign differently
+    attributes = ['id', 'userID', 'title', 'category', 'came_from'] + AMOUNT_ATTRIBUTES
+    scanned = 0
+    changes = []
+    for item in parallel_scan(transactions_table, attributes, total_segments):
+        scanned += 1
+        # Split rows are categorized by makeQattah, and rows without a category are not in any rollup
+        if item.get('came_from') or not item.get('category'):
+            continue
+        category = assign_category(item.get('title'), item['category'])
+        if category != item['category']:
+            changes.append((item, category))
+    return scanned, changes
+
+def rollup_keys(change):
+    item, category = change
+    return {(item['userID'], item['category']), (item['userID'], category)}
+
+def change_batches(changes):
+    # Pack changes into transactions of at most 100 actions: one update per row, one per rollup record touched and
+    # one version bump per user. Sorting by user keeps the rollup records of a batch few
+    batch, keys, users = [], set(), set()
+    for change in sorted(changes, key=lambda change: change[0]['userID']):
+        new_keys, new_users = keys | rollup_keys(change), users | {change[0]['userID']}
+        if batch and len(batch) + 1 + len(new_keys) + len(new_users) > MAX_TRANSACTION_ACTIONS:
+            yield batch
+            batch, new_keys, new_users = [], rollup_keys(change), {change[0]['userID']}
+        batch.append(change)
+        keys, users = new_keys, new_users
+    if batch:
+        yield batch
+
+def category_update(transaction_table_name, item, category):
+    # Recategorize a row only if its category is still the one the rollup deltas were computed from
+    return {
+        'Update': {
+            'TableName': transaction_table_name,
+            'Key': {'id': item['id']},
+            'UpdateExpression': 'SET category = :new',
+            'ConditionExpression': 'category = :old',
+            'ExpressionAttributeValues': {':new': category, ':old': item['category']}
+        }
+    }
+
+def apply_batch(transactions_table, batch):
+    # Move a batch of rows and their rollup totals to the new categories in one transaction, returning
+    # (applied, failed). Rows changed since the scan are dropped and the rest of the batch is retried
+    failed = 0
+    for attempt in range(MAX_ATTEMPTS):
+        if not batch:
+            return 0, failed
+        # Net the rollup deltas per record, since a transaction may not touch the same item twice
+        deltas = {}
+        for item, category in batch:
+            cents = stored_cents(item)
+            old = deltas.setdefault((item['userID'], item['category']), [0, 0])
+            old[0] -= cents
+            old[1] -= 1
+            new = deltas.setdefault((item['userID'], category), [0, 0])
+            new[0] += cents
+            new[1] += 1
+        actions = [category_update(transactions_table.name, item, category) for item, category in batch]
+        actions.extend(rollup_update(user_id, category, cents, count)
+                       for (user_id, category), (cents, count) in deltas.items() if cents or count)
+        actions.extend(version_bump(user_id) for user_id in {item['userID'] for item, _ in batch})
+
+        try:
+            transactions_table.meta.client.transact_write_items(TransactItems=actions)
+            return len(batch), failed
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            # Reasons are listed in action order, so the first len(batch) belong to the row updates
+            reasons = e.response.get('CancellationReasons', [])
+            conflicts = {index for index, reason in enumerate(reasons[:len(batch)])
+                         if reason.get('Code') == 'ConditionalCheckFailed'}
+            failed += len(conflicts)
+            batch = [change for index, change in enumerate(batch) if index not in conflicts]
+            if not conflicts:
+                time.sleep(min(0.05 * (2 ** attempt), 1))
+
+    return 0, failed + len(batch)
+
+def recategorize_transactions(dry_run=False, total_segments=4):
+    # Batch job re-running the categorization rules over existing rows, keeping the rollups in step
+    transactions_table = get_table(TRANSACTIONS_TABLE_NAME)
+    scanned, changes = find_changes(transactions_table, total_segments)
+
+    updated = failed = 0
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for applied, batch_failed in executor.map(lambda batch: apply_batch(transactions_table, batch),
+                                                      list(change_batches(changes))):
+                updated += applied
+                failed += batch_failed
+
+    return {
+        'scanned': scanned,
+        'changed': len(changes),
+        'updated': updated,
+        'failed': failed,
+        'dryRun': dry_run,
+        'changes': [{'from': old, 'to': new, 'count': count} for (old, new), count in
+                    Counter((item['category'], category) for item, category in changes).most_common()]
+    }
+
+@instrumented
+def lambda_handler(event, context):
+    result = recategorize_transactions(
+        dry_run=bool(event.get('dryRun', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Re-run the rules from the command line: python recategorizeTransactions.py [--dry-run]
+if __name__ == '__main__':
+    print(json.dumps(recategorize_transactions(dry_run='--dry-run' in sys.argv), indent=2))
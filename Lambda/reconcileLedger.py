@@ -0,0 +1,95 @@
+import json
+import sys
+from amountFormat import AMOUNT_ATTRIBUTES, stored_cents
+from transactionStore import TRANSACTIONS_TABLE_NAME, parallel_scan
+from ledgerStore import LEDGER_TABLE_NAME, BALANCE_ATTRIBUTE, LEGACY_BALANCE_ATTRIBUTE, is_open_split, record_balance
+from awsClients import get_table
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+def compute_balances(transactions_table, total_segments):
+    # Recompute (userID, counterpartyID) -> [balance cents, openSplits] from the unpaid split rows
+    expected = {}
+    attributes = ['userID', 'came_from', 'is_paid'] + AMOUNT_ATTRIBUTES
+    for item in parallel_scan(transactions_table, attributes, total_segments):
+        if not is_open_split(item):
+            continue
+        cents = stored_cents(item)
+        creditor = expected.setdefault((item['came_from'], item['userID']), [0, 0])
+        creditor[0] += cents
+        creditor[1] += 1
+        debtor = expected.setdefault((item['userID'], item['came_from']), [0, 0])
+        debtor[0] -= cents
+        debtor[1] += 1
+    return expected
+
+def load_balances(ledger_table, total_segments):
+    stored = {}
+    attributes = ['userID', 'counterpartyID', BALANCE_ATTRIBUTE, LEGACY_BALANCE_ATTRIBUTE, 'openSplits']
+    for item in parallel_scan(ledger_table, attributes, total_segments):
+        stored[(item['userID'], item['counterpartyID'])] = [record_balance(item), int(item.get('openSplits', 0))]
+    return stored
+
+def find_drift(expected, stored):
+    # Every ledger record whose stored balance differs from the one implied by the raw rows
+    drift = []
+    for key in expected.keys() | stored.keys():
+        expected_balance, expected_open = expected.get(key, [0, 0])
+        stored_balance, stored_open = stored.get(key, [0, 0])
+        if expected_balance != stored_balance or expected_open != stored_open:
+            drift.append({
+                'userID': key[0],
+                'counterpartyID': key[1],
+                'expectedBalanceCents': expected_balance,
+                'storedBalanceCents': stored_balance,
+                'expectedOpenSplits': expected_open,
+                'storedOpenSplits': stored_open
+            })
+    return drift
+
+def repair_drift(ledger_table, drift):
+    # Overwrite drifted records with the recomputed balances and drop settled ones
+    with ledger_table.batch_writer() as batch:
+        for entry in drift:
+            key = {'userID': entry['userID'], 'counterpartyID': entry['counterpartyID']}
+            if entry['expectedOpenSplits'] == 0:
+                batch.delete_item(Key=key)
+            else:
+                batch.put_item(Item={
+                    **key,
+                    BALANCE_ATTRIBUTE: entry['expectedBalanceCents'],
+                    'openSplits': entry['expectedOpenSplits']
+                })
+
+def reconcile_ledger(repair=False, total_segments=4):
+    expected = compute_balances(get_table(TRANSACTIONS_TABLE_NAME), total_segments)
+    ledger_table = get_table(LEDGER_TABLE_NAME)
+    stored = load_balances(ledger_table, total_segments)
+    drift = find_drift(expected, stored)
+
+    # Splits created or paid while the scan runs show up as drift, so only repair when asked to
+    if repair and drift:
+        repair_drift(ledger_table, drift)
+
+    return {
+        'balancesChecked': len(expected.keys() | stored.keys()),
+        'driftCount': len(drift),
+        'repaired': bool(repair and drift),
+        'drift': drift
+    }
+
+@instrumented
+def lambda_handler(event, context):
+    result = reconcile_ledger(
+        repair=bool(event.get('repair', False)),
+        total_segments=int(event.get('segments', 4))
+    )
+    return {
+        'statusCode': 200,
+        'body': encode_body(result)
+    }
+
+# Check (and optionally fix) the ledger from the command line: python reconcileLedger.py [--repair]
+if __name__ == '__main__':
+    result = reconcile_ledger(repair='--repair' in sys.argv)
+    print(json.dumps(result, indent=2))
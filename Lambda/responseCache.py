@@ -0,0 +1,101 @@
+import os
+import time
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from awsClients import get_table
+from instrumentation import add_metric, set_property
+
+# Shared cache entries, expired by DynamoDB TTL on 'expiresAt' (see aws_dynamodb_table.ResponseCache in main.tf)
+CACHE_TABLE_NAME = 'ResponseCache'
+# Per-user data version bumped by every write path (see aws_dynamodb_table.UserDataVersions in main.tf)
+VERSION_TABLE_NAME = 'UserDataVersions'
+
+# Entries hold encoded response bodies; the format tag keeps entries of an older format from ever being read
+ENTRY_FORMAT = 'body1'
+
+MEMORY_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+SHARED_CACHE_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL', '3600'))
+
+# In-process tier, kept across warm invocations of the container
+_memory_cache = OrderedDict()
+_stats = {'memoryHits': 0, 'sharedHits': 0, 'misses': 0, 'evictions': 0}
+
+def version_bump(user_id):
+    # TransactWriteItems action that invalidates every cached response of the user
+    return {
+        'Update': {
+            'TableName': VERSION_TABLE_NAME,
+            'Key': {'userID': user_id},
+            'UpdateExpression': 'ADD #version :one',
+            'ExpressionAttributeNames': {'#version': 'version'},
+            'ExpressionAttributeValues': {':one': 1}
+        }
+    }
+
+def bump_data_version(user_id):
+    # Same as version_bump, for write paths that are not transactional
+    get_table(VERSION_TABLE_NAME).update_item(**version_bump(user_id)['Update'])
+
+def get_data_version(user_id):
+    response = get_table(VERSION_TABLE_NAME).get_item(Key={'userID': user_id}, ConsistentRead=True)
+    return int(response.get('Item', {}).get('version', 0))
+
+def build_cache_key(user_id, endpoint, plan_type=None, start_date=None, end_date=None, variant=None):
+    # The data version is part of the key, so entries written before a change can never be returned. A variant
+    # separates responses that also depend on something besides the user's data, such as the current month
+    version = get_data_version(user_id)
+    parts = [ENTRY_FORMAT, user_id, endpoint, plan_type or '', start_date or '', end_date or '', f'v{version}']
+    if variant:
+        parts.append(variant)
+    return '|'.join(parts)
+
+def get_cached(cache_key):
+    if cache_key in _memory_cache:
+        _memory_cache.move_to_end(cache_key)
+        _stats['memoryHits'] += 1
+        return _memory_cache[cache_key], 'HIT-MEMORY'
+
+    try:
+        item = get_table(CACHE_TABLE_NAME).get_item(Key={'cacheKey': cache_key}).get('Item')
+    except ClientError as e:
+        # The cache must never take an endpoint down
+        print(f"Response cache read failed: {e}")
+        item = None
+
+    # TTL deletion is lazy, so expiry is checked here as well
+    if item and int(item.get('expiresAt', 0)) > time.time():
+        value = item['value']
+        remember(cache_key, value)
+        _stats['sharedHits'] += 1
+        return value, 'HIT-SHARED'
+
+    _stats['misses'] += 1
+    return None, 'MISS'
+
+def remember(cache_key, value):
+    _memory_cache[cache_key] = value
+    _memory_cache.move_to_end(cache_key)
+    while len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+        _stats['evictions'] += 1
+
+def put_cached(cache_key, body):
+    # Cache an encoded response body, so hits are returned without serializing again
+    remember(cache_key, body)
+    try:
+        get_table(CACHE_TABLE_NAME).put_item(Item={
+            'cacheKey': cache_key,
+            'value': body,
+            'expiresAt': int(time.time()) + SHARED_CACHE_TTL_SECONDS
+        })
+    except ClientError as e:
+        print(f"Response cache write failed: {e}")
+
+def cache_stats():
+    return {**_stats, 'memoryEntries': len(_memory_cache), 'memoryCapacity': MEMORY_CACHE_SIZE}
+
+def log_cache_stats(endpoint, outcome):
+    # Reported on the invocation's metrics line so hit rates can be read per endpoint
+    set_property('CacheOutcome', outcome)
+    add_metric('CacheHits', int(outcome != 'MISS'))
+    add_metric('CacheMemoryEntries', len(_memory_cache))
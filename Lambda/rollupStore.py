@@ -0,0 +1,65 @@
+from boto3.dynamodb.conditions import Key
+from amountFormat import stored_cents
+from itemCodec import query_pages
+
+# Per-user, per-category running totals (see aws_dynamodb_table.CategoryTotals in main.tf)
+ROLLUP_TABLE_NAME = 'CategoryTotals'
+
+# Totals are kept in whole cents; 'total' is the Decimal attribute of rollups written before that
+TOTAL_ATTRIBUTE = 'totalCents'
+LEGACY_TOTAL_ATTRIBUTE = 'total'
+
+# 'count' is a reserved word, so the counter attribute is always referenced through a placeholder
+ROLLUP_ATTRIBUTE_NAMES = {'#total': TOTAL_ATTRIBUTE, '#count': 'txnCount'}
+
+def rollup_update(user_id, category, cents, count=1):
+    # TransactWriteItems action that adds a transaction of the given cents to the user's category rollup
+    return {
+        'Update': {
+            'TableName': ROLLUP_TABLE_NAME,
+            'Key': {'userID': user_id, 'category': category},
+            'UpdateExpression': 'ADD #total :cents, #count :count',
+            'ExpressionAttributeNames': ROLLUP_ATTRIBUTE_NAMES,
+            'ExpressionAttributeValues': {':cents': cents, ':count': count}
+        }
+    }
+
+def apply_rollup_delta(rollup_table, user_id, category, cents, count):
+    # Atomically adjust a single rollup record outside of a transaction
+    return rollup_table.update_item(
+        Key={'userID': user_id, 'category': category},
+        UpdateExpression='ADD #total :cents, #count :count',
+        ExpressionAttributeNames=ROLLUP_ATTRIBUTE_NAMES,
+        ExpressionAttributeValues={':cents': cents, ':count': count}
+    )
+
+def query_rollups(rollup_table, user_id):
+    # Read every rollup record of a user, one per category
+    query_kwargs = {'KeyConditionExpression': Key('userID').eq(user_id)}
+    while True:
+        response = rollup_table.query(**query_kwargs)
+        for item in response.get('Items', []):
+            yield item
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def get_category_totals(rollup_table, user_id):
+    # Category -> total spent in cents, skipping categories whose transactions have all been removed
+    category_totals = {}
+    for items, _ in query_pages(rollup_table.name, Key('userID').eq(user_id)):
+        for item in items:
+            if item.get('txnCount', 0) > 0:
+                category_totals[item['category']] = stored_cents(item, TOTAL_ATTRIBUTE, LEGACY_TOTAL_ATTRIBUTE)
+    return category_totals
+
+def delete_user_rollups(rollup_table, user_id):
+    # Remove every rollup record of a user once their transactions are gone
+    deleted_count = 0
+    with rollup_table.batch_writer() as batch:
+        for item in query_rollups(rollup_table, user_id):
+            batch.delete_item(Key={'userID': user_id, 'category': item['category']})
+            deleted_count += 1
+    return deleted_count
@@ -0,0 +1,49 @@
+import importlib
+from apiResponse import encode_body
+
+# API routes (aws_apigatewayv2_route in main.tf) and the module whose lambda_handler serves each one
+ROUTES = {
+    'POST transactions/createTransaction': 'createTransaction',
+    'POST users/createUser': 'createUser',
+    'GET transactions/paymentPlan': 'paymentPlan',
+    'POST transactions/makeQattah': 'makeQattah',
+    'POST transactions/markPaid': 'markPaid',
+    'DELETE users/deleteUser': 'deleteUser',
+    'GET users/getUser': 'getUser',
+    'PUT users/updateUser': 'updateUser',
+    'GET transactions/transactionsCategorization': 'transactionsCategorization',
+    'POST transactions/notifyUser': 'notifyUser',
+    'POST transactions/bulkImport': 'bulkImport',
+    'GET users/getBalances': 'getBalances',
+    'GET users/getBalanceWith': 'getBalanceWith',
+    'GET transactions/settlementPlan': 'settlementPlan',
+    'POST transactions/settleGroup': 'settleGroup',
+    'GET transactions/listTransactions': 'listTransactions',
+    'GET transactions/searchTransactions': 'searchTransactions'
+}
+
+# Handlers are imported on their first request, so a cold start only pays for the route it serves
+_handlers = {}
+
+def get_handler(module_name):
+    if module_name not in _handlers:
+        _handlers[module_name] = importlib.import_module(module_name).lambda_handler
+    return _handlers[module_name]
+
+def resolve(event):
+    route_key = event.get('routeKey')
+    if route_key:
+        return ROUTES.get(route_key)
+    # deleteUser re-invokes its own function with a continuation payload, which in router mode is this one
+    if 'continuation' in event:
+        return 'deleteUser'
+    return None
+
+def lambda_handler(event, context):
+    module_name = resolve(event)
+    if not module_name:
+        return {
+            'statusCode': 404,
+            'body': encode_body(f"No handler for route {event.get('routeKey')}")
+        }
+    return get_handler(module_name)(event, context)
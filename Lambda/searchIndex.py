@@ -0,0 +1,56 @@
+import re
+from boto3.dynamodb.conditions import Key
+from amountFormat import stored_cents
+from itemCodec import query_pages
+
+# Per-user inverted index over transaction titles (see aws_dynamodb_table.TransactionSearchIndex in main.tf).
+# One posting per (user, term, transaction), keyed 'term#transactionID' so a term prefix is a key range
+SEARCH_TABLE_NAME = 'TransactionSearchIndex'
+
+# Fields copied onto every posting so search results need no second read of Transactions
+POSTING_FIELDS = ['title', 'date', 'category']
+
+MAX_TERM_LENGTH = 40
+MAX_TERMS_PER_TITLE = 32
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    # Distinct lowercase word tokens of a title or query, in order of appearance
+    terms = dict.fromkeys(token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(str(text or '').lower()))
+    return list(terms)[:MAX_TERMS_PER_TITLE]
+
+def posting_key(user_id, term, transaction_id):
+    return {'userID': user_id, 'termKey': f'{term}#{transaction_id}'}
+
+def postings_for(item):
+    # Every posting of a transaction row, as full index items
+    if not item or not item.get('userID') or not item.get('id'):
+        return []
+    fields = {field: item[field] for field in POSTING_FIELDS if field in item}
+    fields['amountCents'] = stored_cents(item)
+    return [{**posting_key(item['userID'], term, item['id']), 'transactionID': item['id'], **fields}
+            for term in tokenize(item.get('title'))]
+
+def posting_changes(old_item, new_item):
+    # (keys to delete, items to put) moving the index from a row's old image to its new one; rows whose
+    # indexed fields did not change (e.g. only is_paid flipped) need no writes at all
+    old_postings = {posting['termKey']: posting for posting in postings_for(old_item)}
+    new_postings = {posting['termKey']: posting for posting in postings_for(new_item)}
+    if old_item and new_item and old_item.get('userID') != new_item.get('userID'):
+        old_keys = [posting_key(old_item['userID'], *key.split('#', 1)) for key in old_postings]
+        return old_keys, list(new_postings.values())
+
+    deletes = [posting_key(old_item['userID'], *key.split('#', 1)) for key in old_postings if key not in new_postings]
+    puts = [posting for key, posting in new_postings.items() if old_postings.get(key) != posting]
+    return deletes, puts
+
+def read_postings(user_id, prefix, max_postings):
+    # Postings of every term starting with prefix, at most max_postings of them; returns (postings, truncated)
+    postings = []
+    condition = Key('userID').eq(user_id) & Key('termKey').begins_with(prefix)
+    for items, last_key in query_pages(SEARCH_TABLE_NAME, condition, page_size=max_postings):
+        postings.extend(items)
+        if len(postings) >= max_postings:
+            return postings[:max_postings], bool(last_key) or len(postings) > max_postings
+    return postings, False
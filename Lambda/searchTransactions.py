@@ -0,0 +1,91 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from amountFormat import cents_to_amount
+from apiResponse import encode_body, compress_response
+from searchIndex import read_postings, tokenize
+from instrumentation import instrumented
+
+DEFAULT_RESULTS = 20
+MAX_RESULTS = 100
+MAX_QUERY_TERMS = 5
+# Postings read per query term; bounds the cost of very short prefixes such as 'a'
+MAX_POSTINGS_PER_TERM = 1000
+
+# A query term equal to a title word counts for more than one that is only a prefix of it
+EXACT_MATCH_SCORE = 2
+PREFIX_MATCH_SCORE = 1
+
+def read_params(event):
+    # Query string parameters, overridden by a JSON body like the other GET routes take
+    params = dict(event.get('queryStringParameters') or {})
+    if event.get('body'):
+        params.update(json.loads(event['body']))
+    return params
+
+def search(user_id, query, limit):
+    # Transactions whose title has a word starting with every query term, best matches first, then newest.
+    # Each term is one key-range query on the user's partition of the index, so the cost depends on how many
+    # of the user's titles match, never on the size of the Transactions table
+    terms = tokenize(query)[:MAX_QUERY_TERMS]
+    with ThreadPoolExecutor(max_workers=len(terms)) as executor:
+        results = list(executor.map(lambda term: read_postings(user_id, term, MAX_POSTINGS_PER_TERM), terms))
+
+    matches = {}
+    truncated = False
+    for term, (postings, term_truncated) in zip(terms, results):
+        truncated = truncated or term_truncated
+        for posting in postings:
+            # A prefix can match several words of one title; the best of them counts
+            score = EXACT_MATCH_SCORE if posting['termKey'].rsplit('#', 1)[0] == term else PREFIX_MATCH_SCORE
+            match = matches.setdefault(posting['transactionID'], {'posting': posting, 'scores': {}})
+            match['scores'][term] = max(score, match['scores'].get(term, 0))
+
+    # Highest score first, newest first among equal scores
+    ranked = sorted(((sum(match['scores'].values()), match['posting']) for match in matches.values()
+                     if len(match['scores']) == len(terms)),
+                    key=lambda entry: (entry[0], entry[1].get('date', '')), reverse=True)
+
+    results = [{
+        'id': posting['transactionID'],
+        'title': posting.get('title'),
+        'category': posting.get('category'),
+        'date': posting.get('date'),
+        'amount': cents_to_amount(posting.get('amountCents', 0)),
+        'score': score
+    } for score, posting in ranked[:limit]]
+    return terms, results, truncated
+
+@instrumented
+def lambda_handler(event, context):
+    params = read_params(event)
+    user_id = params.get('userID')
+    query = params.get('q') or params.get('query')
+    if not user_id or not query or not tokenize(query):
+        return {
+            'statusCode': 400,
+            'body': encode_body('Missing userID or search query')
+        }
+
+    try:
+        limit = int(params.get('limit') or DEFAULT_RESULTS)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= MAX_RESULTS:
+        return {
+            'statusCode': 400,
+            'body': encode_body(f'limit must be between 1 and {MAX_RESULTS}')
+        }
+
+    terms, results, truncated = search(user_id, query, limit)
+    return compress_response(event, {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': encode_body({
+            'userID': user_id,
+            'terms': terms,
+            'results': results,
+            'count': len(results),
+            # Set when a term matched more postings than are read per request; a longer query narrows it
+            'truncated': truncated
+        })
+    })
@@ -0,0 +1,35 @@
+import json
+from awsClients import get_table
+from groupSettlement import plan_settlement, read_group, net_positions, simplify_debts
+from markPaid import mark_items_paid
+from responseCache import bump_data_version
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+@instrumented
+def lambda_handler(event, context):
+    transaction_table = get_table('Transactions')
+    body = json.loads(event['body'])
+    user_ids, error = read_group(body)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': encode_body(error)
+        }
+
+    # Mark every open split between the members as paid, in batched conditional transactions
+    splits, _ = plan_settlement(transaction_table, user_ids)
+    paid, failures = mark_items_paid(transaction_table, splits)
+    for user_id in {item['userID'] for item in paid}:
+        bump_data_version(user_id)
+
+    # The transfers that cover exactly the splits settled here; failed ones stay open
+    return {
+        'statusCode': 200,
+        'body': encode_body({
+            'message': f'{len(paid)} Qattah transactions settled',
+            'settledSplits': len(paid),
+            'transfers': simplify_debts(net_positions(paid)),
+            'failed': [{'transactionID': item['id'], 'error': reason} for item, reason in failures]
+        })
+    }
@@ -0,0 +1,22 @@
+import json
+from awsClients import get_table
+from groupSettlement import plan_settlement, read_group
+from apiResponse import encode_body
+from instrumentation import instrumented
+
+@instrumented
+def lambda_handler(event, context):
+    body = json.loads(event['body'])
+    user_ids, error = read_group(body)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': encode_body(error)
+        }
+
+    # Net every open split between the members and return the fewest transfers that settle the group
+    _, plan = plan_settlement(get_table('Transactions'), user_ids)
+    return {
+        'statusCode': 200,
+        'body': encode_body(plan)
+    }
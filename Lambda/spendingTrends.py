@@ -0,0 +1,117 @@
+import calendar
+import os
+from datetime import date
+from amountFormat import cents_to_amount, stored_cents
+
+try:
+    # NumPy comes from the layer in var.numpy_layer_arn; without it paymentPlan serves plans without trend lines
+    import numpy as np
+except ImportError:
+    np = None
+
+# Complete months bucketed into the category x month matrix, ending with the month before the reference month
+TREND_MONTHS = int(os.environ.get('TREND_MONTHS', '12'))
+# Months averaged by the rolling mean; a trend compares the latest window with the one before it
+ROLLING_MONTHS = 3
+# Months the linear forecast is fitted on
+FORECAST_FIT_MONTHS = 6
+SMOOTHING_ALPHA = 0.5
+
+# A category is reported once its rolling mean moved by this much and it is worth at least this much a month
+TREND_THRESHOLD_PERCENT = 20
+MIN_TREND_CENTS = 1000
+MAX_TRENDS = 3
+
+def trends_available():
+    return np is not None
+
+def month_index(date_text):
+    # Months since year 0 of a 'YYYY-MM-DD' date
+    return int(date_text[:4]) * 12 + int(date_text[5:7]) - 1
+
+def month_start(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}-01'
+
+def trend_window(end_date=None, today=None):
+    # (first month index, 'from' date, 'to' date) of the TREND_MONTHS complete months before the reference month:
+    # the current month, or the month after end_date so a windowed plan trends up to the window's end
+    if end_date:
+        reference = month_index(end_date) + 1
+    else:
+        today = today or date.today()
+        reference = today.year * 12 + today.month - 1
+    first_month = reference - TREND_MONTHS
+    last_month = reference - 1
+    last_day = calendar.monthrange(last_month // 12, last_month % 12 + 1)[1]
+    return first_month, month_start(first_month), month_start(last_month)[:8] + f'{last_day:02d}'
+
+def build_matrix(transactions, first_month, month_count=TREND_MONTHS):
+    # Dense category x month matrix of spending in cents, categories in sort order
+    category_codes = {}
+    cells = []
+    cents = []
+    for transaction in transactions:
+        month = month_index(transaction['date']) - first_month
+        if 0 <= month < month_count:
+            code = category_codes.setdefault(transaction['category'], len(category_codes))
+            cells.append(code * month_count + month)
+            cents.append(stored_cents(transaction))
+
+    categories = sorted(category_codes)
+    if not categories:
+        return categories, np.zeros((0, month_count))
+    matrix = np.bincount(np.array(cells, dtype=np.int64), weights=np.array(cents, dtype=np.float64),
+                         minlength=len(category_codes) * month_count).reshape(len(category_codes), month_count)
+    order = np.array([category_codes[category] for category in categories], dtype=np.int64)
+    return categories, matrix[order]
+
+def rolling_means(matrix, window=ROLLING_MONTHS):
+    # Mean of every run of `window` consecutive months, per category, from cumulative sums
+    totals = np.cumsum(np.pad(matrix, ((0, 0), (1, 0))), axis=1)
+    return (totals[:, window:] - totals[:, :-window]) / window
+
+def linear_forecast(matrix, months=FORECAST_FIT_MONTHS):
+    # Next month of a least-squares line through the last `months` months of every category at once
+    recent = matrix[:, -months:]
+    t = np.arange(recent.shape[1], dtype=np.float64)
+    t_centered = t - t.mean()
+    slope = (recent - recent.mean(axis=1, keepdims=True)) @ t_centered / (t_centered @ t_centered)
+    return recent.mean(axis=1) + slope * (recent.shape[1] - t.mean())
+
+def smoothed_forecast(matrix, alpha=SMOOTHING_ALPHA):
+    # Simple exponential smoothing level after the last month, as one matrix-vector product: month k of n
+    # weighs alpha * (1 - alpha) ** (n - 1 - k), and the first month carries the initial level's remaining weight
+    month_count = matrix.shape[1]
+    weights = alpha * (1 - alpha) ** np.arange(month_count - 1, -1, -1, dtype=np.float64)
+    weights[0] = (1 - alpha) ** (month_count - 1)
+    return matrix @ weights
+
+def compute_trends(categories, matrix, window=ROLLING_MONTHS):
+    # Per-category trend of the matrix, biggest moves first: latest rolling mean against the one a window earlier,
+    # the last month-over-month change and a next-month forecast averaging the linear and smoothed ones
+    if not categories or matrix.shape[1] < 2 * window:
+        return []
+    # Averages and forecasts are rounded to whole cents like every stored amount
+    means = np.rint(rolling_means(matrix, window))
+    recent, prior = means[:, -1], means[:, -1 - window]
+    month_over_month = np.diff(matrix[:, -2:], axis=1)[:, 0]
+    forecast = np.rint(np.maximum((linear_forecast(matrix) + smoothed_forecast(matrix)) / 2, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(prior > 0, (recent - prior) / prior * 100, np.nan)
+
+    significant = (np.abs(change) >= TREND_THRESHOLD_PERCENT) & (np.maximum(recent, prior) >= MIN_TREND_CENTS)
+    selected = np.flatnonzero(significant)
+    selected = selected[np.argsort(-np.abs(change[selected]), kind='stable')][:MAX_TRENDS]
+
+    return [{
+        'category': categories[index],
+        'changePercent': float(change[index]),
+        'months': window,
+        'monthlyAverage': cents_to_amount(int(recent[index])),
+        'previousMonthlyAverage': cents_to_amount(int(prior[index])),
+        'lastMonthChange': cents_to_amount(int(month_over_month[index])),
+        'forecast': cents_to_amount(int(forecast[index]))
+    } for index in selected.tolist()]
+
+def spending_trends(transactions, first_month):
+    return compute_trends(*build_matrix(transactions, first_month))
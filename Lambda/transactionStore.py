@@ -0,0 +1,196 @@
+import calendar
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from boto3.dynamodb.conditions import Key
+from itemCodec import query_pages
+from awsClients import get_resource
+
+TRANSACTIONS_TABLE_NAME = 'Transactions'
+
+BATCH_GET_LIMIT = 100  # BatchGetItem limit
+MAX_WORKERS = 8
+
+# Secondary index on the Transactions table keyed by the owning user and sorted by date (see main.tf)
+USER_INDEX_NAME = 'userID-date-index'
+
+# Formats accepted from clients; every date is stored as ISO YYYY-MM-DD so it sorts correctly
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y']
+
+def normalize_date(value):
+    # Return the ISO YYYY-MM-DD form of a client date, or None when it cannot be parsed
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    try:
+        # Full ISO timestamps keep only their date part
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def parse_date_window(body):
+    # Read the optional 'from'/'to' bounds (or a 'month' of the form YYYY-MM), returning (start, end, error)
+    if body.get('month'):
+        try:
+            month = datetime.strptime(body['month'], '%Y-%m')
+        except (TypeError, ValueError):
+            return None, None, 'Invalid month, expected YYYY-MM'
+        last_day = calendar.monthrange(month.year, month.month)[1]
+        return month.strftime('%Y-%m-01'), month.strftime(f'%Y-%m-{last_day:02d}'), None
+
+    start = normalize_date(body['from']) if body.get('from') else None
+    end = normalize_date(body['to']) if body.get('to') else None
+    if (body.get('from') and not start) or (body.get('to') and not end):
+        return None, None, 'Invalid from/to date'
+    if start and end and start > end:
+        return None, None, "'from' must not be after 'to'"
+    return start, end, None
+
+def date_key_condition(user_id, start_date=None, end_date=None):
+    # Restrict the query to the requested window on the date sort key
+    condition = Key('userID').eq(user_id)
+    if start_date and end_date:
+        return condition & Key('date').between(start_date, end_date)
+    if start_date:
+        return condition & Key('date').gte(start_date)
+    if end_date:
+        return condition & Key('date').lte(end_date)
+    return condition
+
+def build_projection(attributes):
+    # Map every attribute to a placeholder so reserved words such as 'date' are safe
+    names = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+    return ', '.join(names), names
+
+def query_user_transaction_pages(table, user_id, attributes=None, page_size=None, start_key=None,
+                                 start_date=None, end_date=None, filter_condition=None):
+    # Query the per-user index instead of scanning the whole table, yielding (items, last_key) per page
+    query_kwargs = {
+        'IndexName': USER_INDEX_NAME,
+        'KeyConditionExpression': date_key_condition(user_id, start_date, end_date)
+    }
+    if filter_condition is not None:
+        query_kwargs['FilterExpression'] = filter_condition
+
+    # Only read the attributes the caller actually needs
+    if attributes:
+        projection, names = build_projection(attributes)
+        query_kwargs['ProjectionExpression'] = projection
+        query_kwargs['ExpressionAttributeNames'] = names
+
+    if page_size:
+        query_kwargs['Limit'] = page_size
+
+    # Resume from a checkpoint when one is given
+    if start_key:
+        query_kwargs['ExclusiveStartKey'] = start_key
+
+    # Follow LastEvaluatedKey so users with more than 1 MB of data are not truncated
+    while True:
+        response = table.query(**query_kwargs)
+        last_key = response.get('LastEvaluatedKey')
+        yield response.get('Items', []), last_key
+
+        if not last_key:
+            break
+        query_kwargs['ExclusiveStartKey'] = last_key
+
+def query_user_transactions(table, user_id, attributes=None, page_size=None, start_date=None, end_date=None):
+    # Stream a user's transactions one item at a time, optionally limited to a date window
+    for items, _ in query_user_transaction_pages(table, user_id, attributes, page_size,
+                                                 start_date=start_date, end_date=end_date):
+        for item in items:
+            yield item
+
+def read_user_transactions(table, user_id, attributes, start_date=None, end_date=None):
+    # Same as query_user_transactions through the low-level client, for aggregations: numbers arrive as int
+    for items, _ in query_pages(table.name, date_key_condition(user_id, start_date, end_date), attributes,
+                                index_name=USER_INDEX_NAME):
+        for item in items:
+            yield item
+
+def scan_segment(table, segment, total_segments, attributes):
+    # Read one segment of a parallel scan, following pagination
+    projection, names = build_projection(attributes)
+    scan_kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ProjectionExpression': projection,
+        'ExpressionAttributeNames': names
+    }
+    items = []
+    while True:
+        response = table.scan(**scan_kwargs)
+        items.extend(response.get('Items', []))
+
+        last_key = response.get('LastEvaluatedKey')
+        if not last_key:
+            break
+        scan_kwargs['ExclusiveStartKey'] = last_key
+    return items
+
+def parallel_scan(table, attributes, total_segments):
+    # Scan every segment concurrently and yield the items as each segment completes
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [executor.submit(scan_segment, table, segment, total_segments, attributes)
+                   for segment in range(total_segments)]
+        for future in futures:
+            for item in future.result():
+                yield item
+
+def load_transactions(transaction_table, transaction_ids):
+    # Read many rows by ID with parallel BatchGetItem calls of 100, retrying unprocessed keys
+    dynamodb = get_resource('dynamodb')
+
+    def load_chunk(chunk):
+        items = []
+        request_items = {transaction_table.name: {'Keys': [{'id': transaction_id} for transaction_id in chunk],
+                                                  'ConsistentRead': True}}
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            items.extend(response.get('Responses', {}).get(transaction_table.name, []))
+            request_items = response.get('UnprocessedKeys') or {}
+            if request_items:
+                time.sleep(min(0.05 * (2 ** attempt), 2))
+                attempt += 1
+        return items
+
+    transaction_ids = list(dict.fromkeys(transaction_ids))
+    chunks = [transaction_ids[start:start + BATCH_GET_LIMIT] for start in range(0, len(transaction_ids), BATCH_GET_LIMIT)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        return [item for items in executor.map(load_chunk, chunks) for item in items]
+
+# The TransactWriteItems actions below are passed to table.meta.client, which (like the
+# resource itself) serializes plain Python values into DynamoDB attribute values
+
+def transaction_put(item, only_if_new=False):
+    # TransactWriteItems action that inserts a transaction row
+    put = {
+        'TableName': TRANSACTIONS_TABLE_NAME,
+        'Item': item
+    }
+    # Refuse to overwrite an existing row so replayed writes cancel instead of duplicating
+    if only_if_new:
+        put['ConditionExpression'] = 'attribute_not_exists(id)'
+    return {'Put': put}
+
+def write_batch(table, requests, max_attempts=8):
+    # Send up to 25 PutRequest/DeleteRequest entries, retrying whatever DynamoDB leaves unprocessed
+    request_items = {table.name: requests}
+    for attempt in range(max_attempts):
+        response = table.meta.client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return []
+        # Back off before retrying throttled items
+        time.sleep(min(0.05 * (2 ** attempt), 2))
+    return request_items.get(table.name, [])
@@ -1,48 +1,45 @@
 import json
-import boto3
-from boto3.dynamodb.conditions import Attr
-from decimal import Decimal
-from json import JSONEncoder
+from itertools import chain
+from amountFormat import AMOUNT_ATTRIBUTES, stored_cents
+from apiResponse import encode_body
+from transactionStore import parse_date_window, read_user_transactions
+from rollupStore import ROLLUP_TABLE_NAME, get_category_totals
+from archiveStore import read_archived_totals
+from awsClients import get_table
+from responseCache import build_cache_key, get_cached, put_cached, log_cache_stats
+from instrumentation import instrumented
 
-# Custom JSON encoder to handle Decimal types
-class DecimalEncoder(JSONEncoder):
-    def default(self, o):
-        if isinstance(o, Decimal):
-            if o % 1 == 0:
-                return int(o)
-            else:
-                return float(o)
-        return super(DecimalEncoder, self).default(o)
+def query_transactions(table, user_id, start_date=None, end_date=None):
+    # Query the user index for the given user, reading only the rows inside the date window, then the daily
+    # totals of archived rows in the same window
+    items = chain(read_user_transactions(table, user_id, ['category'] + AMOUNT_ATTRIBUTES,
+                                         start_date=start_date, end_date=end_date),
+                  read_archived_totals(user_id, start_date, end_date))
 
-def scan_transactions(table, user_id):
-    # Scan the table for the given user
-    response = table.scan(
-        FilterExpression=Attr('userID').eq(user_id))
-    
-    # Aggregate amounts by category
+    # Aggregate whole cents by category
     category_amounts = {}
-    for item in response['Items']:
+    for item in items:
         category = item['category']
-        amount = item['amount']
+        cents = stored_cents(item)
         if category in category_amounts:
-            category_amounts[category] += amount
+            category_amounts[category] += cents
         else:
-            category_amounts[category] = amount
-    
+            category_amounts[category] = cents
+
     return category_amounts
 
 def calculate_percentages(category_amounts):
     total_amount = sum(category_amounts.values())
-    percentages = {category: "{:.2f}%".format((amount / total_amount) * 100) for category, amount in category_amounts.items()}
+    # Amounts that cancel out to zero leave every share at zero
+    percentages = {category: "{:.2f}%".format((amount / total_amount) * 100 if total_amount else 0)
+                   for category, amount in category_amounts.items()}
     return percentages
 
 # Rest of your code remains the same
 
 
+@instrumented
 def lambda_handler(event, context):
-    # Initialize a boto3 DynamoDB resource
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('Transactions')  # Replace with your table name
     body = json.loads(event['body'])
     # Extract UserID from the event
     user_id = body["userID"]
@@ -51,17 +48,40 @@ def lambda_handler(event, context):
     if not user_id:
         return {
             'statusCode': 400,
-            'body': json.dumps('Missing UserID')
+            'body': encode_body('Missing UserID')
+        }
+
+    start_date, end_date, error = parse_date_window(body)
+    if error:
+        return {
+            'statusCode': 400,
+            'body': encode_body(error)
+        }
+
+    # Serve a cached answer while the user's data is unchanged
+    cache_key = build_cache_key(user_id, 'transactionsCategorization', None, start_date, end_date)
+    response_body, cache_outcome = get_cached(cache_key)
+    log_cache_stats('transactionsCategorization', cache_outcome)
+    if response_body is not None:
+        return {
+            'statusCode': 200,
+            'headers': {'X-Cache': cache_outcome},
+            'body': response_body
         }
 
-    # Scan the DynamoDB table
-    category_amounts = scan_transactions(table, user_id)
+    if start_date or end_date:
+        # Windowed requests only read the rows inside the window
+        category_amounts = query_transactions(get_table('Transactions'), user_id, start_date, end_date)
+    else:
+        # All-time totals come straight from the rollup store
+        category_amounts = get_category_totals(get_table(ROLLUP_TABLE_NAME), user_id)
 
     # Calculate the percentages
-    percentages = calculate_percentages(category_amounts)
+    response_body = encode_body(calculate_percentages(category_amounts))
+    put_cached(cache_key, response_body)
 
-    # Return the result using the custom JSON encoder
     return {
         'statusCode': 200,
-        'body': percentages
+        'headers': {'X-Cache': cache_outcome},
+        'body': response_body
     }
@@ -1,15 +1,47 @@
-import boto3
 import json
+from userStore import CONTACT_NORMALIZERS, forget_users, update_user
+from awsClients import get_table
+from apiResponse import encode_body
+from instrumentation import instrumented
 
+@instrumented
 def lambda_handler(event, context):
-    # Initialize a DynamoDB client
-    dynamodb = boto3.resource('dynamodb')
-
     # Reference to the 'Users' table
-    table = dynamodb.Table('Users')
+    table = get_table('Users')
     body = json.loads(event['body'])
     # Extract the user ID from the event
     user_id = body["id"]
+    changes = {key: value for key, value in body.items() if key != 'id'}
+
+    # Contacts are stored normalized and must stay unique, so changing one moves its guard item as well
+    for field, normalize in CONTACT_NORMALIZERS.items():
+        if field in changes:
+            changes[field] = normalize(changes[field])
+            if not changes[field]:
+                return {
+                    'statusCode': 400,
+                    'body': encode_body(f'Invalid {field}.')
+                }
+
+    if any(field in changes for field in CONTACT_NORMALIZERS):
+        updated, taken = update_user(user_id, changes)
+        if taken:
+            return {
+                'statusCode': 409,
+                'body': encode_body({
+                    'message': f"{' and '.join(taken).capitalize()} already registered to another user.",
+                    'conflicts': taken
+                })
+            }
+        if not updated:
+            return {
+                'statusCode': 409,
+                'body': encode_body('User was changed concurrently, retry the update.')
+            }
+        return {
+            'statusCode': 200,
+            'body': encode_body('User updated successfully.')
+        }
 
     # Prepare update expression, attribute values, and attribute names
     update_expression = 'SET '
@@ -17,26 +49,27 @@ def lambda_handler(event, context):
     expression_attribute_names = {}
 
     # Add each attribute to the update expression
-    for key in body:
-        if key != 'id':
-            placeholder = f"#{key}"
-            update_expression += f"{placeholder} = :{key}, "
-            expression_attribute_values[f":{key}"] = event[key]
-            expression_attribute_names[placeholder] = key
+    for key in changes:
+        placeholder = f"#{key}"
+        update_expression += f"{placeholder} = :{key}, "
+        expression_attribute_values[f":{key}"] = changes[key]
+        expression_attribute_names[placeholder] = key
 
     # Remove trailing comma and space
     update_expression = update_expression.rstrip(', ')
 
     # Update the user data in the DynamoDB table
-    response = table.update_item(
+    table.update_item(
         Key={'id': user_id},
         UpdateExpression=update_expression,
         ExpressionAttributeValues=expression_attribute_values,
         ExpressionAttributeNames=expression_attribute_names  # Include this in the call
     )
+    # Drop this container's cached copy; other containers' copies expire within the user cache TTL
+    forget_users([user_id])
 
     # Return a success message
     return {
         'statusCode': 200,
-        'body': json.dumps('User updated successfully.')
+        'body': encode_body('User updated successfully.')
     }
@@ -0,0 +1,255 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from awsClients import get_resource, get_table
+
+USERS_TABLE_NAME = 'Users'
+
+# One guard item per email and phone in use, keyed 'email#<address>' / 'phone#<number>' and holding the owning
+# userID (see aws_dynamodb_table.UserContacts in main.tf). Conditional puts on these keep contacts unique
+CONTACTS_TABLE_NAME = 'UserContacts'
+
+# Secondary indexes on the Users table, so finding a user by contact is one query at any table size
+CONTACT_INDEXES = {'email': 'email-index', 'phone': 'phone-index'}
+
+BATCH_GET_LIMIT = 100  # BatchGetItem limit
+MAX_ATTEMPTS = 4
+MAX_WORKERS = 8
+
+# userID -> (item or None, expiry), least recently used first, kept across warm invocations of the container.
+# Entries expire so other containers' updates show up; unknown users are remembered only briefly, since
+# makeQattah validates against this cache and a user created elsewhere should not stay rejected for long
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL', '60'))
+MISSING_USER_TTL_SECONDS = 5
+
+_user_cache = OrderedDict()
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+PHONE_PATTERN = re.compile(r'^\+?\d{7,15}$')
+
+def normalize_email(value):
+    # Lowercase address, the form stored, indexed and guarded; None when it is not an email address
+    email = str(value or '').strip().lower()
+    return email if EMAIL_PATTERN.match(email) else None
+
+def normalize_phone(value):
+    # Digits with an optional leading '+', without spaces, dashes, dots or brackets; None when it is not a number
+    phone = re.sub(r'[\s\-.()]', '', str(value or ''))
+    return phone if PHONE_PATTERN.match(phone) else None
+
+CONTACT_NORMALIZERS = {'email': normalize_email, 'phone': normalize_phone}
+
+def contact_key(field, value):
+    return {'contact': f'{field}#{value}'}
+
+def contact_claim(field, value, user_id):
+    # TransactWriteItems action reserving a contact for the user; cancels if another user holds it
+    return {
+        'Put': {
+            'TableName': CONTACTS_TABLE_NAME,
+            'Item': {**contact_key(field, value), 'userID': user_id},
+            'ConditionExpression': 'attribute_not_exists(contact) OR userID = :user',
+            'ExpressionAttributeValues': {':user': user_id}
+        }
+    }
+
+def contact_release(field, value, user_id):
+    # TransactWriteItems action freeing a contact the user holds; cancels if the user does not hold it
+    return {
+        'Delete': {
+            'TableName': CONTACTS_TABLE_NAME,
+            'Key': contact_key(field, value),
+            'ConditionExpression': 'userID = :user',
+            'ExpressionAttributeValues': {':user': user_id}
+        }
+    }
+
+def contacts_unchanged(user, fields):
+    # Condition pinning the user's contacts to what was read, so guards are never moved from stale values
+    conditions = []
+    names = {}
+    values = {}
+    for index, field in enumerate(fields):
+        names[f'#c{index}'] = field
+        if user.get(field) is None:
+            conditions.append(f'attribute_not_exists(#c{index})')
+        else:
+            conditions.append(f'#c{index} = :c{index}')
+            values[f':c{index}'] = user[field]
+    return ' AND '.join(conditions), names, values
+
+def run_transaction(actions):
+    # Indexes of the actions whose condition failed, or an empty set once the transaction went through
+    try:
+        get_table(USERS_TABLE_NAME).meta.client.transact_write_items(TransactItems=actions)
+        return set()
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        reasons = e.response.get('CancellationReasons', [])
+        failed = {index for index, reason in enumerate(reasons) if reason.get('Code') == 'ConditionalCheckFailed'}
+        if not failed:
+            raise
+        return failed
+
+def read_user(user_id):
+    return get_table(USERS_TABLE_NAME).get_item(Key={'id': user_id}, ConsistentRead=True).get('Item')
+
+def create_user(user):
+    # Write a new user with the guards reserving its contacts, returning the contact fields another user
+    # already holds (nothing is written then)
+    fields = [field for field in CONTACT_NORMALIZERS if user.get(field)]
+    actions = [{
+        'Put': {
+            'TableName': USERS_TABLE_NAME,
+            'Item': user,
+            'ConditionExpression': 'attribute_not_exists(id)'
+        }
+    }]
+    actions.extend(contact_claim(field, user[field], user['id']) for field in fields)
+    failed = run_transaction(actions)
+    return [field for index, field in enumerate(fields, start=1) if index in failed]
+
+def update_user(user_id, changes):
+    # Apply attribute changes to a user, moving the guards of any contact that changes in the same transaction.
+    # Returns (updated, contact fields another user holds); (False, []) when the user kept changing underneath
+    not_held = {}
+    for attempt in range(MAX_ATTEMPTS):
+        current = read_user(user_id) or {}
+        moved = [field for field in CONTACT_NORMALIZERS if field in changes and changes[field] != current.get(field)]
+        condition, names, values = contacts_unchanged(current, moved)
+        update = {
+            'TableName': USERS_TABLE_NAME,
+            'Key': {'id': user_id},
+            'UpdateExpression': 'SET ' + ', '.join(f'#u{index} = :u{index}' for index in range(len(changes))),
+            'ExpressionAttributeNames': {**names, **{f'#u{index}': key for index, key in enumerate(changes)}},
+            'ExpressionAttributeValues': {**values, **{f':u{index}': value for index, value in enumerate(changes.values())}}
+        }
+        if condition:
+            update['ConditionExpression'] = condition
+
+        claims = [contact_claim(field, changes[field], user_id) for field in moved]
+        # Users from before the guards existed, or duplicates found by migrateUserContacts, may not hold their old
+        # contact; such releases are dropped after the first cancellation
+        releases = [field for field in moved if current.get(field) and not_held.get(field) != current[field]]
+        actions = ([{'Update': update}] + claims +
+                   [contact_release(field, current[field], user_id) for field in releases])
+
+        failed = run_transaction(actions)
+        if not failed:
+            forget_users([user_id])
+            return True, []
+        taken = [field for index, field in enumerate(moved, start=1) if index in failed]
+        if taken:
+            return False, taken
+        for index, field in enumerate(releases, start=1 + len(moved)):
+            if index in failed:
+                not_held[field] = current[field]
+    return False, []
+
+def delete_user(user_id):
+    # Delete a user and release its contacts, returning the deleted item or None when there was no such user
+    not_held = {}
+    for attempt in range(MAX_ATTEMPTS):
+        current = read_user(user_id)
+        if not current:
+            forget_users([user_id])
+            return None
+        fields = list(CONTACT_NORMALIZERS)
+        condition, names, values = contacts_unchanged(current, fields)
+        delete = {
+            'TableName': USERS_TABLE_NAME,
+            'Key': {'id': user_id},
+            'ConditionExpression': condition,
+            'ExpressionAttributeNames': names
+        }
+        if values:
+            delete['ExpressionAttributeValues'] = values
+
+        releases = [field for field in fields if current.get(field) and not_held.get(field) != current[field]]
+        failed = run_transaction([{'Delete': delete}] +
+                                 [contact_release(field, current[field], user_id) for field in releases])
+        if not failed:
+            forget_users([user_id])
+            return current
+        for index, field in enumerate(releases, start=1):
+            if index in failed:
+                not_held[field] = current[field]
+    raise RuntimeError(f'User {user_id} kept changing while being deleted')
+
+def find_user_by_contact(field, value):
+    # The user holding an email or phone, from one query on its index, or None
+    contact = CONTACT_NORMALIZERS[field](value)
+    if not contact:
+        return None
+    response = get_table(USERS_TABLE_NAME).query(
+        IndexName=CONTACT_INDEXES[field],
+        KeyConditionExpression=Key(field).eq(contact),
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+def contact_field(value):
+    # 'email' for anything with an '@', otherwise 'phone'
+    return 'email' if '@' in str(value) else 'phone'
+
+def find_users_by_contacts(contacts):
+    # contact -> user (or None) for many emails and phones, one index query each, run concurrently
+    contacts = list(dict.fromkeys(contacts))
+    if not contacts:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(contacts), MAX_WORKERS)) as executor:
+        users = executor.map(lambda contact: find_user_by_contact(contact_field(contact), contact), contacts)
+        return dict(zip(contacts, users))
+
+def remember_user(user_id, item, now):
+    ttl = USER_CACHE_TTL_SECONDS if item is not None else MISSING_USER_TTL_SECONDS
+    _user_cache[user_id] = (item, now + ttl)
+    _user_cache.move_to_end(user_id)
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+
+def forget_users(user_ids):
+    for user_id in user_ids:
+        _user_cache.pop(user_id, None)
+
+def get_users(user_ids):
+    # userID -> user item for every given ID that exists, answering from the container's LRU first and
+    # fetching the rest with BatchGetItem, 100 keys per call
+    now = time.monotonic()
+    users = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = _user_cache.get(user_id)
+        if cached and cached[1] > now:
+            _user_cache.move_to_end(user_id)
+            if cached[0] is not None:
+                users[user_id] = cached[0]
+        else:
+            missing.append(user_id)
+
+    dynamodb = get_resource('dynamodb')
+    fetched = {}
+    for start in range(0, len(missing), BATCH_GET_LIMIT):
+        request_items = {USERS_TABLE_NAME: {'Keys': [{'id': user_id} for user_id in missing[start:start + BATCH_GET_LIMIT]]}}
+        # Retry whatever DynamoDB leaves unprocessed
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(USERS_TABLE_NAME, []):
+                fetched[item['id']] = item
+            request_items = response.get('UnprocessedKeys') or {}
+            if request_items:
+                time.sleep(min(0.05 * (2 ** attempt), 2))
+                attempt += 1
+
+    for user_id in missing:
+        remember_user(user_id, fetched.get(user_id), now)
+    users.update(fetched)
+    return users
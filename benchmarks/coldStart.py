@@ -0,0 +1,147 @@
+# Measure cold-start and warm-invoke time for every handler in Lambda/.
+#
+#   python benchmarks/coldStart.py [--runs 5] [--output coldstart.json] [--baseline coldstart.json]
+#
+# Each measurement runs in a fresh interpreter so nothing is shared between handlers. The init
+# phase is the module import on its own; the invoke phase runs against the local stand-in from
+# localAws (moto, or DynamoDB Local when AWS_ENDPOINT_URL is set). With --baseline the run exits
+# non-zero when a handler gets slower than the baseline by more than --tolerance.
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+USER_ID = 'bench-user'
+TRANSACTION_ID = 'bench-transaction'
+
+# One representative API Gateway request body per handler
+EVENTS = {
+    'createTransaction': {'amount': 12.5, 'category': 'Dining Out', 'date': '2024-01-15', 'title': 'Lunch', 'userID': USER_ID},
+    'createUser': {'name': 'Bench', 'email': 'bench@example.com', 'phone': '0500000000'},
+    'deleteUser': {'id': 'bench-deleted-user'},
+    'getUser': {'id': USER_ID},
+    'makeQattah': {'amount': 90, 'category': 'Qattah', 'date': '2024-01-15', 'title': 'Dinner', 'users': ['friend-1', 'friend-2'], 'creatorID': USER_ID},
+    'markPaid': {'transactionID': TRANSACTION_ID, 'userID': USER_ID},
+    'notifyUser': {'userID': USER_ID, 'transactionID': TRANSACTION_ID},
+    'paymentPlan': {'userID': USER_ID, 'planType': 'saving'},
+    'transactionsCategorization': {'userID': USER_ID},
+    'updateUser': {'id': USER_ID, 'name': 'Bench Updated'}
+}
+
+def seed():
+    from createTransaction import add_transaction
+    from awsClients import get_table
+
+    get_table('Users').put_item(Item={'id': USER_ID, 'name': 'Bench', 'email': 'bench@example.com', 'phone': '0500000000'})
+    get_table('Transactions').put_item(Item={
+        'id': TRANSACTION_ID, 'amountCents': 3000, 'category': 'Qattah', 'date': '2024-01-01',
+        'title': 'Seed', 'userID': USER_ID, 'is_paid': False, 'came_from': 'friend-1'
+    })
+    for index in range(50):
+        add_transaction(get_table('Transactions'), (index + 1) * 100, ['Dining Out', 'Housing', 'Shopping'][index % 3],
+                        '2024-01-01', f'Seed {index}', USER_ID)
+
+def measure_init(handler_name):
+    # Time the module import alone, the work Lambda does in its init phase
+    start = time.perf_counter()
+    __import__(handler_name)
+    return {'init_ms': (time.perf_counter() - start) * 1000}
+
+def measure_invokes(handler_name, warm_runs):
+    import localAws
+    localAws.start()
+    localAws.create_tables()
+    seed()
+
+    # Drop the clients created while seeding so the first invoke pays for them like a real cold start
+    import awsClients
+    awsClients._session = None
+    awsClients._clients.clear()
+    awsClients._low_level_clients.clear()
+    awsClients._resources.clear()
+    awsClients._tables.clear()
+
+    module = __import__(handler_name)
+    event = {'body': json.dumps(EVENTS[handler_name])}
+
+    def invoke():
+        start = time.perf_counter()
+        response = module.lambda_handler(event, None)
+        return (time.perf_counter() - start) * 1000, response.get('statusCode')
+
+    first_ms, status = invoke()
+    warm = [invoke()[0] for _ in range(warm_runs)]
+    return {'first_invoke_ms': first_ms, 'warm_invoke_ms': statistics.median(warm), 'status': status}
+
+def run_child(mode, handler_name, warm_runs):
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode, handler_name, '--warm', str(warm_runs)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure(handler_name, runs, warm_runs):
+    samples = [{**run_child('init', handler_name, warm_runs), **run_child('invoke', handler_name, warm_runs)}
+               for _ in range(runs)]
+    result = {key: statistics.median(sample[key] for sample in samples)
+              for key in ('init_ms', 'first_invoke_ms', 'warm_invoke_ms')}
+    result['cold_start_ms'] = result['init_ms'] + result['first_invoke_ms']
+    result['status'] = samples[-1]['status']
+    return result
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for handler_name, result in results.items():
+        previous = baseline.get(handler_name)
+        if not previous:
+            continue
+        for key in ('cold_start_ms', 'warm_invoke_ms'):
+            if result[key] > previous[key] * (1 + tolerance):
+                regressions.append(f'{handler_name} {key}: {previous[key]:.1f} -> {result[key]:.1f}')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warm', type=int, default=20)
+    parser.add_argument('--handlers', nargs='*', default=sorted(EVENTS))
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'HANDLER'))
+    args = parser.parse_args()
+
+    if args.child:
+        mode, handler_name = args.child
+        sys.path.insert(0, BENCH_DIR)
+        # Imported only for its side effect of putting Lambda/ on sys.path; measure_invokes starts the stand-in
+        importlib.import_module('localAws')
+        result = measure_init(handler_name) if mode == 'init' else measure_invokes(handler_name, args.warm)
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    for handler_name in args.handlers:
+        results[handler_name] = measure(handler_name, args.runs, args.warm)
+        result = results[handler_name]
+        print(f"{handler_name:28} init {result['init_ms']:8.1f} ms  first {result['first_invoke_ms']:8.1f} ms  "
+              f"warm {result['warm_invoke_ms']:8.2f} ms  (status {result['status']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
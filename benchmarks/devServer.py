@@ -0,0 +1,106 @@
+# Serve the API locally through the same router Lambda used by deployment_mode = "router".
+#
+#   python benchmarks/devServer.py [--port 8080] [--local]
+#
+# Requests are turned into API Gateway HTTP API (payload format 2.0) events, e.g.
+#   curl -X POST localhost:8080/transactions/createTransaction -d '{"amount": 10, ...}'
+# With --local the handlers run against the stand-in from localAws instead of the configured AWS account.
+import argparse
+import base64
+import json
+import os
+import sys
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import localAws
+
+STAGE_NAME = 'serverless_lambda_stage'
+
+class LocalContext:
+    # The parts of the Lambda context object the handlers use
+    function_name = 'router'
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+def build_event(method, raw_path, headers, body):
+    url = urlsplit(raw_path)
+    path = url.path
+    # Accept both /route and /<stage>/route, like the deployed invoke URL
+    if path.startswith(f'/{STAGE_NAME}/'):
+        path = path[len(STAGE_NAME) + 1:]
+    try:
+        text, is_base64 = body.decode('utf-8'), False
+    except UnicodeDecodeError:
+        text, is_base64 = base64.b64encode(body).decode('ascii'), True
+
+    return {
+        'version': '2.0',
+        'routeKey': f"{method} {path.lstrip('/')}",
+        'rawPath': path,
+        'rawQueryString': url.query,
+        'queryStringParameters': dict(parse_qsl(url.query)) or None,
+        'headers': {name.lower(): value for name, value in headers.items()},
+        'requestContext': {'http': {'method': method, 'path': path}, 'requestId': str(uuid.uuid4()), 'stage': STAGE_NAME},
+        'body': text or None,
+        'isBase64Encoded': is_base64
+    }
+
+class RouterRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        import router
+        length = int(self.headers.get('Content-Length') or 0)
+        event = build_event(self.command, self.path, self.headers, self.rfile.read(length))
+        try:
+            response = router.lambda_handler(event, LocalContext())
+        except Exception as e:
+            response = {'statusCode': 500, 'body': json.dumps(f'{type(e).__name__}: {e}')}
+
+        body = response.get('body', '')
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+
+        self.send_response(response.get('statusCode', 200))
+        headers = {'Content-Type': 'application/json', **response.get('headers', {})}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--local', action='store_true')
+    args = parser.parse_args()
+
+    mock = None
+    if args.local:
+        mock = localAws.start()
+        localAws.create_tables()
+
+    server = ThreadingHTTPServer((args.host, args.port), RouterRequestHandler)
+    print(f'Serving the router on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if mock:
+            mock.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import os
+import shutil
+import sys
+import threading
+
+# Make the Lambda sources importable the same way the deployed zip lays them out
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+# Table definitions mirroring the aws_dynamodb_table resources in main.tf
+TABLES = [
+    {
+        'TableName': 'Users',
+        'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'email', 'AttributeType': 'S'},
+            {'AttributeName': 'phone', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [{
+            'IndexName': 'email-index',
+            'KeySchema': [{'AttributeName': 'email', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }, {
+            'IndexName': 'phone-index',
+            'KeySchema': [{'AttributeName': 'phone', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }]
+    },
+    {
+        'TableName': 'UserContacts',
+        'KeySchema': [{'AttributeName': 'contact', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'contact', 'AttributeType': 'S'}]
+    },
+    {
+        'TableName': 'Transactions',
+        'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'date', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [{
+            'IndexName': 'userID-date-index',
+            'KeySchema': [
+                {'AttributeName': 'userID', 'KeyType': 'HASH'},
+                {'AttributeName': 'date', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'}
+        }]
+    },
+    {
+        'TableName': 'CategoryTotals',
+        'KeySchema': [
+            {'AttributeName': 'userID', 'KeyType': 'HASH'},
+            {'AttributeName': 'category', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'category', 'AttributeType': 'S'}
+        ]
+    },
+    {
+        'TableName': 'PaymentPlans',
+        'KeySchema': [
+            {'AttributeName': 'userID', 'KeyType': 'HASH'},
+            {'AttributeName': 'planType', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'planType', 'AttributeType': 'S'}
+        ]
+    },
+    {
+        'TableName': 'UserDataVersions',
+        'KeySchema': [{'AttributeName': 'userID', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'userID', 'AttributeType': 'S'}]
+    },
+    {
+        'TableName': 'ResponseCache',
+        'KeySchema': [{'AttributeName': 'cacheKey', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'cacheKey', 'AttributeType': 'S'}]
+    },
+    {
+        'TableName': 'QattahBalances',
+        'KeySchema': [
+            {'AttributeName': 'userID', 'KeyType': 'HASH'},
+            {'AttributeName': 'counterpartyID', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'counterpartyID', 'AttributeType': 'S'}
+        ]
+    },
+    {
+        'TableName': 'QattahRequests',
+        'KeySchema': [{'AttributeName': 'idempotencyKey', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'idempotencyKey', 'AttributeType': 'S'}]
+    },
+    {
+        'TableName': 'TransactionSearchIndex',
+        'KeySchema': [
+            {'AttributeName': 'userID', 'KeyType': 'HASH'},
+            {'AttributeName': 'termKey', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'termKey', 'AttributeType': 'S'}
+        ]
+    },
+    {
+        'TableName': 'ArchivedTotals',
+        'KeySchema': [
+            {'AttributeName': 'userID', 'KeyType': 'HASH'},
+            {'AttributeName': 'dayKey', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'userID', 'AttributeType': 'S'},
+            {'AttributeName': 'dayKey', 'AttributeType': 'S'}
+        ]
+    }
+]
+
+SENDER_EMAIL = 's201915790@kfupm.edu.sa'
+# Local sink for the handlers' metric lines (see Lambda/instrumentation.py); summarize with metricsReport.py
+METRICS_SINK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics.jsonl')
+# Local directory standing in for the archive bucket (see Lambda/archiveStore.py)
+ARCHIVE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+
+def start():
+    # Use DynamoDB Local (or any endpoint) when AWS_ENDPOINT_URL is set, otherwise an in-process moto stand-in
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'local')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'local')
+    os.environ.setdefault('METRICS_SINK', METRICS_SINK)
+    os.environ.setdefault('ARCHIVE_LOCATION', ARCHIVE_DIRECTORY)
+    if os.environ.get('AWS_ENDPOINT_URL'):
+        return None
+
+    from moto import mock_aws
+    mock = mock_aws()
+    mock.start()
+    release_transaction_snapshots()
+    return mock
+
+def release_transaction_snapshots():
+    # moto snapshots every table a TransactWriteItems call touches, and its model tracker (only used by the moto
+    # dashboard) keeps every copied table and item alive, so benchmarks with many transactions run out of memory.
+    # The snapshot is not thread-safe either, so concurrent transactions (archiveTransactions) run one at a time
+    from moto.core.model_instances import reset_model_data
+    from moto.dynamodb.models import DynamoDBBackend
+    if getattr(DynamoDBBackend.transact_write_items, 'releases_snapshots', False):
+        return
+    transact_write_items = DynamoDBBackend.transact_write_items
+    lock = threading.Lock()
+
+    def transact_write_items_releasing_snapshots(self, transact_items):
+        with lock:
+            try:
+                return transact_write_items(self, transact_items)
+            finally:
+                reset_model_data()
+
+    transact_write_items_releasing_snapshots.releases_snapshots = True
+    DynamoDBBackend.transact_write_items = transact_write_items_releasing_snapshots
+
+def clear_archive():
+    # Empty the local archive, so a run does not merge partitions left by an earlier one into its own
+    if os.environ.get('ARCHIVE_LOCATION') == ARCHIVE_DIRECTORY:
+        shutil.rmtree(ARCHIVE_DIRECTORY, ignore_errors=True)
+
+def create_tables():
+    import boto3
+    dynamodb = boto3.client('dynamodb')
+    existing = set(dynamodb.list_tables()['TableNames'])
+    for definition in TABLES:
+        if definition['TableName'] not in existing:
+            dynamodb.create_table(BillingMode='PAY_PER_REQUEST', **definition)
+
+    # SES only sends from verified identities; the template mirrors aws_ses_template in main.tf
+    ses = boto3.client('ses')
+    ses.verify_email_identity(EmailAddress=SENDER_EMAIL)
+    if not any(template['Name'] == 'PaymentNotification' for template in ses.list_templates()['TemplatesMetadata']):
+        ses.create_template(Template={
+            'TemplateName': 'PaymentNotification',
+            'SubjectPart': 'Payment',
+            'TextPart': 'Your transaction with ID {{transactionID}} has been processed.'
+        })
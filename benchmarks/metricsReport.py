@@ -0,0 +1,43 @@
+# Summarize the metric lines the handlers wrote to the local sink, per function.
+#
+#   python benchmarks/metricsReport.py [benchmarks/metrics.jsonl]
+#
+# Functions are sorted by consumed capacity so the endpoints burning the most come first.
+import json
+import os
+import sys
+from collections import defaultdict
+
+import localAws
+
+def summarize(path):
+    functions = defaultdict(lambda: defaultdict(float))
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            totals = functions[record['Function']]
+            totals['Invocations'] += 1
+            for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+                totals[metric['Name']] += record[metric['Name']]
+    return functions
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else localAws.METRICS_SINK
+    if not os.path.exists(path):
+        print(f'No metrics found at {path}')
+        return 1
+
+    functions = summarize(path)
+    print(f"{'function':28} {'calls':>7} {'cold':>5} {'avg ms':>9} {'aws ms':>9} {'RCU':>10} {'WCU':>10} "
+          f"{'read/returned':>14} {'errors':>6}")
+    ranked = sorted(functions.items(), key=lambda entry: -(entry[1]['ReadCapacityUnits'] + entry[1]['WriteCapacityUnits']))
+    for name, totals in ranked:
+        invocations = totals['Invocations']
+        waste = f"{totals['ItemsRead'] / totals['ItemsReturned']:.1f}x" if totals['ItemsReturned'] else '-'
+        print(f"{name:28} {invocations:7.0f} {totals['ColdStart']:5.0f} {totals['Duration'] / invocations:9.2f} "
+              f"{totals['AwsTime'] / invocations:9.2f} {totals['ReadCapacityUnits']:10.1f} "
+              f"{totals['WriteCapacityUnits']:10.1f} {waste:>14} {totals['Errors']:6.0f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# Benchmark every API handler in Lambda/ at realistic data sizes.
+#
+#   python benchmarks/runBenchmarks.py [--sizes 1000 10000 100000 1000000] [--iterations 50]
+#                                      [--output results.json] [--baseline benchmarks/baseline.json]
+#
+# For each dataset size the local stand-in from localAws (moto, or DynamoDB Local when AWS_ENDPOINT_URL
+# is set) is loaded with synthetic Users/Transactions, the rollups are rebuilt, and every handler is
+# driven with API Gateway v2 events, followed by one nightly archival run. Per handler it records latency percentiles, AWS requests per call
+# (by operation), consumed read/write capacity per call and the response payload size. With --baseline
+# the run exits non-zero when requests, capacity or payload size grow beyond --tolerance; latency is
+# only compared with --check-latency because it depends on the machine and on the stand-in.
+#
+# baseline.json covers 1000 and 10000 rows. The dataset keeps about 50 rows per user at every size, so the
+# per-call requests, capacity and payload of the API handlers do not grow with it; only the table-wide
+# archiveTransactions run does. Larger sizes are for latency under DynamoDB Local: moto copies every table a
+# TransactWriteItems call touches, so a 100000-row run takes hours there.
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import localAws
+
+CATEGORIES = ['Housing', 'Groceries', 'Healthcare', 'Entertainment', 'Dining Out', 'Shopping',
+              'Luxury Items', 'Savings', 'Debt Repayment', 'Transportation', 'Qattah']
+READ_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+# Rows per bulkImport request, and how many requests are made, so the import adds a bounded number of rows
+IMPORT_ROWS = 100
+IMPORT_CALLS = 10
+
+class AwsCallRecorder:
+    # Counts AWS calls and consumed capacity through botocore events on the handlers' shared session
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = Counter()
+        self.read_units = 0.0
+        self.write_units = 0.0
+
+    def register(self, events):
+        events.register('before-parameter-build.dynamodb', self.request_capacity)
+        events.register('before-call', self.count_call)
+        events.register('after-call.dynamodb', self.record_capacity)
+
+    def request_capacity(self, params, model, **kwargs):
+        if 'ReturnConsumedCapacity' in model.input_shape.members:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def count_call(self, model, **kwargs):
+        self.calls[f'{model.service_model.service_name}:{model.name}'] += 1
+
+    def record_capacity(self, parsed, model, **kwargs):
+        consumed = parsed.get('ConsumedCapacity') or []
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        units = sum(float(entry.get('CapacityUnits', 0)) for entry in consumed)
+        if model.name in READ_OPERATIONS:
+            self.read_units += units
+        else:
+            self.write_units += units
+
+def api_event(route_key, body):
+    # Minimal API Gateway HTTP API (payload format 2.0) event; a str body (an uploaded file) is sent as it is
+    method, path = route_key.split(' ', 1)
+    return {
+        'version': '2.0',
+        'routeKey': route_key,
+        'rawPath': f'/{path}',
+        'headers': {'content-type': 'application/json'},
+        'requestContext': {'http': {'method': method, 'path': f'/{path}'}, 'requestId': str(uuid.uuid4())},
+        'body': body if isinstance(body, str) else json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+def load_dataset(rows, seed=7):
+    # Synthetic users and transactions dated 2022-2024, old enough to archive; about a tenth of the rows are
+    # unpaid Qattah shares, which stay hot, and the rest are plain transactions
+    from awsClients import get_table
+    random_source = random.Random(seed)
+    user_count = max(10, rows // 50)
+    users = [f'user-{index}' for index in range(user_count)]
+    unpaid = []
+
+    with get_table('Users').batch_writer() as batch:
+        for index, user_id in enumerate(users):
+            batch.put_item(Item={'id': user_id, 'name': f'User {index}', 'email': f'{user_id}@example.com',
+                                 'phone': f'05{index:08d}'})
+
+    # The guard items createUser writes alongside each user
+    with get_table('UserContacts').batch_writer() as batch:
+        for index, user_id in enumerate(users):
+            batch.put_item(Item={'contact': f'email#{user_id}@example.com', 'userID': user_id})
+            batch.put_item(Item={'contact': f'phone#05{index:08d}', 'userID': user_id})
+
+    with get_table('Transactions').batch_writer() as batch:
+        for index in range(rows):
+            user_id = random_source.choice(users)
+            item = {
+                'id': f'txn-{index}',
+                'amountCents': random_source.randint(100, 50000),
+                'category': random_source.choice(CATEGORIES),
+                'date': f'{random_source.randint(2022, 2024)}-{random_source.randint(1, 12):02d}-{random_source.randint(1, 28):02d}',
+                'title': f'Purchase {index}',
+                'userID': user_id
+            }
+            if index % 10 == 0:
+                item['category'] = 'Qattah'
+                item['is_paid'] = False
+                item['came_from'] = random_source.choice(users)
+                unpaid.append((item['id'], user_id))
+            batch.put_item(Item=item)
+
+    # Build the rollups the analytics handlers read from
+    from rebuildRollups import rebuild_rollups
+    rebuild_rollups(repair=True)
+    # Build the title search index; in AWS the Transactions stream keeps it current
+    from indexTransactions import backfill_index
+    backfill_index()
+    return users, unpaid
+
+def build_scenarios(users, unpaid):
+    # (handler module, route key, body factory, call limit) for every API route in main.tf, then a single
+    # archiveTransactions run moving the old plain rows out. deleteUser runs last, removing archives too, and can
+    # delete each user only once
+    pick = random.Random(11)
+    deletable = list(users)
+    pick.shuffle(deletable)
+    return [
+        ('createTransaction', 'POST transactions/createTransaction', lambda: {
+            'amount': pick.randint(1, 500), 'category': pick.choice(CATEGORIES), 'date': '2024-06-01',
+            'title': 'Benchmark', 'userID': pick.choice(users)}, None),
+        ('createUser', 'POST users/createUser', lambda: {
+            'name': 'Bench', 'email': f'{uuid.uuid4().hex}@example.com', 'phone': f'05{pick.randint(0, 10 ** 8):08d}'}, None),
+        ('getUser', 'GET users/getUser', lambda: {'id': pick.choice(users)}, None),
+        ('updateUser', 'PUT users/updateUser', lambda: {'id': pick.choice(users), 'name': 'Renamed'}, None),
+        ('makeQattah', 'POST transactions/makeQattah', lambda: {
+            'amount': pick.randint(10, 900), 'category': 'Qattah', 'date': '2024-06-01', 'title': 'Dinner',
+            'users': pick.sample(users, 5), 'creatorID': pick.choice(users), 'idempotencyKey': uuid.uuid4().hex}, None),
+        ('markPaid', 'POST transactions/markPaid', lambda: dict(zip(('transactionID', 'userID'), pick.choice(unpaid))), None),
+        ('notifyUser', 'POST transactions/notifyUser', lambda: {'userID': pick.choice(users), 'transactionID': 'txn-0'}, None),
+        ('paymentPlan', 'GET transactions/paymentPlan', lambda: {
+            'userID': pick.choice(users), 'planType': pick.choice(['saving', 'debt_reduction', 'budgeting', 'investment'])}, None),
+        ('transactionsCategorization', 'GET transactions/transactionsCategorization', lambda: {'userID': pick.choice(users)}, None),
+        ('getBalances', 'GET users/getBalances', lambda: {'userID': pick.choice(users)}, None),
+        ('getBalanceWith', 'GET users/getBalanceWith', lambda: dict(zip(('userID', 'counterpartyID'), pick.sample(users, 2))), None),
+        ('settlementPlan', 'GET transactions/settlementPlan', lambda: {'users': pick.sample(users, 5)}, None),
+        ('settleGroup', 'POST transactions/settleGroup', lambda: {'users': pick.sample(users, 5)}, None),
+        ('listTransactions', 'GET transactions/listTransactions', lambda: {'userID': pick.choice(users), 'limit': 50}, None),
+        ('searchTransactions', 'GET transactions/searchTransactions', lambda: {
+            'userID': pick.choice(users), 'q': f'purchase {pick.randint(1, 9)}'}, None),
+        ('bulkImport', 'POST transactions/bulkImport', lambda: '\n'.join(json.dumps({
+            'amount': pick.randint(1, 500), 'category': pick.choice(CATEGORIES), 'date': '2024-06-01',
+            'title': 'Imported', 'userID': pick.choice(users)}) for _ in range(IMPORT_ROWS)), IMPORT_CALLS),
+        ('archiveTransactions', 'SCHEDULE archiveTransactions', lambda: {}, 1),
+        ('deleteUser', 'DELETE users/deleteUser', lambda: {'id': deletable.pop()}, len(deletable))
+    ]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_scenario(recorder, module_name, route_key, make_body, iterations, limit=None):
+    if limit is not None:
+        iterations = min(iterations, limit)
+    module = __import__(module_name)
+    latencies, payloads, statuses = [], [], Counter()
+    recorder.reset()
+    for _ in range(iterations):
+        event = api_event(route_key, make_body())
+        start = time.perf_counter()
+        response = module.lambda_handler(event, None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        body = response.get('body')
+        payloads.append(len(body if isinstance(body, str) else json.dumps(body)))
+        statuses[str(response.get('statusCode'))] += 1
+
+    return {
+        'latency_ms': {
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies)
+        },
+        'requests_per_call': sum(recorder.calls.values()) / iterations,
+        'requests_by_operation': {name: count / iterations for name, count in sorted(recorder.calls.items())},
+        'read_capacity_per_call': recorder.read_units / iterations,
+        'write_capacity_per_call': recorder.write_units / iterations,
+        'payload_bytes': statistics.mean(payloads),
+        'status_codes': dict(statuses)
+    }
+
+def run_size(rows, iterations):
+    import awsClients
+    mock = localAws.start()
+    try:
+        localAws.create_tables()
+        localAws.clear_archive()
+        users, unpaid = load_dataset(rows)
+
+        # Fresh clients carrying the recorder's hooks, as a new container would build them
+        awsClients._session = None
+        awsClients._clients.clear()
+        awsClients._low_level_clients.clear()
+        awsClients._resources.clear()
+        awsClients._tables.clear()
+        recorder = AwsCallRecorder()
+        recorder.register(awsClients.get_session().events)
+
+        results = {}
+        for module_name, route_key, make_body, limit in build_scenarios(users, unpaid):
+            results[module_name] = run_scenario(recorder, module_name, route_key, make_body, iterations, limit)
+        return results
+    finally:
+        if mock:
+            mock.stop()
+
+def compare(results, baseline, tolerance, check_latency):
+    regressions = []
+    for size, handlers in results['sizes'].items():
+        for handler_name, result in handlers.items():
+            previous = baseline.get('sizes', {}).get(size, {}).get(handler_name)
+            if not previous:
+                continue
+            metrics = ['requests_per_call', 'read_capacity_per_call', 'write_capacity_per_call', 'payload_bytes']
+            for metric in metrics:
+                if result[metric] > previous[metric] * (1 + tolerance) + 1e-9:
+                    regressions.append(f'{size} rows {handler_name} {metric}: {previous[metric]:.2f} -> {result[metric]:.2f}')
+            if check_latency and result['latency_ms']['p50'] > previous['latency_ms']['p50'] * (1 + tolerance):
+                regressions.append(f"{size} rows {handler_name} p50 latency: "
+                                   f"{previous['latency_ms']['p50']:.1f} -> {result['latency_ms']['p50']:.1f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', nargs='*', type=int, default=[1000, 10000])
+    parser.add_argument('--iterations', type=int)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--check-latency', action='store_true')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    # Cache hit rates depend on the number of calls, so a comparison has to use the baseline's count
+    if args.iterations is None:
+        args.iterations = baseline['iterations'] if baseline else 50
+    elif baseline and baseline['iterations'] != args.iterations:
+        print(f"--iterations must match the baseline's {baseline['iterations']} to compare against it")
+        return 2
+
+    results = {'backend': os.environ.get('AWS_ENDPOINT_URL') or 'moto', 'iterations': args.iterations, 'sizes': {}}
+    for rows in args.sizes:
+        results['sizes'][str(rows)] = run_size(rows, args.iterations)
+        for handler_name, result in results['sizes'][str(rows)].items():
+            print(f"{rows:>8} rows  {handler_name:28} p50 {result['latency_ms']['p50']:8.2f} ms  "
+                  f"p99 {result['latency_ms']['p99']:8.2f} ms  requests {result['requests_per_call']:6.1f}  "
+                  f"RCU {result['read_capacity_per_call']:8.1f}  WCU {result['write_capacity_per_call']:6.1f}  "
+                  f"payload {result['payload_bytes']:8.0f} B")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance, args.check_latency)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,48 @@ provider "aws" {
 }
 
 
+#Fraction of Lambda invocations that emit per-invocation metrics (Lambda/instrumentation.py)
+variable "metrics_sample_rate" {
+  description = "Fraction of invocations sampled for CloudWatch Embedded Metric Format metrics"
+  type        = number
+  default     = 1
+}
+
+#Deploy the API as one Lambda per route ("functions") or as a single router Lambda serving every route ("router")
+variable "deployment_mode" {
+  description = "API deployment mode: functions or router"
+  type        = string
+  default     = "functions"
+
+  validation {
+    condition     = contains(["functions", "router"], var.deployment_mode)
+    error_message = "deployment_mode must be \"functions\" or \"router\"."
+  }
+}
+
+locals {
+  router_mode = var.deployment_mode == "router"
+}
+
+#Lambda layer that provides NumPy for the batch analytics functions and paymentPlan's spending trends (e.g. the AWS SDK for pandas layer)
+variable "numpy_layer_arn" {
+  description = "ARN of a Lambda layer providing NumPy for the Python 3.9 runtime"
+  type        = string
+  default     = ""
+}
+
+#Age in days after which transactions other than open splits move from the Transactions table to the archive (Lambda/archiveStore.py)
+variable "archive_after_days" {
+  description = "Days after which transactions other than open splits are archived; keep it above the 12-month trend window of paymentPlan"
+  type        = number
+  default     = 400
+}
+
+locals {
+  archive_location = "s3://${aws_s3_bucket.archive.bucket}"
+}
+
+
 #Add the Lambda functions in the collection
 provider "archive" {}
 
@@ -115,6 +157,32 @@ data "aws_iam_policy_document" "lambda_vpc_access" {
     resources = ["*"]
   }
 
+  statement {
+    actions = [
+      "s3:GetObject"
+    ]
+    effect    = "Allow"
+    resources = ["${aws_s3_bucket.imports.arn}/*"]
+  }
+
+  statement {
+    actions = [
+      "s3:GetObject",
+      "s3:PutObject",
+      "s3:DeleteObject"
+    ]
+    effect    = "Allow"
+    resources = ["${aws_s3_bucket.archive.arn}/*"]
+  }
+
+  statement {
+    actions = [
+      "s3:ListBucket"
+    ]
+    effect    = "Allow"
+    resources = [aws_s3_bucket.archive.arn]
+  }
+
 
 }
 
@@ -124,10 +192,32 @@ resource "aws_dynamodb_table" "Transactions" {
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "id" # Replace with your primary key attribute name
 
+  #Change stream consumed by indexTransactions to keep the search index current off the write path
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
   attribute {
     name = "id" # Replace with your primary key attribute name
     type = "S"  # 'S' for string, 'N' for number, 'B' for binary
   }
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "date"
+    type = "S"
+  }
+
+  #Index used to query a single user's transactions, optionally within a date range, instead of scanning the table
+  global_secondary_index {
+    name            = "userID-date-index"
+    hash_key        = "userID"
+    range_key       = "date"
+    projection_type = "ALL"
+  }
 }
 
 #Create a DynamoDB table 
@@ -140,6 +230,194 @@ resource "aws_dynamodb_table" "Users" {
     name = "id" # Replace with your primary key attribute name
     type = "S"  # 'S' for string, 'N' for number, 'B' for binary
   }
+
+  attribute {
+    name = "email"
+    type = "S"
+  }
+
+  attribute {
+    name = "phone"
+    type = "S"
+  }
+
+  #Indexes used to find a user by email or phone with one query instead of scanning the table
+  global_secondary_index {
+    name            = "email-index"
+    hash_key        = "email"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "phone-index"
+    hash_key        = "phone"
+    projection_type = "ALL"
+  }
+}
+
+#Create the S3 bucket that holds uploaded transaction files for bulk import
+resource "aws_s3_bucket" "imports" {
+  bucket_prefix = "campuspay-imports-"
+}
+
+#Create the S3 bucket that holds archived transactions: one gzip'd columnar JSON object per user and month
+resource "aws_s3_bucket" "archive" {
+  bucket_prefix = "campuspay-archive-"
+}
+
+#Create the SES template used for bulk payment notifications
+resource "aws_ses_template" "PaymentNotification" {
+  name    = "PaymentNotification"
+  subject = "Payment"
+  text    = "Your transaction with ID {{transactionID}} has been processed."
+}
+
+#Create a DynamoDB table holding per-user, per-category running totals
+resource "aws_dynamodb_table" "CategoryTotals" {
+  name         = "CategoryTotals"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+  range_key    = "category"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "category"
+    type = "S"
+  }
+}
+
+#Create a DynamoDB table holding the nightly precomputed payment plans
+resource "aws_dynamodb_table" "PaymentPlans" {
+  name         = "PaymentPlans"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+  range_key    = "planType"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "planType"
+    type = "S"
+  }
+}
+
+#Create a DynamoDB table holding each user's data version, bumped on every write to invalidate cached analytics
+resource "aws_dynamodb_table" "UserDataVersions" {
+  name         = "UserDataVersions"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+}
+
+#Create a DynamoDB table used as the shared tier of the analytics response cache
+resource "aws_dynamodb_table" "ResponseCache" {
+  name         = "ResponseCache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cacheKey"
+
+  attribute {
+    name = "cacheKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
+
+#Create a DynamoDB table holding the net Qattah balance between each pair of users, stored from both sides
+resource "aws_dynamodb_table" "QattahBalances" {
+  name         = "QattahBalances"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+  range_key    = "counterpartyID"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "counterpartyID"
+    type = "S"
+  }
+}
+
+#Create a DynamoDB table recording the fingerprint of the split written under each Qattah idempotency key
+resource "aws_dynamodb_table" "QattahRequests" {
+  name         = "QattahRequests"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotencyKey"
+
+  attribute {
+    name = "idempotencyKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
+
+#Per-user inverted index over transaction titles: one posting per (userID, term#transactionID)
+resource "aws_dynamodb_table" "TransactionSearchIndex" {
+  name         = "TransactionSearchIndex"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+  range_key    = "termKey"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "termKey"
+    type = "S"
+  }
+}
+
+#Daily totals of archived transactions per (userID, date#category), read back by the analytics instead of the archive objects
+resource "aws_dynamodb_table" "ArchivedTotals" {
+  name         = "ArchivedTotals"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "userID"
+  range_key    = "dayKey"
+
+  attribute {
+    name = "userID"
+    type = "S"
+  }
+
+  attribute {
+    name = "dayKey"
+    type = "S"
+  }
+}
+
+#One guard item per email and phone in use (contact = "email#..." / "phone#..."), written with conditional puts so contacts stay unique
+resource "aws_dynamodb_table" "UserContacts" {
+  name         = "UserContacts"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "contact"
+
+  attribute {
+    name = "contact"
+    type = "S"
+  }
 }
 
 #This is the polic that Allows Lambda functions to work with VPC and DynamoDB. This is done after the last two steps
@@ -184,6 +462,12 @@ resource "aws_lambda_function" "createTransaction" {
   handler          = "createTransaction.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -198,6 +482,15 @@ resource "aws_lambda_function" "paymentPlan" {
   role             = aws_iam_role.finalRoler.arn
   handler          = "paymentPlan.lambda_handler"
   runtime          = "python3.9"
+  # NumPy for the spending trends; without the layer plans are served without trend lines
+  layers           = var.numpy_layer_arn == "" ? [] : [var.numpy_layer_arn]
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+      ARCHIVE_AFTER_DAYS  = var.archive_after_days
+    }
+  }
 
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
@@ -214,6 +507,12 @@ resource "aws_lambda_function" "makeQattah" {
   handler          = "makeQattah.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -229,6 +528,12 @@ resource "aws_lambda_function" "markPaid" {
   handler          = "markPaid.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -244,6 +549,12 @@ resource "aws_lambda_function" "createUser" {
   handler          = "createUser.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -258,6 +569,15 @@ resource "aws_lambda_function" "deleteUser" {
   role             = aws_iam_role.finalRoler.arn
   handler          = "deleteUser.lambda_handler"
   runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 512
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+      ARCHIVE_LOCATION    = local.archive_location
+    }
+  }
 
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
@@ -274,6 +594,12 @@ resource "aws_lambda_function" "updateUser" {
   handler          = "updateUser.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -289,6 +615,12 @@ resource "aws_lambda_function" "getUser" {
   handler          = "getUser.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -304,6 +636,13 @@ resource "aws_lambda_function" "transactionsCategorization" {
   handler          = "transactionsCategorization.lambda_handler"
   runtime          = "python3.9"
 
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+      ARCHIVE_AFTER_DAYS  = var.archive_after_days
+    }
+  }
+
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
     security_group_ids = [aws_security_group.sg_lambda.id]
@@ -318,6 +657,379 @@ resource "aws_lambda_function" "notifyUser" {
   role             = aws_iam_role.finalRoler.arn
   handler          = "notifyUser.lambda_handler"
   runtime          = "python3.9"
+  timeout          = 300
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (rebuildRollups) used to backfill and check the category rollups
+resource "aws_lambda_function" "rebuildRollups" {
+  function_name    = "rebuildRollups"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "rebuildRollups.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (bulkImport) and invoke the archived file (Lambda)
+resource "aws_lambda_function" "bulkImport" {
+  function_name    = "bulkImport"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "bulkImport.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 1024
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (batchPlans) that precomputes every user's payment plans
+resource "aws_lambda_function" "batchPlans" {
+  function_name    = "batchPlans"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "batchPlans.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 3008
+  layers           = var.numpy_layer_arn == "" ? [] : [var.numpy_layer_arn]
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Run batchPlans every night
+resource "aws_cloudwatch_event_rule" "nightly_plans" {
+  name                = "nightly_plans"
+  schedule_expression = "cron(0 2 * * ? *)"
+}
+
+resource "aws_cloudwatch_event_target" "nightly_plans" {
+  rule = aws_cloudwatch_event_rule.nightly_plans.name
+  arn  = aws_lambda_function.batchPlans.arn
+}
+
+resource "aws_lambda_permission" "nightly_plans" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.batchPlans.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.nightly_plans.arn
+}
+
+#Create the lambda function (archiveTransactions) that moves old transactions to the archive bucket
+resource "aws_lambda_function" "archiveTransactions" {
+  function_name    = "archiveTransactions"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "archiveTransactions.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 1024
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+      ARCHIVE_AFTER_DAYS  = var.archive_after_days
+      ARCHIVE_LOCATION    = local.archive_location
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Run archiveTransactions every night, after batchPlans
+resource "aws_cloudwatch_event_rule" "nightly_archive" {
+  name                = "nightly_archive"
+  schedule_expression = "cron(0 4 * * ? *)"
+}
+
+resource "aws_cloudwatch_event_target" "nightly_archive" {
+  rule = aws_cloudwatch_event_rule.nightly_archive.name
+  arn  = aws_lambda_function.archiveTransactions.arn
+}
+
+resource "aws_lambda_permission" "nightly_archive" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.archiveTransactions.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.nightly_archive.arn
+}
+
+#Create the lambda function (getBalances) that returns a user's Qattah balances from the ledger
+resource "aws_lambda_function" "getBalances" {
+  function_name    = "getBalances"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "getBalances.lambda_handler"
+  runtime          = "python3.9"
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (getBalanceWith) that returns the Qattah balance between two users
+resource "aws_lambda_function" "getBalanceWith" {
+  function_name    = "getBalanceWith"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "getBalanceWith.lambda_handler"
+  runtime          = "python3.9"
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (reconcileLedger) used to check the Qattah balance ledger against the raw rows
+resource "aws_lambda_function" "reconcileLedger" {
+  function_name    = "reconcileLedger"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "reconcileLedger.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (settlementPlan) that computes the fewest transfers settling a Qattah group
+resource "aws_lambda_function" "settlementPlan" {
+  function_name    = "settlementPlan"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "settlementPlan.lambda_handler"
+  runtime          = "python3.9"
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (settleGroup) that marks every open split of a Qattah group as paid
+resource "aws_lambda_function" "settleGroup" {
+  function_name    = "settleGroup"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "settleGroup.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 300
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (listTransactions) used to page through a user's transactions
+resource "aws_lambda_function" "listTransactions" {
+  function_name    = "listTransactions"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "listTransactions.lambda_handler"
+  runtime          = "python3.9"
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (recategorizeTransactions) used to re-run the categorization rules over existing rows
+resource "aws_lambda_function" "recategorizeTransactions" {
+  function_name    = "recategorizeTransactions"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "recategorizeTransactions.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 900
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the lambda function (indexTransactions) that consumes the Transactions stream and maintains the search index
+resource "aws_lambda_function" "indexTransactions" {
+  function_name    = "indexTransactions"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "indexTransactions.lambda_handler"
+  runtime          = "python3.9"
+  timeout          = 300
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Feed the Transactions stream to indexTransactions. Records it reports as failed are retried from that point on,
+#and a batch that keeps failing is split so one bad record cannot hold up the rest of the shard
+resource "aws_lambda_event_source_mapping" "indexTransactions" {
+  event_source_arn                   = aws_dynamodb_table.Transactions.stream_arn
+  function_name                      = aws_lambda_function.indexTransactions.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 1
+  maximum_retry_attempts             = 10
+  bisect_batch_on_function_error     = true
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+#Create the lambda function (searchTransactions) used to search a user's transactions by title
+resource "aws_lambda_function" "searchTransactions" {
+  function_name    = "searchTransactions"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "searchTransactions.lambda_handler"
+  runtime          = "python3.9"
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+    }
+  }
+
+  vpc_config {
+    subnet_ids         = [aws_subnet.private_subnet.id]
+    security_group_ids = [aws_security_group.sg_lambda.id]
+  }
+}
+
+#Create the router lambda function that serves every API route from one warm pool (deployment_mode = "router")
+resource "aws_lambda_function" "router" {
+  count            = local.router_mode ? 1 : 0
+  function_name    = "router"
+  filename         = data.archive_file.LambdaFunctions.output_path
+  source_code_hash = data.archive_file.LambdaFunctions.output_base64sha256
+  role             = aws_iam_role.finalRoler.arn
+  handler          = "router.lambda_handler"
+  runtime          = "python3.9"
+  # Sized for the heaviest routes it serves (deleteUser, bulkImport)
+  timeout          = 900
+  memory_size      = 1024
+  layers           = var.numpy_layer_arn == "" ? [] : [var.numpy_layer_arn]
+
+  environment {
+    variables = {
+      METRICS_SAMPLE_RATE = var.metrics_sample_rate
+      ARCHIVE_AFTER_DAYS  = var.archive_after_days
+      ARCHIVE_LOCATION    = local.archive_location
+    }
+  }
 
   vpc_config {
     subnet_ids         = [aws_subnet.private_subnet.id]
@@ -564,6 +1276,162 @@ resource "aws_lambda_permission" "notifyUser" {
 
 #----------------------------------------
 
+#Create the bulkImport Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "bulkImport" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.bulkImport.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the bulkImport Lambda function to the apigateway
+resource "aws_lambda_permission" "bulkImport" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.bulkImport.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the getBalances Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "getBalances" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.getBalances.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the getBalances Lambda function to the apigateway
+resource "aws_lambda_permission" "getBalances" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.getBalances.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the getBalanceWith Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "getBalanceWith" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.getBalanceWith.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the getBalanceWith Lambda function to the apigateway
+resource "aws_lambda_permission" "getBalanceWith" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.getBalanceWith.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the settlementPlan Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "settlementPlan" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.settlementPlan.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the settlementPlan Lambda function to the apigateway
+resource "aws_lambda_permission" "settlementPlan" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.settlementPlan.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the settleGroup Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "settleGroup" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.settleGroup.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the settleGroup Lambda function to the apigateway
+resource "aws_lambda_permission" "settleGroup" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.settleGroup.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the listTransactions Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "listTransactions" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.listTransactions.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the listTransactions Lambda function to the apigateway
+resource "aws_lambda_permission" "listTransactions" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.listTransactions.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the searchTransactions Lambda function call to the apigateway
+resource "aws_apigatewayv2_integration" "searchTransactions" {
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.searchTransactions.invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the searchTransactions Lambda function to the apigateway
+resource "aws_lambda_permission" "searchTransactions" {
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.searchTransactions.function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#Create the router Lambda function call to the apigateway (deployment_mode = "router")
+resource "aws_apigatewayv2_integration" "router" {
+  count  = local.router_mode ? 1 : 0
+  api_id = aws_apigatewayv2_api.lambda.id
+
+  integration_uri    = aws_lambda_function.router[0].invoke_arn
+  integration_type   = "AWS_PROXY"
+  integration_method = "POST"
+}
+
+#Integrate the router Lambda function to the apigateway
+resource "aws_lambda_permission" "router" {
+  count         = local.router_mode ? 1 : 0
+  statement_id  = "AllowExecutionFromAPIGateway"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.router[0].function_name
+  principal     = "apigateway.amazonaws.com"
+
+  source_arn = "${aws_apigatewayv2_api.lambda.execution_arn}/*/*"
+}
+
+#----------------------------------------
+
 #Create the NAT gateway in the VPC
 resource "aws_eip" "nat_gateway_eip" {
   domain = "vpc"
@@ -595,7 +1463,7 @@ resource "aws_route_table_association" "private_route_table_association" {
 resource "aws_apigatewayv2_route" "POST_createTransaction" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "POST transactions/createTransaction"
-  target    = "integrations/${aws_apigatewayv2_integration.createTransaction.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.createTransaction.id}"
 }
 
 #----------------------------------------------
@@ -603,7 +1471,7 @@ resource "aws_apigatewayv2_route" "POST_createTransaction" {
 resource "aws_apigatewayv2_route" "POST_createUser" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "POST users/createUser"
-  target    = "integrations/${aws_apigatewayv2_integration.createUser.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.createUser.id}"
 }
 
 #----------------------------------------------
@@ -613,7 +1481,7 @@ resource "aws_apigatewayv2_route" "POST_createUser" {
 resource "aws_apigatewayv2_route" "GET_paymentPlan" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "GET transactions/paymentPlan"
-  target    = "integrations/${aws_apigatewayv2_integration.paymentPlan.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.paymentPlan.id}"
 }
 
 #----------------------------------------------
@@ -623,7 +1491,7 @@ resource "aws_apigatewayv2_route" "GET_paymentPlan" {
 resource "aws_apigatewayv2_route" "POST_makeQattah" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "POST transactions/makeQattah"
-  target    = "integrations/${aws_apigatewayv2_integration.makeQattah.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.makeQattah.id}"
 }
 
 #----------------------------------------------
@@ -633,7 +1501,7 @@ resource "aws_apigatewayv2_route" "POST_makeQattah" {
 resource "aws_apigatewayv2_route" "POST_markPaid" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "POST transactions/markPaid"
-  target    = "integrations/${aws_apigatewayv2_integration.markPaid.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.markPaid.id}"
 }
 
 #----------------------------------------------
@@ -643,7 +1511,7 @@ resource "aws_apigatewayv2_route" "POST_markPaid" {
 resource "aws_apigatewayv2_route" "DELETE_deleteUser" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "DELETE users/deleteUser"
-  target    = "integrations/${aws_apigatewayv2_integration.deleteUser.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.deleteUser.id}"
 }
 
 #----------------------------------------------
@@ -653,7 +1521,7 @@ resource "aws_apigatewayv2_route" "DELETE_deleteUser" {
 resource "aws_apigatewayv2_route" "GET_getUser" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "GET users/getUser"
-  target    = "integrations/${aws_apigatewayv2_integration.getUser.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.getUser.id}"
 }
 
 #----------------------------------------------
@@ -663,7 +1531,7 @@ resource "aws_apigatewayv2_route" "GET_getUser" {
 resource "aws_apigatewayv2_route" "PUT_updateUser" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "PUT users/updateUser"
-  target    = "integrations/${aws_apigatewayv2_integration.updateUser.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.updateUser.id}"
 }
 
 #----------------------------------------------
@@ -673,7 +1541,7 @@ resource "aws_apigatewayv2_route" "PUT_updateUser" {
 resource "aws_apigatewayv2_route" "GET_transactionsCategorization" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "GET transactions/transactionsCategorization"
-  target    = "integrations/${aws_apigatewayv2_integration.transactionsCategorization.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.transactionsCategorization.id}"
 }
 
 #----------------------------------------------
@@ -682,8 +1550,54 @@ resource "aws_apigatewayv2_route" "GET_transactionsCategorization" {
 resource "aws_apigatewayv2_route" "POST_notifyUser" {
   api_id    = aws_apigatewayv2_api.lambda.id
   route_key = "POST transactions/notifyUser"
-  target    = "integrations/${aws_apigatewayv2_integration.notifyUser.id}"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.notifyUser.id}"
+}
+
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "POST_bulkImport" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "POST transactions/bulkImport"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.bulkImport.id}"
 }
 
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "GET_getBalances" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "GET users/getBalances"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.getBalances.id}"
+}
 
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "GET_getBalanceWith" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "GET users/getBalanceWith"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.getBalanceWith.id}"
+}
 
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "GET_settlementPlan" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "GET transactions/settlementPlan"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.settlementPlan.id}"
+}
+
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "POST_settleGroup" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "POST transactions/settleGroup"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.settleGroup.id}"
+}
+
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "GET_listTransactions" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "GET transactions/listTransactions"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.listTransactions.id}"
+}
+
+#Add the route to the API GateWay
+resource "aws_apigatewayv2_route" "GET_searchTransactions" {
+  api_id    = aws_apigatewayv2_api.lambda.id
+  route_key = "GET transactions/searchTransactions"
+  target    = local.router_mode ? "integrations/${aws_apigatewayv2_integration.router[0].id}" : "integrations/${aws_apigatewayv2_integration.searchTransactions.id}"
+}